@@ -0,0 +1,82 @@
+# Benchmark: per-series recursive XGBoost forecasts vs batched panel forecasts.
+#
+#   python benchmarks/bench_forecast.py --products 10 100 500 --horizon 52
+#
+# For each product count it times, with one already-fitted global model,
+# forecasting every product one series at a time (a predict call per
+# product per step, as the per-product loop did) against advancing all
+# products together over the lag ring buffer (one predict per step), then
+# the end-to-end run_boom_forecast in 'global' and 'direct' modes.
+
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+import xgboost as xgb
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from chainforecast.batch import LAGS, run_boom_forecast  # noqa: E402
+from chainforecast.forecasting import XGB_PARAMS, forecast_panel  # noqa: E402
+
+
+def synthetic_sales(products, weeks=60, per_week=6, seed=0):
+    rng = np.random.default_rng(seed)
+    n = products * weeks * per_week
+    codes = np.array([f"{85000 + i}" for i in range(products)])
+    start = pd.Timestamp('2010-12-06')
+    return pd.DataFrame({
+        'stockcode': pd.Categorical(codes[rng.integers(0, products, n)]),
+        'invoicedate': start + pd.to_timedelta(rng.integers(0, weeks * 7 * 86400, n), unit='s'),
+        'sales': rng.gamma(2, 10, n).astype('float32'),
+    })
+
+
+def timed(fn, *args, **kwargs):
+    t = time.perf_counter()
+    out = fn(*args, **kwargs)
+    return out, time.perf_counter() - t
+
+
+def run(products, horizon):
+    print(f"\n== {products:,} products, {horizon} weeks ==")
+    rng = np.random.default_rng(products)
+    histories = [rng.gamma(2, 50, rng.integers(20, 60)) for _ in range(products)]
+    extra = np.arange(products, dtype=float)[:, None]
+    X = rng.gamma(2, 50, (2000, len(LAGS) + 1))
+    model = xgb.XGBRegressor(**XGB_PARAMS).fit(X, X[:, 0])
+
+    def one_by_one():
+        return np.vstack([forecast_panel(model, [h], LAGS, horizon, extra[i:i + 1])
+                          for i, h in enumerate(histories)])
+
+    serial, t_serial = timed(one_by_one)
+    batched, t_batched = timed(forecast_panel, model, histories, LAGS, horizon, extra)
+    assert np.allclose(serial, batched, rtol=1e-5)
+    print(f"forecast one series at a time:  {t_serial:8.3f}s "
+          f"({products * horizon:,} predict calls)")
+    print(f"forecast all series together:   {t_batched:8.3f}s ({horizon} predict calls)")
+
+    df = synthetic_sales(products)
+    sel = df['stockcode'].cat.categories.tolist()
+    for mode in ('global', 'direct'):
+        out, t_mode = timed(run_boom_forecast, df, sel, horizon=horizon, mode=mode)
+        ok = (out['status'] == 'ok').sum()
+        print(f"run_boom_forecast mode={mode:7s} {t_mode:8.3f}s ({ok} ok)")
+
+
+def main():
+    ap = argparse.ArgumentParser(
+        description='Benchmark per-series vs batched XGBoost forecasting.')
+    ap.add_argument('--products', type=int, nargs='+', default=[10, 100, 500])
+    ap.add_argument('--horizon', type=int, default=52)
+    args = ap.parse_args()
+    for n in args.products:
+        run(n, args.horizon)
+
+
+if __name__ == '__main__':
+    main()
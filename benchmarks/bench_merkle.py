@@ -0,0 +1,91 @@
+# Benchmark: legacy merkle_root_from_ids vs the row-content MerkleTree.
+#
+#   python benchmarks/bench_merkle.py --rows 1000000 10000000 --jobs 8
+#
+# For each size it times the legacy root over row ids, the new leaf hashing
+# + tree build (serial and over a process pool), a single-row append and an
+# inclusion proof, and checks both builders agree on the same leaves.
+# Leaves are hashed per generated block, as ingest hashes per chunk.
+
+import argparse
+import hashlib
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from chainforecast.integrity import (  # noqa: E402
+    MerkleTree, merkle_root_from_ids, row_leaf_hashes)
+
+from chainforecast.cleaning import clean_record  # noqa: E402
+from chainforecast.schema import compact_frame  # noqa: E402
+
+from synthetic import iter_raw  # noqa: E402
+
+
+def timed(fn, *args, **kwargs):
+    t = time.perf_counter()
+    out = fn(*args, **kwargs)
+    return out, time.perf_counter() - t
+
+
+def leaf_blocks(n, executor=None):
+    """(leaves, seconds hashing): leaves of n synthetic rows, hashed block
+    by block as ingest does, so 10M rows never exist as one frame."""
+    parts, seconds = [], 0.0
+    for block in iter_raw(n):
+        frame = compact_frame(clean_record(block))
+        leaves, t = timed(row_leaf_hashes, frame, executor)
+        parts.append(leaves)
+        seconds += t
+    return b''.join(parts), seconds
+
+
+def run(n, jobs):
+    print(f"\n== {n:,} rows ==")
+    _, t_legacy = timed(merkle_root_from_ids, range(n))
+    print(f"legacy merkle_root_from_ids (row ids):  {t_legacy:8.2f}s")
+
+    id_leaves = b''.join([hashlib.sha256(str(i).encode()).digest() for i in range(n)])
+    assert MerkleTree(id_leaves).root() == merkle_root_from_ids(range(n))
+    del id_leaves
+
+    leaves, t_leaves = leaf_blocks(n)
+    tree, t_tree = timed(MerkleTree.build, leaves)
+    print(f"row-content leaves + tree, 1 process:   {t_leaves + t_tree:8.2f}s "
+          f"(leaves {t_leaves:.2f}s, tree {t_tree:.2f}s)")
+    if jobs > 1:
+        with ProcessPoolExecutor(jobs) as ex:
+            p_leaves, t_pl = leaf_blocks(n, ex)
+            p_tree, t_pt = timed(MerkleTree.build, p_leaves, ex)
+        assert p_tree.root() == tree.root()
+        del p_leaves, p_tree
+        print(f"row-content leaves + tree, {jobs} processes: {t_pl + t_pt:8.2f}s "
+              f"(leaves {t_pl:.2f}s, tree {t_pt:.2f}s)")
+    del leaves
+
+    leaf = hashlib.sha256(b'one more row').digest()
+    # the first append reallocates every level; later ones are O(log n)
+    _, t_first = timed(tree.extend, leaf)
+    t_next = sorted(timed(tree.extend, leaf)[1] for _ in range(9))[4]
+    proof, t_proof = timed(tree.proof, n // 2)
+    assert MerkleTree.verify_proof(tree.leaf(n // 2).hex(), proof, tree.root())
+    print(f"append 1 row (first / median of next 9): {t_first * 1e3:7.3f}ms / "
+          f"{t_next * 1e3:.3f}ms")
+    print(f"inclusion proof ({len(proof)} siblings):           {t_proof * 1e3:8.3f}ms")
+
+
+def main():
+    ap = argparse.ArgumentParser(
+        description='Benchmark legacy vs row-content Merkle roots.')
+    ap.add_argument('--rows', type=int, nargs='+', default=[1_000_000, 10_000_000])
+    ap.add_argument('--jobs', type=int, default=os.cpu_count() or 1)
+    args = ap.parse_args()
+    for n in args.rows:
+        run(n, args.jobs)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,233 @@
+# Benchmark: every pipeline stage on seeded synthetic retail data.
+#
+#   python benchmarks/bench_pipeline.py --rows 10000 1000000 --save baseline.json
+#   python benchmarks/bench_pipeline.py --rows 10000 1000000 --compare baseline.json
+#
+# For each size it generates the same transactions (benchmarks/synthetic.py,
+# fixed seed), then times each stage on its own: CSV parse, clean_record,
+# the streaming ingest, prepare_weekly_series, the weekly cube and daily
+# sales, rfm_analysis and KMeans, the legacy merkle_root_from_ids and the
+# row-content Merkle tree, train_xgb/forecast_xgb, the global boom
+# forecast and the KPI pass. Wall time is the best of --repeat runs; peak
+# memory is the tracemalloc peak (Python and numpy allocations) of one
+# extra run. --save writes the results as JSON; --compare prints them
+# next to a saved baseline and exits 1 when a stage got slower or bigger
+# than --threshold, ignoring differences below --min-seconds/--min-mb.
+# Baselines are only comparable on the same machine.
+
+import argparse
+import gc
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from chainforecast.analytics import rfm_analysis, segmentation_kmeans  # noqa: E402
+from chainforecast.batch import run_boom_forecast  # noqa: E402
+from chainforecast.cleaning import clean_record  # noqa: E402
+from chainforecast.cube import WeeklyCube  # noqa: E402
+from chainforecast.daily import DailySales  # noqa: E402
+from chainforecast.forecasting import (  # noqa: E402
+    forecast_xgb, prepare_weekly_series, train_xgb)
+from chainforecast.ingest import DatasetCache, ingest, iter_csv_chunks  # noqa: E402
+from chainforecast.integrity import (  # noqa: E402
+    MerkleTree, merkle_root_from_ids, row_leaf_hashes)
+from chainforecast.kpis import compute_kpis  # noqa: E402
+from chainforecast.schema import compact_frame  # noqa: E402
+
+from synthetic import raw_frame, write_csv  # noqa: E402
+
+BOOM_PRODUCTS = 100
+
+
+def parse(data):
+    with open(data['csv'], 'rb') as f:
+        return sum(len(chunk) for chunk in iter_csv_chunks(f))
+
+
+def streaming_ingest(data):
+    root = tempfile.mkdtemp(dir=data['tmp'])
+    try:
+        return ingest('retail.csv', data['csv'], DatasetCache(root), jobs=1)
+    finally:
+        shutil.rmtree(root)
+
+
+def merkle_tree(data):
+    return MerkleTree.build(row_leaf_hashes(data['df'])).root()
+
+
+def xgb_top_product(data):
+    model, feat_cols = train_xgb(data['weekly_top'])
+    return forecast_xgb(model, data['weekly_top'], feat_cols, steps=4)
+
+
+def daily_top(data):
+    # the first query of a window builds the prefix sums
+    data['daily']._prefix.clear()
+    return data['daily'].top(10, days=60)
+
+
+def boom_forecast(data):
+    cube = data['cube']
+    return run_boom_forecast(None, cube.keys()[:BOOM_PRODUCTS], cube=cube, mode='global')
+
+
+STAGES = {
+    'parse_csv': parse,
+    'clean_record': lambda d: clean_record(d['raw']),
+    'ingest': streaming_ingest,
+    'prepare_weekly_series': lambda d: prepare_weekly_series(d['df']),
+    'cube_build': lambda d: WeeklyCube.from_frame(d['df']),
+    'daily_build': lambda d: DailySales.from_frame(d['df']),
+    'daily_top_60d': daily_top,
+    'rfm_analysis': lambda d: rfm_analysis(d['df']),
+    'segmentation_kmeans': lambda d: segmentation_kmeans(d['rfm'].copy()),
+    'merkle_root_from_ids': lambda d: merkle_root_from_ids(range(len(d['df']))),
+    'merkle_tree': merkle_tree,
+    'xgb_train_forecast': xgb_top_product,
+    'boom_forecast_global': boom_forecast,
+    'kpis': lambda d: compute_kpis(d['df']),
+}
+
+
+def prepare(n, seed, tmp):
+    """Generate the inputs every stage reads, outside the timed region."""
+    csv = write_csv(os.path.join(tmp, f'retail_{n}.csv'), n, seed)
+    raw = raw_frame(n, seed)
+    df = compact_frame(clean_record(raw))
+    top = df.groupby('stockcode', observed=True)['sales'].sum().idxmax()
+    return {'tmp': tmp, 'csv': csv, 'raw': raw, 'df': df,
+            'rfm': rfm_analysis(df), 'cube': WeeklyCube.from_frame(df),
+            'daily': DailySales.from_frame(df),
+            'weekly_top': prepare_weekly_series(df[df['stockcode'] == top])}
+
+
+def measure(fn, data, repeat, memory):
+    """(best wall seconds over repeat runs, tracemalloc peak MB or None)."""
+    best = float('inf')
+    for _ in range(repeat):
+        gc.collect()
+        t = time.perf_counter()
+        fn(data)
+        best = min(best, time.perf_counter() - t)
+    peak = None
+    if memory:
+        gc.collect()
+        tracemalloc.start()
+        try:
+            fn(data)
+            peak = tracemalloc.get_traced_memory()[1] / 2 ** 20
+        finally:
+            tracemalloc.stop()
+    return best, peak
+
+
+def run(n, args, tmp):
+    print(f"\n== {n:,} rows ==")
+    data = prepare(n, args.seed, tmp)
+    results = {}
+    for name, fn in STAGES.items():
+        if args.stages and name not in args.stages:
+            continue
+        seconds, peak = measure(fn, data, args.repeat, not args.no_memory)
+        results[name] = {'seconds': round(seconds, 6),
+                         'peak_mb': None if peak is None else round(peak, 3)}
+        mem = '' if peak is None else f"  peak {peak:9.1f} MB"
+        print(f"{name:24s} {seconds:9.3f}s{mem}")
+    os.remove(data['csv'])
+    return results
+
+
+def compare(results, baseline, threshold, min_seconds, min_mb):
+    """Print current vs baseline per size/stage; return the regressions."""
+    regressions = []
+    print(f"\n{'rows':>10s} {'stage':24s} {'base s':>9s} {'now s':>9s} {'ratio':>6s}"
+          f" {'base MB':>9s} {'now MB':>9s}")
+    for size, stages in results.items():
+        for name, now in stages.items():
+            base = baseline.get(size, {}).get(name)
+            if base is None:
+                print(f"{size:>10s} {name:24s} {'-':>9s} {now['seconds']:9.3f}  (new)")
+                continue
+            ratio = now['seconds'] / base['seconds'] if base['seconds'] else float('inf')
+            flags = []
+            if (now['seconds'] > base['seconds'] * (1 + threshold)
+                    and now['seconds'] - base['seconds'] >= min_seconds):
+                flags.append('time')
+            if (now['peak_mb'] is not None and base.get('peak_mb') is not None
+                    and now['peak_mb'] > base['peak_mb'] * (1 + threshold)
+                    and now['peak_mb'] - base['peak_mb'] >= min_mb):
+                flags.append('memory')
+            fmt = lambda v: '-' if v is None else f"{v:.1f}"  # noqa: E731
+            print(f"{size:>10s} {name:24s} {base['seconds']:9.3f} {now['seconds']:9.3f}"
+                  f" {ratio:6.2f} {fmt(base.get('peak_mb')):>9s} {fmt(now['peak_mb']):>9s}"
+                  + (f"  REGRESSION ({', '.join(flags)})" if flags else ''))
+            if flags:
+                regressions.append((size, name, flags))
+    return regressions
+
+
+def main():
+    ap = argparse.ArgumentParser(
+        description='Benchmark each pipeline stage on synthetic retail data.')
+    ap.add_argument('--rows', type=int, nargs='+', default=[10_000, 1_000_000],
+                    help='dataset sizes, e.g. 10000 1000000 10000000')
+    ap.add_argument('--seed', type=int, default=0)
+    ap.add_argument('--repeat', type=int, default=3)
+    ap.add_argument('--stages', nargs='+', choices=list(STAGES),
+                    help='only run these stages')
+    ap.add_argument('--no-memory', action='store_true',
+                    help='skip the tracemalloc run of each stage')
+    ap.add_argument('--save', help='write the results to this JSON file')
+    ap.add_argument('--compare', help='baseline JSON written by --save')
+    ap.add_argument('--threshold', type=float, default=0.2,
+                    help='relative slowdown/growth reported as a regression')
+    ap.add_argument('--min-seconds', type=float, default=0.05,
+                    help='ignore slowdowns smaller than this')
+    ap.add_argument('--min-mb', type=float, default=1.0,
+                    help='ignore memory growth smaller than this')
+    ap.add_argument('--tmp', default=None, help='directory for the generated CSVs')
+    args = ap.parse_args()
+
+    results = {}
+    tmp = tempfile.mkdtemp(dir=args.tmp)
+    try:
+        for n in args.rows:
+            results[str(n)] = run(n, args, tmp)
+    finally:
+        shutil.rmtree(tmp)
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump({'meta': {'seed': args.seed, 'repeat': args.repeat,
+                                'python': platform.python_version(),
+                                'pandas': pd.__version__, 'numpy': np.__version__,
+                                'machine': platform.machine(), 'cpus': os.cpu_count(),
+                                'created': time.strftime('%Y-%m-%dT%H:%M:%S')},
+                       'results': results}, f, indent=2)
+        print(f"\nsaved {args.save}")
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if baseline['meta'].get('seed') != args.seed:
+            print(f"warning: baseline seed {baseline['meta'].get('seed')} != {args.seed}")
+        regressions = compare(results, baseline['results'], args.threshold,
+                              args.min_seconds, args.min_mb)
+        if regressions:
+            print(f"\n{len(regressions)} regression(s)")
+            sys.exit(1)
+        print("\nno regressions")
+
+
+if __name__ == '__main__':
+    main()
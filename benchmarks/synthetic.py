@@ -0,0 +1,137 @@
+# Seeded synthetic online-retail transactions for the benchmarks.
+#
+#   python benchmarks/synthetic.py --rows 1000000 --out retail_1m.csv
+#
+# Rows follow the raw cleaned_online_retail export (InvoiceNo, StockCode,
+# Description, Quantity, InvoiceDate, Price, Customer ID, Country) with the
+# quirks clean_record has to handle: "C" credit-note invoices with negative
+# quantities, float customer ids (13085.0) with missing values, and
+# multi-line invoices. Product and customer popularity are skewed, sales
+# grow towards the end of the year, and each customer buys from one
+# country. Data is generated in fixed-size blocks, each from its own
+# spawned seed, so a given (rows, seed) is identical however it is
+# consumed and 10M rows can be streamed to disk in bounded memory.
+
+import argparse
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from chainforecast.cleaning import clean_record  # noqa: E402
+from chainforecast.schema import compact_frame  # noqa: E402
+
+BLOCK_ROWS = 250_000
+START = pd.Timestamp('2010-12-01')
+DAYS = 373
+COUNTRIES = {'United Kingdom': 0.89, 'Germany': 0.02, 'France': 0.02, 'EIRE': 0.02,
+             'Spain': 0.01, 'Netherlands': 0.01, 'Belgium': 0.01, 'Switzerland': 0.01,
+             'Portugal': 0.005, 'Australia': 0.005}
+WORDS = np.array(['HEART', 'LANTERN', 'HOLDER', 'VINTAGE', 'BAG', 'CANDLE', 'MUG',
+                  'CAKE', 'STAND', 'JUMBO', 'RED', 'WHITE', 'GLASS', 'SET', 'BOX'])
+
+
+def catalog(products, customers, seed=0):
+    """Stockcodes, descriptions, list prices and each customer's country."""
+    rng = np.random.default_rng([seed, 0])
+    codes = np.array([f"{85000 + i}" if i % 9 else f"{85000 + i}A"
+                      for i in range(products)])
+    names = rng.choice(WORDS, (products, 3))
+    descriptions = np.array([' '.join(w) for w in names])
+    prices = np.round(rng.gamma(2.0, 1.6, products) + 0.29, 2)
+    p = np.array(list(COUNTRIES.values()))
+    countries = rng.choice(list(COUNTRIES), customers, p=p / p.sum())
+    return codes, descriptions, prices, countries
+
+
+def _block(rng, rows, first_invoice, codes, descriptions, prices, countries,
+           credit_rate, missing_customers, lines_per_invoice):
+    # invoices of geometric length until the block has `rows` lines
+    sizes = rng.geometric(1 / lines_per_invoice, rows // lines_per_invoice * 2 + 16)
+    ends = np.cumsum(sizes)
+    n_inv = int(np.searchsorted(ends, rows)) + 1
+    sizes = sizes[:n_inv]
+    sizes[-1] -= ends[n_inv - 1] - rows
+
+    # per invoice: skewed customer, date weighted towards the year end, credit flag
+    customer = (len(countries) * rng.random(n_inv) ** 2).astype(np.int64)
+    day = (DAYS * rng.random(n_inv) ** 0.8).astype(np.int64)
+    minute = rng.integers(7 * 60, 20 * 60, n_inv)
+    when = START + pd.to_timedelta(day * 1440 + minute, unit='m')
+    credit = rng.random(n_inv) < credit_rate
+    number = (first_invoice + np.arange(n_inv)).astype(str)
+    invoice = np.where(credit, np.char.add('C', number), number)
+    customer_id = np.where(rng.random(n_inv) < missing_customers, np.nan,
+                           12346.0 + customer)
+
+    line = np.repeat(np.arange(n_inv), sizes)
+    product = (len(codes) * rng.random(rows) ** 3).astype(np.int64)
+    quantity = rng.geometric(0.15, rows)
+    quantity = np.where(credit[line], -quantity, quantity)
+    price = np.round(prices[product] * rng.choice([1.0, 1.0, 1.0, 0.85, 1.25], rows), 2)
+    return pd.DataFrame({
+        'InvoiceNo': invoice[line],
+        'StockCode': codes[product],
+        'Description': descriptions[product],
+        'Quantity': quantity,
+        'InvoiceDate': when[line],
+        'Price': price,
+        'Customer ID': customer_id[line],
+        'Country': countries[customer][line],
+    }), n_inv
+
+
+def iter_raw(rows, seed=0, products=4000, customers=6000, credit_rate=0.02,
+             missing_customers=0.2, lines_per_invoice=20, block_rows=BLOCK_ROWS):
+    """Yield the raw export in blocks of at most block_rows rows."""
+    codes, descriptions, prices, countries = catalog(products, customers, seed)
+    n_blocks = -(-rows // block_rows)
+    seeds = np.random.SeedSequence(seed).spawn(n_blocks)
+    invoice = 536365
+    for k, child in enumerate(seeds):
+        n = min(block_rows, rows - k * block_rows)
+        block, n_inv = _block(np.random.default_rng(child), n, invoice, codes,
+                              descriptions, prices, countries, credit_rate,
+                              missing_customers, lines_per_invoice)
+        invoice += n_inv
+        block.index = pd.RangeIndex(k * block_rows, k * block_rows + n)
+        yield block
+
+
+def raw_frame(rows, seed=0, **kwargs):
+    """The whole raw export as one frame."""
+    return pd.concat(iter_raw(rows, seed, **kwargs))
+
+
+def cleaned_frame(rows, seed=0, **kwargs):
+    """The frame the app works on: clean_record + compact dtypes."""
+    return compact_frame(clean_record(raw_frame(rows, seed, **kwargs)))
+
+
+def write_csv(path, rows, seed=0, **kwargs):
+    """Stream the raw export to a CSV file; returns the path."""
+    with open(path, 'w', newline='') as f:
+        for i, block in enumerate(iter_raw(rows, seed, **kwargs)):
+            block.to_csv(f, index=False, header=i == 0,
+                         date_format='%Y-%m-%d %H:%M:%S')
+    return path
+
+
+def main():
+    ap = argparse.ArgumentParser(description='Write a synthetic online-retail CSV.')
+    ap.add_argument('--rows', type=int, default=1_000_000)
+    ap.add_argument('--seed', type=int, default=0)
+    ap.add_argument('--products', type=int, default=4000)
+    ap.add_argument('--customers', type=int, default=6000)
+    ap.add_argument('--out', default='synthetic_retail.csv')
+    args = ap.parse_args()
+    write_csv(args.out, args.rows, args.seed, products=args.products,
+              customers=args.customers)
+    print(f"wrote {args.rows:,} rows to {args.out}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1 @@
+"""ChainForecast core: ingestion, cleaning and analytics helpers used by app.py."""
@@ -0,0 +1,84 @@
+# RFM, segmentation, top products and retention on the cleaned frame.
+# Group keys may be categoricals (see schema.compact_frame), so every groupby
+# passes observed=True to skip empty categories.
+
+import pandas as pd
+
+from .metrics import instrument
+
+
+@instrument('customer_totals')
+def customer_totals(df):
+    """Per-customer last purchase date, transaction count and sales sum."""
+    return df.groupby('customerid', observed=True).agg(
+        last_date=('invoicedate', 'max'),
+        frequency=('invoicedate', 'size'),
+        monetary=('sales', 'sum'))
+
+
+def _quartile_score(s, labels):
+    try:
+        return pd.qcut(s, 4, labels=labels).astype(int)
+    except ValueError:
+        # heavily tied values give duplicate bin edges; rank them apart
+        return pd.qcut(s.rank(method='first'), 4, labels=labels).astype(int)
+
+
+def rfm_scores(rfm):
+    """Add quartile scores and rfm_score to a recency/frequency/monetary table."""
+    rfm['recency_score'] = _quartile_score(rfm['recency'], [4, 3, 2, 1])
+    rfm['frequency_score'] = pd.qcut(rfm['frequency'].rank(
+        method='first'), 4, labels=[1, 2, 3, 4]).astype(int)
+    rfm['monetary_score'] = _quartile_score(rfm['monetary'], [1, 2, 3, 4])
+    rfm['rfm_score'] = rfm['recency_score']*100 + \
+        rfm['frequency_score']*10 + rfm['monetary_score']
+    return rfm
+
+
+@instrument('rfm_analysis')
+def rfm_analysis(df):
+    totals = customer_totals(df)
+    snapshot = totals['last_date'].max() + pd.Timedelta(days=1)
+    rfm = pd.DataFrame({'recency': (snapshot - totals['last_date']).dt.days,
+                        'frequency': totals['frequency'],
+                        'monetary': totals['monetary']})
+    return rfm_scores(rfm).reset_index()
+
+
+@instrument('kmeans')
+def segmentation_kmeans(rfm_df, n_clusters=4):
+    from sklearn.cluster import KMeans
+    from sklearn.preprocessing import StandardScaler
+
+    X = rfm_df[['recency', 'frequency', 'monetary']]
+    scaler = StandardScaler()
+    Xs = scaler.fit_transform(X)
+    km = KMeans(n_clusters=n_clusters, n_init=10, random_state=42).fit(Xs)
+    rfm_df['segment'] = km.labels_
+    rfm_df['segment_label'] = rfm_df['segment'].map(
+        segment_labels(km.labels_, rfm_df['monetary']))
+    return rfm_df
+
+
+def segment_labels(labels, monetary):
+    """Cluster id -> 'Segment_<n>', numbered by mean monetary, highest first."""
+    order = pd.Series(monetary).groupby(labels).mean(
+    ).sort_values(ascending=False).index
+    return {seg: f"Segment_{i+1}" for i, seg in enumerate(order)}
+
+
+@instrument('top_products_scan')
+def top_products_last_n_days(df, days=60):
+    # one-off scan of the frame; the app and pipeline query the prefix sums
+    # in daily.DailySales, which serve any window/country without rescanning
+    dates = pd.to_datetime(df['invoicedate'])
+    recent = df[dates >= dates.max() - pd.Timedelta(days=days)]
+    key = 'stockcode' if 'stockcode' in recent.columns else 'description'
+    return recent.groupby(key, observed=True)['sales'].sum().reset_index().sort_values('sales', ascending=False)
+
+
+def retention_rate(df):
+    # a customer repeats if any purchase is later than their first one,
+    # i.e. their last purchase is; see kpis.compute_kpis for the full set
+    dates = df.groupby('customerid', observed=True)['invoicedate'].agg(['min', 'max'])
+    return (dates['max'] > dates['min']).mean()
@@ -0,0 +1,260 @@
+# Batch product forecasting for the Product Boom tab.
+#
+# Instead of filtering the full frame once per product, every product's
+# weekly series comes out of a single groupby, lag features for all series
+# are built in one vectorized step, and either one global XGBoost model
+# (with the product as a feature), one global model per horizon step, or
+# one model per product on a process pool is trained. Global forecasts
+# advance all products together over a lag ring buffer, so latency grows
+# with the horizon, not with the product count. Each product gets a
+# status, a failure reason and its share of the wall time.
+
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from .forecasting import (
+    XGB_PARAMS, LagRing, forecast_panel, forecast_recursive, forecast_xgb, train_xgb,
+    xgb_regressor)
+from .metrics import instrument
+
+LAGS = [1, 2, 3, 4, 6, 8, 12]
+MIN_ROWS = 30
+MIN_WEEKS = 8
+
+
+def product_key(df):
+    return 'stockcode' if 'stockcode' in df.columns else 'description'
+
+
+def _str_keys(s):
+    # stringify only the categories of a categorical, not every row
+    if isinstance(s.dtype, pd.CategoricalDtype):
+        s = s.cat.remove_unused_categories()
+        return s.cat.rename_categories(s.cat.categories.astype(str))
+    return s.astype(str)
+
+
+def weekly_panel(df, products=None, key=None, index=None, cube=None):
+    """Weekly sales of many products from one groupby.
+
+    Returns (panel, rows): panel is long-form with columns product, ds, y,
+    one row per week from each product's first to last active week (gaps
+    filled with 0, like prepare_weekly_series), and rows is the number of
+    transactions per product. With a WeeklyCube the panel is sliced out of
+    the cube and df is not touched; with a ProductIndex the products' rows
+    are sliced out directly instead of scanning the key column.
+    """
+    if cube is not None and key in (None, cube.key):
+        return cube.panel(products)
+    key = key or product_key(df)
+    d = df[[key, 'invoicedate', 'sales']]
+    if products is not None and index is not None and key == 'stockcode':
+        d = d.iloc[index.rows_for(products)]
+    elif products is not None:
+        d = d[d[key].isin([str(p) for p in products])]
+    grouped = d.groupby([_str_keys(d[key]).rename('product'),
+                         pd.Grouper(key='invoicedate', freq='W-MON')],
+                        observed=True)['sales']
+    agg = grouped.agg(['sum', 'size'])
+    rows = agg['size'].groupby(level='product').sum()
+    wide = agg['sum'].unstack('product')
+    if wide.empty:
+        return pd.DataFrame(columns=['product', 'ds', 'y']), rows
+    wide = wide.reindex(pd.date_range(wide.index.min(), wide.index.max(),
+                                      freq='W-MON'))
+    active = wide.notna().to_numpy()
+    # keep each product's span between its first and last active week
+    inside = (np.maximum.accumulate(active, axis=0)
+              & np.maximum.accumulate(active[::-1], axis=0)[::-1])
+    values = wide.fillna(0.0).to_numpy()
+    weeks, cols = np.nonzero(inside.T)
+    panel = pd.DataFrame({
+        'product': wide.columns.to_numpy()[weeks],
+        'ds': wide.index.to_numpy()[cols],
+        'y': values[cols, weeks],
+    })
+    return panel, rows
+
+
+def panel_lag_features(panel, lags=LAGS):
+    """Add lag_k columns for every product at once (grouped shift)."""
+    panel = panel.copy()
+    by_product = panel.groupby('product', sort=False)['y']
+    for lag in lags:
+        panel[f'lag_{lag}'] = by_product.shift(lag)
+    return panel
+
+
+def _eligibility(panel, rows, products):
+    weeks = panel.groupby('product', sort=False).size()
+    status = {}
+    for p in products:
+        p = str(p)
+        if rows.get(p, 0) < MIN_ROWS:
+            status[p] = f"only {int(rows.get(p, 0))} transactions (< {MIN_ROWS})"
+        elif weeks.get(p, 0) < MIN_WEEKS:
+            status[p] = f"only {int(weeks.get(p, 0))} weekly points (< {MIN_WEEKS})"
+        else:
+            status[p] = None
+    return status
+
+
+def _growth_row(product, y, preds, horizon):
+    past = float(y[-horizon:].sum()) if len(y) >= horizon else float(y.sum())
+    future = float(np.sum(preds))
+    return {'product': product, 'past_sum': past, 'future_sum': future,
+            'growth_pct': (future - past) / (past + 1e-9) * 100,
+            'forecast': [float(p) for p in preds]}
+
+
+def _fit_one(product, weekly, horizon):
+    t = time.perf_counter()
+    try:
+        model, feats = train_xgb(weekly)
+        preds = forecast_xgb(model, weekly, feats, steps=horizon)
+    except Exception as e:
+        return product, None, f"{type(e).__name__}: {e}", time.perf_counter() - t
+    return product, preds, None, time.perf_counter() - t
+
+
+def _run_per_product(panel, ok, horizon, jobs, progress):
+    series = {p: g[['ds', 'y']].reset_index(drop=True)
+              for p, g in panel[panel['product'].isin(ok)].groupby('product', sort=False)}
+    args = [(p, series[p], horizon) for p in ok]
+    if jobs > 1 and len(args) > 1:
+        with ProcessPoolExecutor(jobs) as ex:
+            results = list(_reporting(ex.map(_fit_one, *zip(*args)), len(args), progress))
+    else:
+        results = list(_reporting((_fit_one(*a) for a in args), len(args), progress))
+    out = []
+    for product, preds, error, seconds in results:
+        y = series[product]['y'].to_numpy()
+        row = _growth_row(product, y, preds, horizon) if error is None else {'product': product}
+        out.append(dict(row, status='ok' if error is None else 'failed',
+                        reason=error, seconds=seconds))
+    return out
+
+
+def _reporting(results, total, progress):
+    for done, result in enumerate(results, 1):
+        yield result
+        progress(done, total, result[0])
+
+
+def _global_features(panel, ok):
+    feats = panel_lag_features(panel[panel['product'].isin(ok)])
+    codes = {p: i for i, p in enumerate(ok)}
+    feats['product_id'] = feats['product'].map(codes)
+    feat_cols = [f'lag_{lag}' for lag in LAGS] + ['product_id']
+    by_product = feats.groupby('product', sort=False)['y']
+    order = list(feats['product'].drop_duplicates())
+    histories = [g.to_numpy() for _, g in by_product]
+    extra = np.array([[codes[p]] for p in order], dtype=float)
+    return feats, feat_cols, by_product, order, histories, extra
+
+
+def _no_history(ok):
+    reason = f"no product has more than {max(LAGS)} weeks of history"
+    return [{'product': p, 'status': 'failed', 'reason': reason, 'seconds': 0.0}
+            for p in ok]
+
+
+def _panel_rows(order, histories, preds, horizon, t):
+    seconds = (time.perf_counter() - t) / len(order)
+    return [dict(_growth_row(p, h, preds[i], horizon), status='ok', reason=None,
+                 seconds=seconds)
+            for i, (p, h) in enumerate(zip(order, histories))]
+
+
+def _run_global(panel, ok, horizon, progress):
+    t = time.perf_counter()
+    progress(0, 1, 'global model')
+    feats, feat_cols, _, order, histories, extra = _global_features(panel, ok)
+    train = feats.dropna(subset=feat_cols)
+    if train.empty:
+        return _no_history(ok)
+    model = xgb_regressor(**XGB_PARAMS)
+    model.fit(train[feat_cols], train['y'])
+    preds = forecast_panel(model, histories, LAGS, horizon, extra=extra)
+    progress(1, 1, 'global model')
+    return _panel_rows(order, histories, preds, horizon, t)
+
+
+def _run_direct(panel, ok, horizon, progress):
+    # one global model per horizon step h, trained to predict y[t + h] from
+    # the lags at t; every step is a single predict over the same lag matrix
+    t = time.perf_counter()
+    feats, feat_cols, by_product, order, histories, extra = _global_features(panel, ok)
+    train = feats.dropna(subset=feat_cols)
+    if train.empty:
+        return _no_history(ok)
+    ring = LagRing(histories, LAGS)
+    X0 = np.hstack([ring.features(), extra])
+    preds = np.empty((len(order), horizon))
+    models = []
+    for h in range(horizon):
+        target = by_product.shift(-h).loc[train.index]
+        rows = target.notna().to_numpy()
+        if not rows.any():
+            break
+        model = xgb_regressor(**XGB_PARAMS)
+        model.fit(train.loc[rows, feat_cols], target[rows])
+        preds[:, h] = model.predict(X0)
+        models.append(model)
+        progress(h + 1, horizon, f'{h + 1}-week model')
+    if len(models) < horizon:
+        # too little history for the longer direct models: carry on
+        # recursively from the direct forecasts with the one-step model
+        for values in preds[:, :len(models)].T:
+            ring.push(values)
+        preds[:, len(models):] = forecast_recursive(
+            models[0], ring, horizon - len(models), extra)
+        progress(horizon, horizon, 'recursive tail')
+    return _panel_rows(order, histories, preds, horizon, t)
+
+
+def no_progress(done, total, message=''):
+    pass
+
+
+@instrument('boom_forecast', rows=lambda out, *a, **k: len(out))
+def run_boom_forecast(df, products, horizon=4, mode='global', jobs=1, index=None,
+                      progress=None, cube=None, with_forecast=False):
+    """Forecast `horizon` weeks for each product and rank by growth.
+
+    mode='global' trains one XGBoost model on all products' lag features
+    with a product id feature and forecasts every product together, one
+    predict per step; mode='direct' trains one such model per horizon step
+    instead of feeding predictions back; mode='per_product' fits train_xgb
+    for each product, spread over `jobs` processes. Returns one row per requested
+    product with past_sum, future_sum, growth_pct, status ('ok', 'skipped',
+    'failed'), reason and seconds (per-product wall time; for the global
+    model the shared fit+forecast time split evenly). index is an optional
+    ProductIndex for slicing the products' rows, and cube an optional
+    WeeklyCube to read the weekly series from (df may then be None).
+    progress, if given, is called as progress(done, total, message) as
+    products finish. with_forecast adds a 'forecast' column holding each
+    product's `horizon` weekly predictions.
+    """
+    progress = progress or no_progress
+    panel, rows = weekly_panel(df, products, index=index, cube=cube)
+    status = _eligibility(panel, rows, products)
+    ok = [p for p, reason in status.items() if reason is None]
+    results = [{'product': p, 'status': 'skipped', 'reason': reason, 'seconds': 0.0}
+               for p, reason in status.items() if reason is not None]
+    if ok:
+        if mode == 'global':
+            results += _run_global(panel, ok, horizon, progress)
+        elif mode == 'direct':
+            results += _run_direct(panel, ok, horizon, progress)
+        elif mode == 'per_product':
+            results += _run_per_product(panel, ok, horizon, jobs, progress)
+        else:
+            raise ValueError(f"unknown mode {mode!r}")
+    columns = ['product', 'past_sum', 'future_sum', 'growth_pct', 'status',
+               'reason', 'seconds'] + (['forecast'] if with_forecast else [])
+    return pd.DataFrame(results, columns=columns).sort_values(
+        'growth_pct', ascending=False, na_position='last').reset_index(drop=True)
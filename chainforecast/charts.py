@@ -0,0 +1,106 @@
+# Chart payloads: downsampled series and plotly figure construction.
+#
+# A line chart never needs more points than the screen has pixels, so long
+# series are reduced before plotly sees them: LTTB (largest triangle three
+# buckets) keeps the points that shape the curve, min/max bucketing keeps
+# every bucket's extremes so spikes survive. Each y column is reduced on
+# its own non-missing rows (history and forecast columns of one frame cover
+# different dates) and the kept rows are merged. plotly is imported with
+# the first figure, not at app start.
+
+import numpy as np
+import pandas as pd
+
+from .metrics import instrument
+
+MAX_POINTS = 2000
+METHODS = ('lttb', 'minmax')
+
+
+def _numeric(s):
+    s = pd.Series(s)
+    if pd.api.types.is_datetime64_any_dtype(s):
+        return s.to_numpy(dtype='datetime64[ns]').astype(np.int64).astype(float)
+    return pd.to_numeric(s, errors='coerce').to_numpy(dtype=float)
+
+
+def lttb_indices(x, y, n_out):
+    """Positions of the n_out points LTTB keeps from a series sorted by x.
+
+    The first and last points are always kept; every bucket in between
+    contributes the point forming the largest triangle with the previously
+    kept point and the mean of the next bucket.
+    """
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.int64)
+    out = np.empty(n_out, dtype=np.int64)
+    out[0], out[-1] = 0, n - 1
+    a = 0
+    for i in range(n_out - 2):
+        lo, hi = edges[i], edges[i + 1]
+        if i + 2 < len(edges):
+            cx, cy = x[hi:edges[i + 2]].mean(), y[hi:edges[i + 2]].mean()
+        else:
+            cx, cy = x[-1], y[-1]
+        area = np.abs((x[a] - cx) * (y[lo:hi] - y[a])
+                      - (x[a] - x[lo:hi]) * (cy - y[a]))
+        a = lo + int(area.argmax())
+        out[i + 1] = a
+    return out
+
+
+def minmax_indices(y, n_out):
+    """Positions of the minimum and maximum of n_out // 2 equal buckets,
+    plus the first and last point, in order."""
+    y = np.asarray(y, dtype=float)
+    n = len(y)
+    buckets = max(n_out // 2, 1)
+    if n_out >= n:
+        return np.arange(n)
+    bucket = np.arange(n) * buckets // n
+    order = np.lexsort((y, bucket))
+    starts = np.searchsorted(bucket[order], np.arange(buckets))
+    ends = np.append(starts[1:], n) - 1
+    return np.unique(np.concatenate([[0, n - 1], order[starts], order[ends]]))
+
+
+@instrument('chart.downsample')
+def downsample(frame, x, y, max_points=MAX_POINTS, method='lttb'):
+    """Rows of frame (sorted by x) that keep the shape of every y column
+    within about max_points points; frames that fit are returned as is."""
+    if method not in METHODS:
+        raise ValueError(f"method must be one of {METHODS}, not {method!r}")
+    ys = [y] if isinstance(y, str) else list(y)
+    if len(frame) <= max_points:
+        return frame
+    xs = _numeric(frame[x])
+    columns = [_numeric(frame[col]) for col in ys]
+    present = [np.flatnonzero(~np.isnan(values)) for values in columns]
+    keep = []
+    remaining = max_points
+    # shortest first: short columns (e.g. a forecast) are kept whole and the
+    # longer ones share what is left of the budget
+    for k, i in enumerate(np.argsort([len(rows) for rows in present], kind='stable')):
+        values, rows = columns[i], present[i]
+        budget = max(remaining // (len(ys) - k), 3)
+        remaining -= min(budget, len(rows))
+        if method == 'lttb':
+            picked = lttb_indices(xs[rows], values[rows], budget)
+        else:
+            picked = minmax_indices(values[rows], budget)
+        keep.append(rows[picked])
+    return frame.iloc[np.unique(np.concatenate(keep))]
+
+
+def figure(kind, data, max_points=MAX_POINTS, method='lttb', **kwargs):
+    """plotly.express figure of the given kind ('line', 'bar', 'imshow', ...);
+    line and scatter data is downsampled along x first."""
+    import plotly.express as px
+
+    if kind in ('line', 'scatter') and 'x' in kwargs and 'y' in kwargs:
+        data = downsample(data, kwargs['x'], kwargs['y'], max_points, method)
+    return getattr(px, kind)(data, **kwargs)
@@ -0,0 +1,66 @@
+# Cleaning rules shared by the dashboard and the ingestion layer.
+
+import pandas as pd
+
+from .metrics import instrument
+
+
+def normalize_ids(s):
+    """Id column as strings, whatever it was parsed as: ids read as floats
+    lose their '.0' (536365.0 -> '536365'); missing ids stay missing."""
+    ids = s.astype(str).str.replace(r'\.0$', '', regex=True).str.strip()
+    return ids.where(s.notna(), None)
+
+
+def normalize_customerid(s):
+    # customerid float fix: '13085.0' -> '13085'
+    return normalize_ids(s)
+
+
+@instrument('clean_record')
+def clean_record(df):
+    df = df.copy()
+    # normalize column names
+    df.columns = [c.replace(" ", "").replace("_", "").lower()
+                  for c in df.columns]
+    rename = {
+        'invoice': 'invoiceno',
+        'invoiceno': 'invoiceno',
+        'stockcode': 'stockcode',
+        'description': 'description',
+        'quantity': 'quantity',
+        'invoicedate': 'invoicedate',
+        'price': 'price',
+        'customerid': 'customerid',
+        'country': 'country',
+        'totalprice': 'totalprice'
+    }
+    df = df.rename(columns=rename)
+    # remove possible credits
+    if 'invoiceno' in df.columns:
+        df = df[~df['invoiceno'].astype(str).str.startswith("C")]
+    # invoice date
+    if 'invoicedate' in df.columns:
+        df['invoicedate'] = pd.to_datetime(df['invoicedate'], errors='coerce')
+        df = df.dropna(subset=['invoicedate'])
+    # customerid
+    if 'customerid' in df.columns:
+        df['customerid'] = normalize_customerid(df['customerid'])
+    else:
+        df['customerid'] = df.index.astype(str)
+    # numeric cleanup
+    if 'quantity' in df.columns and 'price' in df.columns:
+        df['quantity'] = pd.to_numeric(
+            df['quantity'], errors='coerce').fillna(0)
+        df['price'] = pd.to_numeric(df['price'], errors='coerce').fillna(0.0)
+        df = df[(df['quantity'] > 0) & (df['price'] > 0)]
+    # description
+    if 'description' in df.columns:
+        df['description'] = df['description'].astype(str).str.strip()
+    # sales
+    if 'totalprice' in df.columns:
+        df['sales'] = pd.to_numeric(
+            df['totalprice'], errors='coerce').fillna(0.0)
+    else:
+        df['sales'] = df['quantity'] * df['price']
+    return df.reset_index(drop=True)
@@ -0,0 +1,64 @@
+# Command-line entry point for the headless pipeline.
+#
+#   python -m chainforecast online_retail.xlsx --out results/ --jobs 8
+#   python -m chainforecast online_retail.xlsx --append 2011-12-10.csv --out results/
+#   python -m chainforecast online_retail.xlsx --sarimax --season 4 --jobs 8
+#   python -m chainforecast online_retail.xlsx --offers --out results/
+#
+# Only the pipeline modules are imported: no Streamlit, plotly or
+# statsmodels (unless --sarimax), so a batch run starts in about the time
+# it takes to load pandas and xgboost.
+
+import argparse
+import json
+import sys
+
+from .forecasting import DEFAULT_SEASON
+from .ingest import DEFAULT_CACHE_DIR, DEFAULT_CACHE_MAX_BYTES, DEFAULT_JOBS, DatasetCache
+from .pipeline import run_pipeline
+
+
+def parse_args(argv=None):
+    ap = argparse.ArgumentParser(
+        prog='chainforecast',
+        description='Forecast every product and segment every customer of a '
+                    'retail dataset, writing the results to Parquet.')
+    ap.add_argument('source', help='transactions file (.csv or .xlsx)')
+    ap.add_argument('--append', nargs='+', default=[], metavar='FILE',
+                    help='new transaction files to append to source, in order')
+    ap.add_argument('--out', default='chainforecast-out',
+                    help='output directory (default: %(default)s)')
+    ap.add_argument('--jobs', type=int, default=DEFAULT_JOBS,
+                    help='worker processes (default: %(default)s)')
+    ap.add_argument('--horizon', type=int, default=4,
+                    help='weeks to forecast (default: %(default)s)')
+    ap.add_argument('--mode', choices=('global', 'direct', 'per_product'),
+                    default='global', help='forecasting mode (default: %(default)s)')
+    ap.add_argument('--products', nargs='+', default=None,
+                    help='only forecast these product keys (default: all)')
+    ap.add_argument('--top-days', type=int, default=60,
+                    help='window for the top products table (default: %(default)s)')
+    ap.add_argument('--sarimax', action='store_true',
+                    help='also write per-product SARIMAX forecasts (sarimax.parquet)')
+    ap.add_argument('--season', type=int, default=DEFAULT_SEASON,
+                    help='SARIMAX seasonal period in weeks (default: %(default)s)')
+    ap.add_argument('--offers', action='store_true',
+                    help="assign every customer their segment's offer in the offer "
+                         "store and export the assignments (offers.parquet)")
+    ap.add_argument('--cache-dir', default=DEFAULT_CACHE_DIR,
+                    help='dataset/model cache directory (default: %(default)s)')
+    ap.add_argument('--quiet', action='store_true', help='only print the manifest')
+    return ap.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    log = None if args.quiet else (lambda msg: print(msg, file=sys.stderr))
+    manifest = run_pipeline(
+        args.source, args.out, horizon=args.horizon, mode=args.mode,
+        jobs=max(1, args.jobs), products=args.products, top_days=args.top_days,
+        cache=DatasetCache(args.cache_dir, DEFAULT_CACHE_MAX_BYTES), log=log,
+        appends=args.append, sarimax=args.sarimax, season=args.season,
+        offers=args.offers)
+    print(json.dumps(manifest, indent=2))
+    return 0
@@ -0,0 +1,345 @@
+# Weekly sales cube: product x week and customer x week sparse matrices.
+#
+# Built once at ingest (chunk by chunk, alongside the Parquet store) and
+# saved next to the dataset, so weekly series never need a to_datetime /
+# sort / resample pass over the transactions: a product's series is a sum
+# of a few sparse rows. Products are (key, description) pairs, which lets
+# the Forecasting tab's "stockcode or description substring" query be
+# answered exactly. Weeks follow resample('W-MON'): each week is labelled
+# with the Monday that ends it. Appending transactions costs O(rows
+# appended): each block is kept as a small matrix over the weeks it spans
+# and summed into the cube in one pass the next time it is read.
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+from .metrics import instrument
+
+MEASURES = ('sales', 'quantity', 'rows')
+_DAY = 86_400 * 10 ** 9
+_WEEK = 7 * _DAY
+_BASE = np.datetime64('1970-01-05', 'ns').astype(np.int64)  # a Monday
+
+
+def week_index(dates):
+    """Weeks since 1970-01-05 of the W-MON week each timestamp falls in."""
+    ns = pd.Series(dates).to_numpy(dtype='datetime64[ns]').astype(np.int64)
+    days = ns // _DAY * _DAY
+    return -((_BASE - days) // _WEEK)
+
+
+def week_start(index):
+    """Label (the week's closing Monday) of week numbers from week_index."""
+    return pd.to_datetime(_BASE + np.asarray(index, dtype=np.int64) * _WEEK)
+
+
+def _labels(s):
+    codes, uniques = pd.factorize(s)
+    return codes, np.array(['' if pd.isna(u) else str(u) for u in uniques],
+                           dtype=object)
+
+
+def _empty():
+    return sparse.csr_matrix((0, 0))
+
+
+def _place(m, shift, n, n_steps):
+    # m on n rows and n_steps columns, its column 0 moved to column shift;
+    # only pads indptr (and offsets indices when shift) instead of rebuilding
+    if not shift and m.shape == (n, n_steps):
+        return m
+    indptr = np.concatenate([m.indptr, np.full(n - m.shape[0], m.indptr[-1],
+                                               dtype=m.indptr.dtype)])
+    return sparse.csr_matrix((m.data, m.indices + shift if shift else m.indices, indptr),
+                             shape=(n, n_steps))
+
+
+class _Axis:
+    """Append-only label -> row id mapping."""
+
+    def __init__(self, labels=()):
+        self.labels = list(labels)
+        self.ids = {label: i for i, label in enumerate(self.labels)}
+
+    def __len__(self):
+        return len(self.labels)
+
+    def map(self, labels):
+        out = np.empty(len(labels), dtype=np.int64)
+        for i, label in enumerate(labels):
+            j = self.ids.get(label)
+            if j is None:
+                j = self.ids[label] = len(self.labels)
+                self.labels.append(label)
+            out[i] = j
+        return out
+
+
+class _Grid:
+    """Sparse row x step matrices, one per measure, fed block by block.
+
+    add() keeps each block as its own small CSR over the steps it spans.
+    Blocks are summed into the matrices when they are next read (or once
+    they hold as many entries as the matrices); the matrices are only
+    re-homed when the step range grew to the left.
+    """
+
+    def __init__(self, measures, matrices=None, t0=None):
+        self.measures = measures
+        self._matrices = matrices if matrices is not None else {m: _empty() for m in measures}
+        self._t0 = t0
+        self._blocks = []
+        self._pending = 0
+
+    def add(self, rows, steps, values):
+        """values[m][i] goes to (rows[i], absolute step steps[i])."""
+        if not len(rows):
+            return
+        lo = int(steps.min())
+        shape = (int(rows.max()) + 1, int(steps.max()) + 1 - lo)
+        block = {m: sparse.csr_matrix((values[m], (rows, steps - lo)), shape=shape)
+                 for m in self.measures}
+        self._blocks.append((lo, block))
+        self._pending += block[self.measures[0]].nnz
+
+    def full(self):
+        """Whether enough is pending that it should be merged now."""
+        return self._pending > self._matrices[self.measures[0]].nnz
+
+    def matrices(self, n, t0, n_steps):
+        """The matrices on rows [0, n) and steps [t0, t0 + n_steps)."""
+        base = t0 if self._t0 is None else self._t0
+        for m in self.measures:
+            merged = _place(self._matrices[m], base - t0, n, n_steps)
+            if self._blocks:
+                merged = merged + sum(_place(block[m], lo - t0, n, n_steps)
+                                      for lo, block in self._blocks)
+            self._matrices[m] = merged
+        self._t0, self._blocks, self._pending = t0, [], 0
+        return self._matrices
+
+
+class WeeklyCube:
+    """Sparse weekly sales/quantity/row-count cube by product and customer."""
+
+    def __init__(self, key='stockcode'):
+        self.key = key
+        self.n_rows = 0
+        self.w0 = None
+        self.n_weeks = 0
+        self._products = _Axis()      # (key value, description) pairs
+        self._customers = _Axis()
+        self.first_row = np.empty(0, dtype=np.int64)
+        self._grids = {'product': _Grid(MEASURES), 'customer': _Grid(MEASURES)}
+        self._by_key = None
+        self._lookup = None
+
+    @classmethod
+    @instrument('cube.build', rows=lambda cube, cls, df: len(df))
+    def from_frame(cls, df):
+        cube = cls('stockcode' if 'stockcode' in df.columns else 'description')
+        cube.add(df)
+        return cube
+
+    # ---- building ----
+
+    def _product_ids(self, df):
+        code_ids, codes = _labels(df[self.key])
+        desc_ids, descs = (_labels(df['description']) if 'description' in df.columns
+                           else (code_ids, codes))
+        pair = code_ids.astype(np.int64) * (len(descs) + 1) + desc_ids
+        _, first, inverse = np.unique(pair, return_index=True, return_inverse=True)
+        ids = self._products.map([
+            (codes[code_ids[i]] if code_ids[i] >= 0 else '',
+             descs[desc_ids[i]] if desc_ids[i] >= 0 else '') for i in first])
+        # rows arrive in order, so a product's first row is the first row of
+        # the block that introduces it
+        known = len(self.first_row)
+        self.first_row = np.concatenate([self.first_row, np.zeros(len(self._products) - known,
+                                                                  dtype=np.int64)])
+        fresh = ids >= known
+        self.first_row[ids[fresh]] = self.n_rows + first[fresh]
+        return ids[inverse.ravel()]
+
+    def _customer_ids(self, df):
+        ids = np.full(len(df), -1, dtype=np.int64)
+        if 'customerid' in df.columns:
+            codes, labels = _labels(df['customerid'])
+            known = codes >= 0
+            ids[known] = self._customers.map(labels)[codes[known]]
+        return ids
+
+    def add(self, df):
+        """Fold a block of cleaned transactions (appended after the rows
+        already in the cube) into the cube. Costs O(len(df)): the matrices
+        pick the block up when they are next read."""
+        valid = pd.Series(df['invoicedate']).notna().to_numpy() if len(df) else []
+        if not np.any(valid):
+            self.n_rows += len(df)
+            return self
+        weeks = week_index(df['invoicedate'])
+        lo, hi = int(weeks[valid].min()), int(weeks[valid].max()) + 1
+        if self.w0 is not None:
+            lo, hi = min(lo, self.w0), max(hi, self.w0 + self.n_weeks)
+
+        product_ids = self._product_ids(df)
+        customer_ids = self._customer_ids(df)
+        self.w0, self.n_weeks = lo, hi - lo
+
+        values = {
+            'sales': pd.to_numeric(df['sales'], errors='coerce').fillna(0).to_numpy(float),
+            'quantity': (pd.to_numeric(df['quantity'], errors='coerce').fillna(0)
+                         .to_numpy(float) if 'quantity' in df.columns
+                         else np.zeros(len(df))),
+            'rows': np.ones(len(df)),
+        }
+        weeks = weeks[valid]
+        for axis, ids, n in (('product', product_ids[valid], len(self._products)),
+                             ('customer', customer_ids[valid], len(self._customers))):
+            keep = ids >= 0
+            grid = self._grids[axis]
+            grid.add(ids[keep], weeks[keep], {m: v[valid][keep] for m, v in values.items()})
+            if grid.full():
+                grid.matrices(n, self.w0, self.n_weeks)
+        self.n_rows += len(df)
+        self._by_key = self._lookup = None
+        return self
+
+    # ---- reading ----
+
+    @property
+    def product(self):
+        """{measure: product x week CSR matrix}."""
+        return self._grids['product'].matrices(len(self._products), self.w0 or 0,
+                                               self.n_weeks)
+
+    @property
+    def customer(self):
+        """{measure: customer x week CSR matrix}."""
+        return self._grids['customer'].matrices(len(self._customers), self.w0 or 0,
+                                                self.n_weeks)
+
+    @property
+    def weeks(self):
+        return week_start(np.arange(self.w0 or 0, (self.w0 or 0) + self.n_weeks))
+
+    @property
+    def products(self):
+        return self._products.labels
+
+    @property
+    def customers(self):
+        return self._customers.labels
+
+    def keys(self):
+        """Distinct product keys (stockcodes, or descriptions), sorted."""
+        return sorted({c for c, _ in self.products if c})
+
+    def match(self, query, index):
+        """Product ids whose key equals query or whose description contains
+        it (case-insensitive, literal), resolved through the dataset's
+        ProductIndex instead of a scan of every description."""
+        codes, descriptions = index.match(query)
+        if self._lookup is None:
+            by_code, by_desc = {}, {}
+            for i, (c, d) in enumerate(self.products):
+                by_code.setdefault(c, []).append(i)
+                by_desc.setdefault(d, []).append(i)
+            self._lookup = by_code, by_desc
+        by_code, by_desc = self._lookup
+        ids = ({i for c in codes for i in by_code.get(c, ())}
+               | {i for d in descriptions for i in by_desc.get(d, ())})
+        return np.array(sorted(ids), dtype=np.int64)
+
+    def description(self, ids):
+        """Description of the matched product that appears first in the data."""
+        ids = np.asarray(ids)
+        return self.products[ids[np.argmin(self.first_row[ids])]][1]
+
+    def _span(self, values, active):
+        # series from the first to the last active week, gaps as 0
+        on = np.flatnonzero(active)
+        if not len(on):
+            return pd.DataFrame({'ds': pd.to_datetime([]), 'y': np.empty(0)})
+        lo, hi = on[0], on[-1] + 1
+        return pd.DataFrame({'ds': self.weeks[lo:hi], 'y': values[lo:hi]})
+
+    def series(self, ids, measure='sales'):
+        """Weekly series (ds, y) of the summed products ids, as
+        prepare_weekly_series would return for their rows."""
+        ids = np.asarray(ids)
+        values = np.asarray(self.product[measure][ids].sum(axis=0)).ravel()
+        active = np.asarray(self.product['rows'][ids].sum(axis=0)).ravel() > 0
+        return self._span(values, active)
+
+    def customer_series(self, customerid, measure='sales'):
+        i = self._customers.ids.get(str(customerid))
+        if i is None:
+            return self._span(np.empty(0), np.empty(0, dtype=bool))
+        row = self.customer[measure][i].toarray().ravel()
+        return self._span(row, self.customer['rows'][i].toarray().ravel() > 0)
+
+    def by_key(self, measure):
+        """(key labels, key x week matrix): product pairs summed per key."""
+        if self._by_key is None:
+            codes, inverse = np.unique(np.array([c for c, _ in self.products], dtype=object),
+                                       return_inverse=True)
+            A = sparse.csr_matrix((np.ones(len(inverse)), (inverse, np.arange(len(inverse)))),
+                                  shape=(len(codes), len(inverse)))
+            self._by_key = codes, {m: (A @ self.product[m]).tocsr() for m in MEASURES}
+        codes, matrices = self._by_key
+        return codes, matrices[measure]
+
+    def panel(self, products=None):
+        """(panel, rows) in the layout of batch.weekly_panel, by key."""
+        codes, sales = self.by_key('sales')
+        _, counts = self.by_key('rows')
+        pos = {c: i for i, c in enumerate(codes)}
+        wanted = sorted(codes if products is None else
+                        {str(p) for p in products if str(p) in pos})
+        ids = np.array([pos[p] for p in wanted], dtype=np.int64)
+        sales, counts = sales[ids].toarray(), counts[ids].toarray()
+        active = counts > 0
+        inside = (np.maximum.accumulate(active, axis=1)
+                  & np.maximum.accumulate(active[:, ::-1], axis=1)[:, ::-1])
+        prod, week = np.nonzero(inside)
+        panel = pd.DataFrame({'product': np.array(wanted, dtype=object)[prod],
+                              'ds': self.weeks[week], 'y': sales[prod, week]})
+        rows = pd.Series(counts.sum(axis=1).astype(np.int64), index=wanted)
+        return panel, rows[rows > 0]
+
+    # ---- persistence ----
+
+    def save(self, path):
+        arrays = {'meta': np.array([self.key, self.n_rows, self.w0 or 0, self.n_weeks],
+                                   dtype=object).astype(str),
+                  'codes': np.array([c for c, _ in self.products], dtype=str),
+                  'descriptions': np.array([d for _, d in self.products], dtype=str),
+                  'customers': np.array(self.customers, dtype=str),
+                  'first_row': self.first_row}
+        for axis, matrices in (('product', self.product), ('customer', self.customer)):
+            for m, mat in matrices.items():
+                arrays[f'{axis}_{m}_data'] = mat.data
+                arrays[f'{axis}_{m}_indices'] = mat.indices
+                arrays[f'{axis}_{m}_indptr'] = mat.indptr
+        with open(path, 'wb') as f:
+            np.savez(f, **arrays)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path, allow_pickle=False) as z:
+            key, n_rows, w0, n_weeks = z['meta']
+            cube = cls(str(key))
+            cube.n_rows, cube.n_weeks = int(n_rows), int(n_weeks)
+            cube.w0 = int(w0) if cube.n_weeks else None
+            cube._products = _Axis(zip(z['codes'].tolist(), z['descriptions'].tolist()))
+            cube._customers = _Axis(z['customers'].tolist())
+            cube.first_row = z['first_row']
+            for axis, n in (('product', len(cube._products)),
+                            ('customer', len(cube._customers))):
+                cube._grids[axis] = _Grid(MEASURES, {m: sparse.csr_matrix(
+                    (z[f'{axis}_{m}_data'], z[f'{axis}_{m}_indices'],
+                     z[f'{axis}_{m}_indptr']), shape=(n, cube.n_weeks)) for m in MEASURES},
+                    cube.w0)
+        return cube
@@ -0,0 +1,160 @@
+# Customer store for the Customer Analytics tab.
+#
+# Everything a profile page shows — RFM, segment, the customer's rows and
+# their top 50 products — is precomputed once per dataset and looked up by
+# customerid, so a profile view costs a dict lookup instead of a full-frame
+# scan plus an RFM/KMeans run. Unknown ids are matched with a sorted-array
+# prefix search and a deletion-neighbourhood index (edit distance 1)
+# instead of difflib over every id.
+
+import bisect
+import re
+
+import numpy as np
+import pandas as pd
+
+from .metrics import instrument
+from .products import grouped_positions
+
+TOP_N = 50
+
+
+def normalize_id(text):
+    # same rule clean_record applies: '13085.0' -> '13085'
+    return re.sub(r'\.0$', '', str(text).strip())
+
+
+def _deletions(text):
+    return {text[:i] + text[i + 1:] for i in range(len(text))}
+
+
+class CustomerIdMatcher:
+    """Prefix and typo-tolerant lookup over customer id strings."""
+
+    def __init__(self, ids):
+        self.ids = sorted(ids)
+        self._neighbours = None
+        self._by_length = {}
+
+    def prefix(self, prefix, limit=8):
+        out = []
+        i = bisect.bisect_left(self.ids, prefix)
+        while i < len(self.ids) and len(out) < limit and self.ids[i].startswith(prefix):
+            out.append(self.ids[i])
+            i += 1
+        return out
+
+    def _build_neighbours(self):
+        # every id is filed under itself and each single-character deletion;
+        # two strings within edit distance 1 always share one of those keys
+        neighbours = {}
+        for cid in self.ids:
+            for key in _deletions(cid) | {cid}:
+                neighbours.setdefault(key, []).append(cid)
+        self._neighbours = neighbours
+
+    def _same_length(self, text, max_mismatch, limit):
+        # vectorized Hamming distance against every id of the same length
+        if len(text) not in self._by_length:
+            same = [c for c in self.ids if len(c) == len(text)]
+            chars = np.frombuffer(''.join(same).encode('utf-32-le'), dtype=np.uint32)
+            self._by_length[len(text)] = (same, chars.reshape(len(same), len(text)))
+        same, chars = self._by_length[len(text)]
+        if not same:
+            return []
+        query = np.frombuffer(text.encode('utf-32-le'), dtype=np.uint32)
+        dist = (chars != query).sum(axis=1)
+        best = np.flatnonzero((dist > 0) & (dist <= max_mismatch))
+        best = best[np.argsort(dist[best], kind='stable')[:limit]]
+        return [same[i] for i in best]
+
+    def close_matches(self, text, limit=8):
+        """Ids one edit away from text, then ids starting with text, then
+        same-length ids with up to two differing characters."""
+        if self._neighbours is None:
+            self._build_neighbours()
+        found = []
+        for key in _deletions(text) | {text}:
+            found.extend(self._neighbours.get(key, ()))
+        out = sorted({c for c in found if c != text and _within_one(text, c)})
+        for more in (self.prefix, lambda t, n: self._same_length(t, 2, n)):
+            if len(out) >= limit:
+                break
+            out += [c for c in more(text, limit) if c != text and c not in out]
+        return out[:limit]
+
+
+def _within_one(a, b):
+    # deletion keys over-approximate; confirm edit distance <= 1
+    if abs(len(a) - len(b)) > 1:
+        return False
+    if len(a) == len(b):
+        return sum(x != y for x, y in zip(a, b)) <= 1
+    if len(a) > len(b):
+        a, b = b, a
+    i = 0
+    while i < len(a) and a[i] == b[i]:
+        i += 1
+    return a[i:] == b[i + 1:]
+
+
+class CustomerStore:
+    """Per-customer RFM/segment, row offsets and top products."""
+
+    @instrument('customer_store.build', rows=lambda _, self, df, segments: len(df))
+    def __init__(self, df, segments):
+        """segments is the rfm_analysis + segmentation_kmeans output."""
+        self.ids, _, self._order, self._bounds = grouped_positions(df['customerid'])
+        self._pos = {cid: i for i, cid in enumerate(self.ids)}
+        seg = segments.copy()
+        seg.index = seg['customerid'].astype(str)
+        self.segments = seg
+        self._top = self._top_products(df)
+        self.matcher = CustomerIdMatcher(self.ids)
+
+    @staticmethod
+    def _top_products(df):
+        if 'stockcode' not in df.columns:
+            return {}
+        agg = df.groupby(['customerid', 'stockcode'], observed=True).agg(
+            sales=('sales', 'sum'), description=('description', 'first'),
+            quantity=('quantity', 'sum')).reset_index()
+        agg = agg.sort_values(['customerid', 'sales'], ascending=[True, False])
+        agg = agg.groupby('customerid', observed=True).head(TOP_N)
+        keys = agg['customerid'].astype(str).to_numpy()
+        agg = agg.drop(columns='customerid').reset_index(drop=True)
+        starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]])
+        ends = np.r_[starts[1:], len(keys)]
+        return {keys[s]: (s, e, agg) for s, e in zip(starts, ends)}
+
+    def __contains__(self, cid):
+        return normalize_id(cid) in self._pos
+
+    def __len__(self):
+        return len(self.ids)
+
+    def rows(self, cid):
+        """Row positions of a customer's transactions, in row order."""
+        i = self._pos.get(normalize_id(cid))
+        if i is None:
+            return np.empty(0, dtype=np.int64)
+        return self._order[self._bounds[i]:self._bounds[i + 1]]
+
+    def top_products(self, cid):
+        entry = self._top.get(normalize_id(cid))
+        if entry is None:
+            return pd.DataFrame(columns=['stockcode', 'sales', 'description', 'quantity'])
+        start, end, agg = entry
+        return agg.iloc[start:end].reset_index(drop=True)
+
+    def profile(self, cid):
+        """RFM/segment row plus top products for cid, or None if unknown."""
+        cid = normalize_id(cid)
+        if cid not in self._pos:
+            return None
+        row = self.segments.loc[cid] if cid in self.segments.index else None
+        return {'customerid': cid, 'rfm': row, 'top_products': self.top_products(cid),
+                'n_rows': len(self.rows(cid))}
+
+    def close_matches(self, cid, limit=8):
+        return self.matcher.close_matches(normalize_id(cid), limit)
@@ -0,0 +1,200 @@
+# Daily product sales with prefix sums, for top products over any window.
+#
+# Built at ingest next to the weekly cube: one sparse (country, product) x
+# day matrix per measure. The first query for a country (or for all
+# countries) turns its rows into a dense product x day cumulative sum, so
+# the total of every product over any day range is one subtraction of two
+# columns: a window's top-K costs O(products), independent of the number
+# of transactions, and sliding the window or switching country never
+# touches the frame. Top-K uses argpartition and only sorts the K winners.
+# Appended blocks are merged into the matrices lazily, as in the cube.
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+from .cube import _DAY, _Axis, _Grid, _labels
+from .metrics import instrument
+
+MEASURES = ('sales', 'quantity', 'rows')
+
+
+def day_index(dates):
+    """Days since 1970-01-01 of each timestamp."""
+    ns = pd.Series(dates).to_numpy(dtype='datetime64[ns]').astype(np.int64)
+    return ns // _DAY
+
+
+class DailySales:
+    """Sparse daily sales/quantity/row counts by country and product."""
+
+    def __init__(self, key='stockcode'):
+        self.key = key
+        self.n_rows = 0
+        self.d0 = None
+        self.n_days = 0
+        self._products = _Axis()
+        self._countries = _Axis()
+        self._pairs = _Axis()         # (country id, product id)
+        self._grid = _Grid(MEASURES)
+        self._prefix = {}
+
+    @classmethod
+    @instrument('daily_sales.build', rows=lambda daily, cls, df: len(df))
+    def from_frame(cls, df):
+        daily = cls('stockcode' if 'stockcode' in df.columns else 'description')
+        daily.add(df)
+        return daily
+
+    # ---- building ----
+
+    def _pair_ids(self, df):
+        product_codes, products = _labels(df[self.key])
+        product_ids = self._products.map(products)
+        if 'country' in df.columns:
+            country_codes, countries = _labels(df['country'])
+            country_ids = self._countries.map(list(countries) + [''])
+            # rows without a country go under ''
+            country = country_ids[np.where(country_codes >= 0, country_codes, -1)]
+        else:
+            country = np.full(len(df), self._countries.map([''])[0])
+        ids = np.full(len(df), -1, dtype=np.int64)
+        known = product_codes >= 0      # rows without a product are not ranked
+        if known.any():
+            n = len(self._products)
+            pair = country[known] * n + product_ids[product_codes[known]]
+            keys, inverse = np.unique(pair, return_inverse=True)
+            ids[known] = self._pairs.map(
+                [(int(k // n), int(k % n)) for k in keys])[inverse.ravel()]
+        return ids
+
+    def add(self, df):
+        """Fold a block of cleaned transactions into the daily matrices."""
+        valid = pd.Series(df['invoicedate']).notna().to_numpy() if len(df) else []
+        self.n_rows += len(df)
+        if not np.any(valid):
+            return self
+        days = day_index(df['invoicedate'])
+        lo, hi = int(days[valid].min()), int(days[valid].max()) + 1
+        if self.d0 is not None:
+            lo, hi = min(lo, self.d0), max(hi, self.d0 + self.n_days)
+        ids = self._pair_ids(df)
+        self.d0, self.n_days = lo, hi - lo
+
+        keep = valid & (ids >= 0)
+        values = {
+            'sales': pd.to_numeric(df['sales'], errors='coerce').fillna(0).to_numpy(float),
+            'quantity': (pd.to_numeric(df['quantity'], errors='coerce').fillna(0)
+                         .to_numpy(float) if 'quantity' in df.columns
+                         else np.zeros(len(df))),
+            'rows': np.ones(len(df)),
+        }
+        self._grid.add(ids[keep], days[keep], {m: v[keep] for m, v in values.items()})
+        if self._grid.full():
+            self._grid.matrices(len(self._pairs), self.d0, self.n_days)
+        self._prefix = {}
+        return self
+
+    # ---- reading ----
+
+    @property
+    def matrix(self):
+        """{measure: (country, product) x day CSR matrix}."""
+        return self._grid.matrices(len(self._pairs), self.d0 or 0, self.n_days)
+
+    @property
+    def days(self):
+        start = self.d0 or 0
+        return pd.to_datetime(np.arange(start, start + self.n_days) * _DAY)
+
+    @property
+    def countries(self):
+        return sorted(c for c in self._countries.labels if c)
+
+    def prefix(self, country=None, measure='sales'):
+        """(product ids, products x (days + 1) cumulative sums) for one
+        country, or all countries when country is None."""
+        if (country, measure) not in self._prefix:
+            pairs = np.array(self._pairs.labels, dtype=np.int64).reshape(-1, 2)
+            if country is None:
+                rows = np.arange(len(pairs))
+            else:
+                c = self._countries.ids.get(str(country), -1)
+                rows = np.flatnonzero(pairs[:, 0] == c)
+            ids, inverse = np.unique(pairs[rows, 1], return_inverse=True)
+            # sum the (country, product) rows of each product
+            A = sparse.csr_matrix((np.ones(len(rows)), (inverse.ravel(), rows)),
+                                  shape=(len(ids), len(pairs)))
+            totals = (A @ self.matrix[measure]).toarray()
+            cum = np.zeros((len(ids), self.n_days + 1))
+            np.cumsum(totals, axis=1, out=cum[:, 1:])
+            self._prefix[country, measure] = ids, cum
+        return self._prefix[country, measure]
+
+    def window(self, days=None, start=None, end=None):
+        """Half-open day-column range [a, b) of a query.
+
+        days=N is the last N days before the last day in the data plus that
+        day; start/end are inclusive dates and default to the data's range.
+        """
+        if days is not None:
+            return max(0, self.n_days - 1 - int(days)), self.n_days
+        if self.n_days == 0 or self.d0 is None:
+            # nothing ingested yet: empty, like the days= path
+            return 0, 0
+        first = 0 if start is None else int(day_index([pd.Timestamp(start)])[0]) - self.d0
+        last = (self.n_days - 1 if end is None
+                else int(day_index([pd.Timestamp(end)])[0]) - self.d0)
+        return min(max(first, 0), self.n_days), min(max(last + 1, 0), self.n_days)
+
+    def totals(self, days=None, start=None, end=None, country=None, measure='sales'):
+        """(product ids, window total) for every product with rows in the window."""
+        a, b = self.window(days, start, end)
+        ids, cum = self.prefix(country, measure)
+        _, rows = self.prefix(country, 'rows')
+        present = rows[:, b] - rows[:, a] > 0
+        return ids[present], (cum[:, b] - cum[:, a])[present]
+
+    @instrument('top_products', rows=lambda top, *a, **k: len(top))
+    def top(self, k=10, days=None, start=None, end=None, country=None, measure='sales'):
+        """Top k products (all of them for k=0) by measure over a window, as
+        a (key, measure) frame sorted descending; see window() for
+        days/start/end."""
+        ids, values = self.totals(days, start, end, country, measure)
+        if 0 < k < len(values):
+            best = np.argpartition(-values, k - 1)[:k]
+        else:
+            best = np.arange(len(values))
+        best = best[np.argsort(-values[best], kind='stable')]
+        labels = np.array(self._products.labels, dtype=object)
+        return pd.DataFrame({self.key: labels[ids[best]], measure: values[best]})
+
+    # ---- persistence ----
+
+    def save(self, path):
+        arrays = {'meta': np.array([self.key, self.n_rows, self.d0 or 0, self.n_days],
+                                   dtype=object).astype(str),
+                  'products': np.array(self._products.labels, dtype=str),
+                  'countries': np.array(self._countries.labels, dtype=str),
+                  'pairs': np.array(self._pairs.labels, dtype=np.int64).reshape(-1, 2)}
+        for m, mat in self.matrix.items():
+            arrays[f'{m}_data'] = mat.data
+            arrays[f'{m}_indices'] = mat.indices
+            arrays[f'{m}_indptr'] = mat.indptr
+        with open(path, 'wb') as f:
+            np.savez(f, **arrays)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path, allow_pickle=False) as z:
+            key, n_rows, d0, n_days = z['meta']
+            daily = cls(str(key))
+            daily.n_rows, daily.n_days = int(n_rows), int(n_days)
+            daily.d0 = int(d0) if daily.n_days else None
+            daily._products = _Axis(z['products'].tolist())
+            daily._countries = _Axis(z['countries'].tolist())
+            daily._pairs = _Axis(map(tuple, z['pairs'].tolist()))
+            daily._grid = _Grid(MEASURES, {m: sparse.csr_matrix(
+                (z[f'{m}_data'], z[f'{m}_indices'], z[f'{m}_indptr']),
+                shape=(len(daily._pairs), daily.n_days)) for m in MEASURES}, daily.d0)
+        return daily
@@ -0,0 +1,246 @@
+# Weekly series preparation and the SARIMAX (short-term) / XGBoost
+# (long-term) product forecasters.
+#
+# SARIMAX fits run under a time budget and can warm-start from an earlier
+# fit's parameters (a series that grew by a few weeks converges in a few
+# iterations from there). A fit that times out, does not converge or fails
+# falls back to vectorized seasonal smoothing (see smoothing.py);
+# fit_sarimax_many spreads a batch of series over worker processes and
+# smooths all of its fallbacks in one pass.
+
+import os
+import time
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from .metrics import instrument
+from .smoothing import SeasonalSmoothing, fit_smoothing
+
+DEFAULT_SEASON = int(os.environ.get("CHAINFORECAST_SEASON", 5))
+SARIMAX_TIME_BUDGET = float(os.environ.get("CHAINFORECAST_SARIMAX_BUDGET", 10))
+SARIMAX_MAXITER = 50
+WARM_MAXITER = 20
+WARM_WEEKS = 8      # warm-start when the series grew by at most this many weeks
+
+
+def sarimax_params(season=DEFAULT_SEASON):
+    """SARIMAX(1,1,1)(0,1,1,season) orders; season is in weeks."""
+    return dict(order=(1, 1, 1), seasonal_order=(0, 1, 1, int(season)))
+
+
+SARIMAX_PARAMS = sarimax_params()
+XGB_PARAMS = dict(n_estimators=200, max_depth=5, learning_rate=0.05,
+                  random_state=42)
+
+
+def prepare_weekly_series(d):
+    d = d.copy()
+    d['invoicedate'] = pd.to_datetime(d['invoicedate'], errors='coerce')
+    d = d.set_index('invoicedate').sort_index()
+    weekly = d['sales'].resample(
+        'W-MON').sum().reset_index().rename(columns={'invoicedate': 'ds', 'sales': 'y'})
+    weekly['ds'] = pd.to_datetime(weekly['ds']).dt.to_period(
+        'W').apply(lambda p: p.start_time)
+    return weekly
+
+
+class FitTimeout(Exception):
+    pass
+
+
+class _Deadline:
+    # optimizer callback; a class, not a closure, because the fitted results
+    # keep a reference to it and are pickled back from worker processes
+    def __init__(self, seconds):
+        self.seconds = seconds
+        self.start = time.perf_counter()
+
+    def __call__(self, _):
+        if self.seconds is not None and time.perf_counter() - self.start > self.seconds:
+            raise FitTimeout(f"no fit within {self.seconds:g}s")
+
+
+@instrument('sarimax.fit')
+def train_sarimax(weekly, params=SARIMAX_PARAMS, start_params=None, time_budget=None):
+    """Fit SARIMAX on weekly['y'].
+
+    start_params warm-starts the optimizer (with a lower iteration cap);
+    FitTimeout is raised once time_budget seconds have passed.
+    """
+    # statsmodels is slow to import and only needed here
+    from statsmodels.tsa.statespace.sarimax import SARIMAX
+
+    model = SARIMAX(weekly['y'], **params,
+                    enforce_stationarity=False, enforce_invertibility=False)
+    with warnings.catch_warnings():
+        # non-convergence is read from mle_retvals instead
+        warnings.simplefilter('ignore')
+        res = model.fit(disp=False, start_params=start_params, callback=_Deadline(time_budget),
+                        maxiter=SARIMAX_MAXITER if start_params is None else WARM_MAXITER)
+    return res
+
+
+def _try_sarimax(weekly, params, start_params, time_budget):
+    # (results or None, info); never raises, so a batch survives bad series
+    t = time.perf_counter()
+    info = {'backend': 'sarimax', 'warm': start_params is not None, 'reason': ''}
+    try:
+        res = train_sarimax(weekly, params, start_params, time_budget)
+        if not res.mle_retvals.get('converged', True):
+            res, info['reason'] = None, 'did not converge'
+    except FitTimeout as e:
+        res, info['reason'] = None, str(e)
+    except Exception as e:
+        res, info['reason'] = None, f"{type(e).__name__}: {e}"
+    info['seconds'] = round(time.perf_counter() - t, 4)
+    return res, info
+
+
+def _fallbacks(weeklies, params, fits):
+    # one vectorized smoothing pass over every series SARIMAX gave up on
+    failed = [k for k, (res, _) in fits.items() if res is None]
+    models = fit_smoothing([weeklies[k]['y'].to_numpy() for k in failed],
+                           params['seasonal_order'][3])
+    for k, model in zip(failed, models):
+        info = fits[k][1]
+        fits[k] = (model, dict(info, backend=model.backend, method=model.method))
+    return fits
+
+
+def fit_sarimax(weekly, params=SARIMAX_PARAMS, start_params=None,
+                time_budget=SARIMAX_TIME_BUDGET):
+    """(model, info) for one series: SARIMAX results, or SeasonalSmoothing
+    when the fit times out, does not converge or fails. info records the
+    backend, whether it was warm-started, the reason for a fallback and
+    the seconds spent fitting."""
+    fits = {0: _try_sarimax(weekly, params, start_params, time_budget)}
+    return _fallbacks({0: weekly}, params, fits)[0]
+
+
+def _fit_block(block, params, time_budget):
+    return [(key, _try_sarimax(weekly, params, start, time_budget))
+            for key, weekly, start in block]
+
+
+def fit_sarimax_many(weeklies, params=SARIMAX_PARAMS, starts=None,
+                     time_budget=SARIMAX_TIME_BUDGET, jobs=1):
+    """{key: (model, info)} for a dict of weekly frames, see fit_sarimax.
+
+    starts maps keys to warm-start parameters. Fits are spread over jobs
+    processes, each taking a block of series; the time budget is per fit.
+    """
+    starts = starts or {}
+    items = [(k, w, starts.get(k)) for k, w in weeklies.items()]
+    if jobs > 1 and len(items) > 1:
+        blocks = [items[i::jobs * 4] for i in range(min(jobs * 4, len(items)))]
+        with ProcessPoolExecutor(jobs) as ex:
+            done = ex.map(_fit_block, blocks, [params] * len(blocks),
+                          [time_budget] * len(blocks))
+            fits = dict(pair for block in done for pair in block)
+    else:
+        fits = dict(_fit_block(items, params, time_budget))
+    return _fallbacks(weeklies, params, {k: fits[k] for k in weeklies})
+
+
+@instrument('sarimax.forecast', rows=lambda preds, *a, **k: len(preds))
+def forecast_sarimax(res, steps=4):
+    if isinstance(res, SeasonalSmoothing):
+        return res.forecast(steps)
+    pred = res.get_forecast(steps=steps)
+    return pred.predicted_mean.values
+
+
+def create_lag_features_weekly(weekly, lags=[1, 2, 3, 4, 6, 8, 12]):
+    df_ = weekly.copy()
+    for lag in lags:
+        df_[f'lag_{lag}'] = df_['y'].shift(lag)
+    return df_.dropna().reset_index(drop=True)
+
+
+def xgb_regressor(**params):
+    # xgboost (and the sklearn it pulls in) takes over a second to import,
+    # so it is loaded with the first model rather than at app start
+    import xgboost as xgb
+
+    return xgb.XGBRegressor(**params)
+
+
+@instrument('xgb.fit')
+def train_xgb(weekly, params=XGB_PARAMS):
+    df_ = create_lag_features_weekly(weekly)
+    feat_cols = [c for c in df_.columns if c.startswith('lag_')]
+    model = xgb_regressor(**params)
+    model.fit(df_[feat_cols], df_['y'])
+    return model, feat_cols
+
+
+class LagRing:
+    """The last max(lags) values of many series, kept in a ring buffer.
+
+    Lags a series is too short for fall back to the mean of its whole
+    history (including values pushed so far), as in the original
+    forecast_xgb loop; the mean is kept as a running sum and count.
+    """
+
+    def __init__(self, histories, lags):
+        self.lags = np.asarray(lags)
+        self.width = int(self.lags.max())
+        self.buf = np.zeros((len(histories), self.width))
+        self.count = np.empty(len(histories))
+        self.total = np.empty(len(histories))
+        for i, h in enumerate(histories):
+            h = np.asarray(h, dtype=float)
+            tail = h[-self.width:]
+            self.buf[i, self.width - len(tail):] = tail
+            self.count[i] = len(h)
+            self.total[i] = h.sum()
+        self.pos = 0  # slot the next pushed value goes into
+
+    def features(self, out=None):
+        """(n, len(lags)) lag matrix for the next step, written into out."""
+        cols = (self.pos - self.lags) % self.width
+        X = self.buf[:, cols] if out is None else np.take(self.buf, cols, axis=1, out=out)
+        missing = self.lags[None, :] > self.count[:, None]
+        if missing.any():
+            np.copyto(X, (self.total / self.count)[:, None], where=missing)
+        return X
+
+    def push(self, values):
+        self.buf[:, self.pos] = values
+        self.pos = (self.pos + 1) % self.width
+        self.count += 1
+        self.total += values
+
+
+def forecast_recursive(model, ring, steps, extra=None):
+    """Advance every series in ring by `steps` with one predict per step.
+
+    extra is an optional (n, k) block of static features appended after the
+    lags (e.g. a product id for a global model).
+    """
+    n, k = ring.buf.shape[0], len(ring.lags)
+    X = np.empty((n, k + (0 if extra is None else extra.shape[1])))
+    if extra is not None:
+        X[:, k:] = extra
+    preds = np.empty((n, steps))
+    for step in range(steps):
+        ring.features(out=X[:, :k])
+        preds[:, step] = model.predict(X)
+        ring.push(preds[:, step])
+    return preds
+
+
+@instrument('xgb.forecast_panel', rows=lambda preds, *a, **k: len(preds))
+def forecast_panel(model, histories, lags, steps, extra=None):
+    """Recursive forecast of many series at once (see forecast_recursive)."""
+    return forecast_recursive(model, LagRing(histories, lags), steps, extra)
+
+
+@instrument('xgb.forecast', rows=lambda preds, *a, **k: len(preds))
+def forecast_xgb(model, weekly, feat_cols, steps=4):
+    lags = [int(f.split('_')[1]) for f in feat_cols]
+    preds = forecast_panel(model, [weekly['y'].to_numpy()], lags, steps)
+    return [float(p) for p in preds[0]]
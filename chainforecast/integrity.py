@@ -0,0 +1,308 @@
+# File hashing and Merkle roots for dataset integrity.
+
+import hashlib
+import os
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+
+from .metrics import instrument
+
+
+def compute_hash_bytes(b: bytes):
+    h = hashlib.sha256()
+    h.update(b)
+    return h.hexdigest()
+
+
+def merkle_root_from_ids(ids):
+    if len(ids) == 0:
+        return None
+    leaves = [hashlib.sha256(str(i).encode()).digest() for i in ids]
+    while len(leaves) > 1:
+        if len(leaves) % 2 == 1:
+            leaves.append(leaves[-1])
+        new_level = []
+        for i in range(0, len(leaves), 2):
+            new_level.append(hashlib.sha256(leaves[i] + leaves[i+1]).digest())
+        leaves = new_level
+    return hashlib.sha256(leaves[0]).hexdigest()
+
+
+def compute_hash_file(source, block_size=1 << 20):
+    # same digest as compute_hash_bytes, without holding the file in memory
+    h = hashlib.sha256()
+    f = open(source, 'rb') if isinstance(source, (str, bytes, os.PathLike)) else source
+    try:
+        for block in iter(lambda: f.read(block_size), b''):
+            h.update(block)
+    finally:
+        if f is not source:
+            f.close()
+    return h.hexdigest()
+
+
+def chain_hash(parent_hash, delta_hash):
+    """Hash of a dataset version: its parent's hash followed by the digest
+    of the file appended to it, so a version commits to its whole history."""
+    return compute_hash_bytes(bytes.fromhex(parent_hash) + bytes.fromhex(delta_hash))
+
+
+def verify_chain(base_hash, chain):
+    """True if every entry's hash follows from base_hash and the deltas before it."""
+    h = base_hash
+    for entry in chain:
+        h = chain_hash(h, entry['delta'])
+        if h != entry['hash']:
+            return False
+    return True
+
+
+# --------------------------------------------------
+# Row-content Merkle tree
+#
+# merkle_root_from_ids() above only commits to row positions. MerkleTree
+# commits to the canonical bytes of every row, keeps all levels so it can
+# hand out inclusion proofs, and extends in O(m + log n) when m rows are
+# appended. It uses the same pairing rule (odd node paired with itself) and
+# final root hash as merkle_root_from_ids, so both agree on the same leaves.
+# Both make one SHA-256 call per leaf and per node; rendering every row's
+# contents on top of that makes a single-process build ~1.5x slower than the
+# id-only root (benchmarks/bench_merkle.py), which ingest offsets by hashing
+# leaves on its process pool when there is more than one CPU.
+# --------------------------------------------------
+DIGEST = 32
+ROW_COLUMNS = ['invoiceno', 'stockcode', 'description', 'quantity',
+               'invoicedate', 'price', 'customerid', 'country', 'sales']
+_FLOAT_COLUMNS = {'quantity', 'price', 'sales'}
+_MAGIC = b'CFMERKLE1'
+
+
+def _arrow_table(df):
+    if isinstance(df, pa.Table):
+        return df
+    cols = {}
+    for c in ROW_COLUMNS:
+        if c not in df.columns:
+            continue
+        s = df[c]
+        if s.dtype == object:
+            # raw cleaned chunks can mix str and int (e.g. stockcode)
+            s = s.astype(str).where(s.notna(), None)
+        cols[c] = s
+    return pa.Table.from_pandas(pd.DataFrame(cols), preserve_index=False)
+
+
+def canonical_rows(df):
+    """One utf-8 string per row, independent of the frame's in-memory dtypes.
+
+    Accepts a DataFrame (raw cleaned or compact) or the Arrow table written
+    to the store. Numbers are rendered at float32 precision (what the
+    compact schema keeps), dates as epoch nanoseconds and missing values as
+    ''.
+    """
+    table = _arrow_table(df)
+    parts = []
+    for c in ROW_COLUMNS:
+        if c not in table.column_names:
+            continue
+        arr = table.column(c)
+        if c == 'invoicedate':
+            arr = pc.cast(pc.cast(arr, pa.timestamp('ns')), pa.int64())
+        elif c in _FLOAT_COLUMNS:
+            arr = pc.cast(arr, pa.float32())
+        parts.append(pc.fill_null(pc.cast(arr, pa.string()), ''))
+    return pc.binary_join_element_wise(*parts, '\x1f').combine_chunks()
+
+
+def _leaf_digests(df):
+    rows = canonical_rows(df)
+    _, offsets, data = rows.buffers()
+    offsets = np.frombuffer(offsets, dtype=np.int32)[
+        rows.offset:rows.offset + len(rows) + 1].tolist()
+    data = memoryview(data) if data is not None else memoryview(b'')
+    sha = hashlib.sha256
+    # a list comprehension: ~25% faster than feeding join a generator
+    return b''.join([sha(data[start:end]).digest()
+                     for start, end in zip(offsets, offsets[1:])])
+
+
+@instrument('merkle.leaves')
+def row_leaf_hashes(df, executor=None, batch_rows=50_000):
+    """Leaf digests (n * 32 bytes) for the rows of df, in row order.
+
+    With an executor (e.g. a ProcessPoolExecutor) the rows are split into
+    batches of batch_rows and hashed in parallel.
+    """
+    table = _arrow_table(df)
+    if executor is None or len(table) <= batch_rows:
+        return _leaf_digests(table)
+    batches = [table.slice(i, batch_rows) for i in range(0, len(table), batch_rows)]
+    return b''.join(executor.map(_leaf_digests, batches))
+
+
+def _hash_pairs(level, first):
+    # parents of the nodes level[first:] (first is even), pairing an odd last
+    # node with itself; adjacent siblings are one contiguous 64-byte slice
+    sha = hashlib.sha256
+    view = memoryview(level)[first * DIGEST:]
+    pair = 2 * DIGEST
+    full = len(view) // pair * pair
+    out = [sha(view[i:i + pair]).digest() for i in range(0, full, pair)]
+    if full < len(view):
+        out.append(sha(bytes(view[full:]) * 2).digest())
+    return b''.join(out)
+
+
+class MerkleTree:
+    """Persistent Merkle tree over 32-byte leaf digests."""
+
+    def __init__(self, leaves=b''):
+        self.levels = [bytearray()]
+        if leaves:
+            self.extend(leaves)
+
+    def __len__(self):
+        return len(self.levels[0]) // DIGEST
+
+    @classmethod
+    def build(cls, leaves, executor=None, block_leaves=1 << 16):
+        """Build a tree from leaf digests, hashing subtrees in parallel.
+
+        Leaves are cut into aligned blocks of block_leaves (a power of two);
+        each block's subtree is independent of the others, so workers build
+        them and their levels are concatenated before hashing the top.
+        """
+        n = len(leaves) // DIGEST
+        if executor is None or n <= block_leaves:
+            return cls(leaves)
+        depth = block_leaves.bit_length() - 1
+        blocks = [leaves[i * DIGEST:(i + block_leaves) * DIGEST]
+                  for i in range(0, n, block_leaves)]
+        tree = cls()
+        tree.levels = [bytearray() for _ in range(depth + 1)]
+        for levels in executor.map(_subtree_levels, blocks):
+            # a short last block tops out early; above that its node keeps
+            # being paired with itself, exactly as in the full tree
+            while len(levels) < depth + 1:
+                levels.append(hashlib.sha256(levels[-1] * 2).digest())
+            for k, level in enumerate(levels):
+                tree.levels[k] += level
+        tree._rehash(depth, 0)
+        return tree
+
+    def extend(self, leaves):
+        """Append leaf digests; only the right edge of each level is rehashed."""
+        start = len(self)
+        self.levels[0] += leaves
+        self._rehash(0, start)
+        return self
+
+    def _rehash(self, k, start):
+        # recompute every parent of nodes >= start on level k, then upwards
+        while len(self.levels[k]) > DIGEST:
+            if k + 1 == len(self.levels):
+                self.levels.append(bytearray())
+            first = (start >> 1) << 1
+            up = self.levels[k + 1]
+            del up[(first >> 1) * DIGEST:]
+            up += _hash_pairs(self.levels[k], first)
+            start = first >> 1
+            k += 1
+
+    def root(self):
+        if not len(self):
+            return None
+        return hashlib.sha256(bytes(self.levels[-1][:DIGEST])).hexdigest()
+
+    def leaf(self, index):
+        return bytes(self.levels[0][index * DIGEST:(index + 1) * DIGEST])
+
+    def proof(self, index):
+        """Sibling path for leaf `index` as [(sibling_hex, 'left'|'right'), ...]."""
+        if not 0 <= index < len(self):
+            raise IndexError(f"leaf {index} out of range for {len(self)} leaves")
+        path = []
+        for level in self.levels[:-1]:
+            n = len(level) // DIGEST
+            sib = index ^ 1
+            if sib >= n:
+                sib = index
+            node = bytes(level[sib * DIGEST:(sib + 1) * DIGEST])
+            path.append((node.hex(), 'left' if sib < index else 'right'))
+            index >>= 1
+        return path
+
+    @staticmethod
+    def verify_proof(leaf_hex, proof, root_hex):
+        h = bytes.fromhex(leaf_hex)
+        for sib_hex, side in proof:
+            sib = bytes.fromhex(sib_hex)
+            h = hashlib.sha256(sib + h if side == 'left' else h + sib).digest()
+        return hashlib.sha256(h).hexdigest() == root_hex
+
+    def save(self, path):
+        tmp = path + '.tmp'
+        with open(tmp, 'wb') as f:
+            f.write(_MAGIC)
+            f.write(len(self.levels).to_bytes(4, 'little'))
+            for level in self.levels:
+                f.write(len(level).to_bytes(8, 'little'))
+                f.write(level)
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path):
+        tree = cls()
+        with open(path, 'rb') as f:
+            if f.read(len(_MAGIC)) != _MAGIC:
+                raise ValueError(f"{path} is not a Merkle tree file")
+            n_levels = int.from_bytes(f.read(4), 'little')
+            tree.levels = [bytearray(f.read(int.from_bytes(f.read(8), 'little')))
+                           for _ in range(n_levels)]
+        return tree
+
+
+def _subtree_levels(leaves):
+    return [bytes(level) for level in MerkleTree(leaves).levels]
+
+
+def _label_positions(s, label):
+    # rows equal to label; a categorical column compares its integer codes
+    # against the label's code instead of rendering every row as a string
+    if isinstance(s.dtype, pd.CategoricalDtype):
+        categories = s.cat.categories
+        if label not in categories:
+            return np.empty(0, dtype=np.int64)
+        return np.flatnonzero(s.cat.codes.to_numpy() == categories.get_loc(label))
+    return np.flatnonzero((s.astype(str) == label).to_numpy(dtype=bool))
+
+
+@instrument('merkle.invoice_proof', rows=lambda proof, *a, **k: len(proof['rows']))
+def invoice_proof(tree, df, invoiceno):
+    """Inclusion proofs for every row of one invoice against tree.root().
+
+    Each row's leaf is recomputed from its contents in df, not read back
+    from the tree, so a row edited since the tree was built fails: its
+    'match' (recomputed leaf == stored leaf) and 'verified' (the recomputed
+    leaf proves against the root) are False. 'verified' at the top level is
+    True only if every row verifies.
+    """
+    positions = _label_positions(df['invoiceno'], str(invoiceno))
+    leaves = row_leaf_hashes(df.iloc[positions]) if len(positions) else b''
+    root = tree.root()
+    rows = []
+    for i, pos in enumerate(positions.tolist()):
+        leaf = leaves[i * DIGEST:(i + 1) * DIGEST].hex()
+        if pos < len(tree):
+            stored, proof = tree.leaf(pos).hex(), tree.proof(pos)
+        else:
+            stored, proof = None, []
+        rows.append({'row': pos, 'leaf': leaf, 'stored_leaf': stored,
+                     'match': leaf == stored,
+                     'verified': MerkleTree.verify_proof(leaf, proof, root),
+                     'proof': proof})
+    return {'invoiceno': str(invoiceno), 'root': root, 'rows': rows,
+            'verified': bool(rows) and all(r['verified'] for r in rows)}
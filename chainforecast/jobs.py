@@ -0,0 +1,230 @@
+# Background job scheduler for model fits.
+#
+# Training and boom forecasts run in a process pool shared by every session
+# of the app, so a long fit neither blocks the Streamlit script thread nor
+# gets restarted by each widget touch, and concurrent users queue for a
+# bounded number of workers instead of each taking every CPU. Tabs submit a
+# job, keep its id in session state and poll for progress and the result.
+# Job functions receive a progress(done, total, message) callback; calling
+# it after cancel() raises JobCancelled inside the worker, so long jobs stop
+# at their next progress report (queued jobs are dropped straight away).
+# Stage metrics recorded inside a job travel back on the same event queue.
+# Jobs submitted with a key are single-flight: a session asking for work
+# another session already queued gets that job's id and shares its result.
+
+import itertools
+import multiprocessing
+import threading
+import time
+from concurrent.futures import CancelledError, ProcessPoolExecutor
+
+import pandas as pd
+
+from .batch import no_progress, run_boom_forecast
+from .forecasting import DEFAULT_SEASON, forecast_sarimax, forecast_xgb, sarimax_params
+from .ingest import DEFAULT_JOBS, DatasetCache
+from .metrics import METRICS, stage
+from .registry import ModelRegistry
+from .smoothing import SeasonalSmoothing
+
+QUEUED, RUNNING, DONE, FAILED, CANCELLED = (
+    'queued', 'running', 'done', 'failed', 'cancelled')
+FINISHED = (DONE, FAILED, CANCELLED)
+
+
+class JobCancelled(Exception):
+    pass
+
+
+class Job:
+    """State of one submitted job, as seen from the app process."""
+
+    def __init__(self, job_id, label, key=None):
+        self.id = job_id
+        self.label = label
+        self.key = key
+        self.state = QUEUED
+        self.done = 0
+        self.total = 0
+        self.message = ''
+        self.result = None
+        self.error = None
+        self.submitted = time.time()
+        self.started = None
+        self.finished = None
+        self.future = None
+
+    @property
+    def fraction(self):
+        return self.done / self.total if self.total else 0.0
+
+    @property
+    def seconds(self):
+        if self.started is None:
+            return 0.0
+        return (self.finished or time.time()) - self.started
+
+
+def _run_job(job_id, fn, args, kwargs, events, cancelled):
+    # runs in a pool worker; events carries (job_id, kind, payload) back
+    def progress(done, total, message=''):
+        if cancelled.get(job_id):
+            raise JobCancelled(job_id)
+        events.put((job_id, 'progress', (done, total, message)))
+
+    events.put((job_id, 'started', time.time()))
+    METRICS.forward = lambda sample: events.put((job_id, 'metric', sample))
+    try:
+        progress(0, 0)
+        with stage(f'job.{fn.__name__}'):
+            return fn(*args, progress=progress, **kwargs)
+    finally:
+        METRICS.forward = None
+
+
+class JobScheduler:
+    """Bounded process pool with a job table, progress and cancellation."""
+
+    def __init__(self, max_workers=DEFAULT_JOBS, keep=64):
+        self.keep = keep
+        self._pool = ProcessPoolExecutor(max_workers)
+        self._manager = multiprocessing.Manager()
+        self._events = self._manager.Queue()
+        self._cancelled = self._manager.dict()
+        self._jobs = {}
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        threading.Thread(target=self._drain, daemon=True).start()
+
+    def _drain(self):
+        while True:
+            try:
+                job_id, kind, payload = self._events.get()
+            except (EOFError, OSError):
+                return
+            if kind == 'metric':
+                METRICS.add(payload)
+                continue
+            job = self._jobs.get(job_id)
+            if job is None or job.state in FINISHED:
+                continue
+            if kind == 'started':
+                job.state, job.started = RUNNING, payload
+            else:
+                job.done, job.total, job.message = payload
+
+    def _finished(self, job, future):
+        job.finished = time.time()
+        job.started = job.started or job.finished
+        try:
+            job.result = future.result()
+            job.state = DONE
+        except (CancelledError, JobCancelled):
+            job.state = CANCELLED
+        except Exception as e:
+            job.state, job.error = FAILED, f"{type(e).__name__}: {e}"
+        self._cancelled.pop(job.id, None)
+        self._prune()
+
+    def _prune(self):
+        with self._lock:
+            finished = sorted((j for j in self._jobs.values() if j.state in FINISHED),
+                              key=lambda j: j.finished)
+            for job in finished[:max(0, len(finished) - self.keep)]:
+                del self._jobs[job.id]
+
+    def submit(self, fn, *args, label=None, key=None, **kwargs):
+        """Queue fn(*args, progress=..., **kwargs) and return its job id.
+
+        fn and its arguments must be picklable (module-level functions).
+        With a key, a queued or running job submitted under the same key
+        (e.g. by another session) is joined instead of starting a second one.
+        """
+        with self._lock:
+            if key is not None:
+                for job in self._jobs.values():
+                    if job.key == key and job.state not in FINISHED:
+                        return job.id
+            job = Job(next(self._ids), label or fn.__name__, key)
+            self._jobs[job.id] = job
+        job.future = self._pool.submit(_run_job, job.id, fn, args, kwargs,
+                                       self._events, self._cancelled)
+        job.future.add_done_callback(lambda f, job=job: self._finished(job, f))
+        return job.id
+
+    def get(self, job_id):
+        """The Job for job_id, or None once it has been pruned."""
+        return self._jobs.get(job_id)
+
+    def jobs(self):
+        return list(self._jobs.values())
+
+    def queued(self):
+        """Jobs waiting for or holding a worker, across all sessions."""
+        return sum(j.state in (QUEUED, RUNNING) for j in self.jobs())
+
+    def cancel(self, job_id):
+        job = self._jobs.get(job_id)
+        if job is None or job.state in FINISHED:
+            return False
+        if not job.future.cancel():
+            # already running: stop at the job's next progress report
+            self._cancelled[job_id] = True
+        return True
+
+    def shutdown(self):
+        for job in self.jobs():
+            self.cancel(job.id)
+        self._pool.shutdown(wait=True)
+        self._manager.shutdown()
+
+
+# ---- job functions (run in pool workers) ----
+
+_cubes = {}
+
+
+def _cached_cube(file_hash):
+    # workers are reused across jobs; keep the last cube they read
+    if file_hash not in _cubes:
+        _cubes.clear()
+        cube = DatasetCache().cube(file_hash)
+        if cube is None:
+            raise ValueError(f"dataset {file_hash} has no weekly cube in the cache")
+        _cubes[file_hash] = cube
+    return _cubes[file_hash]
+
+
+def product_forecast_job(product, file_hash, weekly, steps=4, season=DEFAULT_SEASON,
+                         progress=None):
+    """Fit (or load) SARIMAX and XGBoost for one product and forecast steps
+    weeks; returns the forecast frame the Forecasting tab plots, with the
+    short-term model that produced the SARIMAX column in
+    attrs['sarimax_backend']."""
+    progress = progress or no_progress
+    registry = ModelRegistry()
+    progress(0, 2, 'SARIMAX')
+    res = registry.sarimax(product, file_hash, weekly, sarimax_params(season))
+    sar_preds = forecast_sarimax(res, steps=steps)
+    progress(1, 2, 'XGBoost')
+    model, feats = registry.xgb(product, file_hash, weekly)
+    xgb_preds = forecast_xgb(model, weekly, feats, steps=steps)
+    progress(2, 2)
+    last_week = weekly['ds'].max()
+    forecast = pd.DataFrame({'ds': [last_week + pd.Timedelta(weeks=i + 1)
+                                    for i in range(steps)],
+                             'SARIMAX': sar_preds, 'XGBoost': xgb_preds})
+    forecast.attrs['sarimax_backend'] = (res.method if isinstance(res, SeasonalSmoothing)
+                                         else 'sarimax')
+    return forecast
+
+
+def boom_forecast_job(file_hash, products, horizon, mode, progress=None):
+    """run_boom_forecast over the dataset's weekly cube inside a pool worker.
+
+    The worker loads the small cached cube instead of receiving the frame,
+    and runs per-product fits serially: parallelism comes from the shared
+    pool, not from each job.
+    """
+    return run_boom_forecast(None, products, horizon=horizon, mode=mode, jobs=1,
+                             progress=progress, cube=_cached_cube(file_hash))
@@ -0,0 +1,83 @@
+# Headline KPIs and cohort retention from one grouped pass.
+#
+# The transactions are grouped once by (customer, invoice) into an order
+# table; total sales, customer and order counts, the repeat-purchase rate
+# and monthly cohort retention are all read off that much smaller table,
+# without merging per-customer aggregates back onto every row. The app
+# caches the result per dataset hash, so reruns cost nothing.
+
+import numpy as np
+import pandas as pd
+
+from .metrics import instrument
+
+
+def order_table(df):
+    """One row per (customerid, invoiceno): first/last timestamp and sales.
+
+    Rows without a customer keep a <NA> customerid so their sales still
+    count. Without an invoiceno column every row is its own order.
+    """
+    keys = ['customerid'] + (['invoiceno'] if 'invoiceno' in df.columns else [])
+    dates = df['invoicedate']
+    if keys == ['customerid']:
+        return pd.DataFrame({'customerid': df['customerid'].to_numpy(),
+                             'first': dates.to_numpy(), 'last': dates.to_numpy(),
+                             'sales': df['sales'].to_numpy(dtype=float)})
+    return df.groupby(keys, observed=True, dropna=False, sort=False).agg(
+        first=('invoicedate', 'min'), last=('invoicedate', 'max'),
+        sales=('sales', 'sum')).reset_index()
+
+
+def headline_kpis(orders):
+    """Total sales, unique customers, orders and repeat rate of an order table."""
+    known = orders[orders['customerid'].notna()]
+    per_customer = known.groupby('customerid', sort=False).agg(
+        first=('first', 'min'), last=('last', 'max'))
+    # a repeat customer bought again after their first purchase timestamp
+    repeat = per_customer['last'] > per_customer['first']
+    n_orders = (orders['invoiceno'].nunique() if 'invoiceno' in orders.columns
+                else len(orders))
+    return {'total_sales': float(orders['sales'].to_numpy(dtype=float).sum()),
+            'customers': int(len(per_customer)),
+            'orders': int(n_orders),
+            'repeat_rate': float(repeat.mean()) if len(repeat) else 0.0}
+
+
+def cohort_retention(orders):
+    """Share of each monthly cohort (month of first purchase) still buying
+    n months later: rows are cohorts, columns months since first purchase,
+    plus the cohort size in 'customers'."""
+    known = orders[orders['customerid'].notna()]
+    if known.empty:
+        return pd.DataFrame(columns=['customers'])
+    # months since 1970-01, the ordinal of a monthly Period
+    month = known['first'].to_numpy(dtype='datetime64[M]').astype(np.int64)
+    first = int(month.min())
+    span = int(month.max()) - first + 1
+    codes, _ = pd.factorize(known['customerid'])
+    # customer x month activity; the first active month is the cohort
+    active = np.bincount(codes * span + (month - first),
+                         minlength=(codes.max() + 1) * span).reshape(-1, span) > 0
+    cohort = active.argmax(axis=1)
+    customer, seen = np.nonzero(active)
+    counts = np.bincount(cohort[customer] * span + (seen - cohort[customer]),
+                         minlength=span * span).reshape(span, span)
+    sizes = counts[:, 0]
+    rows = np.flatnonzero(sizes)
+    share = counts[rows] / sizes[rows, None]
+    # months after the end of the data are unknown, not zero
+    share[np.arange(span)[None, :] > (span - 1 - rows)[:, None]] = np.nan
+    curves = pd.DataFrame(share,
+                          index=pd.PeriodIndex.from_ordinals(rows + first, freq='M')
+                          .rename('cohort'))
+    curves.columns.name = 'months_since_first'
+    curves.insert(0, 'customers', sizes[rows])
+    return curves
+
+
+@instrument('kpis')
+def compute_kpis(df):
+    """(headline KPI dict, cohort retention frame) from one grouped pass."""
+    orders = order_table(df)
+    return headline_kpis(orders), cohort_retention(orders)
@@ -0,0 +1,198 @@
+# Per-stage timing, memory and row-count metrics.
+#
+# Hot helpers (parsing, cleaning, Merkle hashing, RFM, KMeans, SARIMAX and
+# XGBoost fits/predicts, chart rendering) are wrapped with @instrument or a
+# `with stage(...)` block. Every call leaves one sample in the process-wide
+# METRICS registry: wall seconds, rows handled, change in resident memory
+# and the process's peak RSS, tagged with the current dataset. The app
+# shows p50/p95 per stage in a diagnostics panel and exports the samples as
+# JSON lines or Prometheus text. Samples recorded inside job-pool workers
+# are forwarded to the app process over the job event queue; with
+# CHAINFORECAST_METRICS_FILE set, every sample is also appended to that
+# JSON-lines file so latency can be charted across restarts and datasets.
+
+import functools
+import json
+import os
+import sys
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+import numpy as np
+import pandas as pd
+
+METRICS_FILE = os.environ.get("CHAINFORECAST_METRICS_FILE")
+QUANTILES = (0.5, 0.95)
+
+try:
+    import resource
+except ImportError:  # not on Windows
+    resource = None
+
+_PAGE = os.sysconf('SC_PAGE_SIZE') if hasattr(os, 'sysconf') else 4096
+
+
+def rss_bytes():
+    """Current resident set size of this process (0 if unknown)."""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * _PAGE
+    except (OSError, ValueError, IndexError):
+        return 0
+
+
+def peak_rss_bytes():
+    """Peak resident set size of this process so far (0 if unknown)."""
+    if resource is None:
+        return 0
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def count_rows(obj):
+    """len() of frames, series and arrays; None for anything else."""
+    if isinstance(obj, (pd.DataFrame, pd.Series, np.ndarray)):
+        return len(obj)
+    return None
+
+
+class Metrics:
+    """Thread-safe store of the last `keep` samples of every stage."""
+
+    def __init__(self, keep=1000, path=METRICS_FILE):
+        self.keep = keep
+        self.path = path
+        self.forward = None
+        self._local = threading.local()
+        self._samples = {}
+        self._lock = threading.Lock()
+
+    @property
+    def labels(self):
+        """Labels (e.g. dataset) added to samples from the current thread;
+        each Streamlit session runs its script in its own thread."""
+        if not hasattr(self._local, 'labels'):
+            self._local.labels = {}
+        return self._local.labels
+
+    @labels.setter
+    def labels(self, labels):
+        self._local.labels = dict(labels)
+
+    def add(self, sample):
+        if self.forward is not None:
+            # inside a job worker: the app process records it
+            self.forward(sample)
+            return
+        with self._lock:
+            self._samples.setdefault(sample['stage'], deque(maxlen=self.keep)).append(sample)
+            if self.path:
+                with open(self.path, 'a') as f:
+                    f.write(json.dumps(sample) + '\n')
+
+    def record(self, name, seconds, rows=None, rss_delta=0, **labels):
+        self.add(dict(self.labels, **labels, stage=name, ts=time.time(),
+                      seconds=round(seconds, 6),
+                      rows=None if rows is None else int(rows), rss_delta=int(rss_delta),
+                      peak_rss=peak_rss_bytes()))
+
+    def samples(self, name=None):
+        with self._lock:
+            if name is not None:
+                return list(self._samples.get(name, ()))
+            return [s for q in self._samples.values() for s in q]
+
+    def clear(self):
+        with self._lock:
+            self._samples.clear()
+
+    def summary(self):
+        """One row per stage: calls, p50/p95/mean/max seconds, rows and memory."""
+        rows = []
+        with self._lock:
+            items = [(name, list(q)) for name, q in self._samples.items()]
+        for name, samples in sorted(items):
+            secs = np.array([s['seconds'] for s in samples])
+            counts = [s['rows'] for s in samples if s['rows'] is not None]
+            rows.append({'stage': name, 'calls': len(secs),
+                         'p50_s': np.quantile(secs, 0.5), 'p95_s': np.quantile(secs, 0.95),
+                         'mean_s': secs.mean(), 'max_s': secs.max(),
+                         'last_rows': counts[-1] if counts else None,
+                         'rows_per_s': (sum(counts) / secs.sum()
+                                        if counts and secs.sum() > 0 else None),
+                         'max_rss_delta_mb': max(s['rss_delta'] for s in samples) / 2 ** 20,
+                         'peak_rss_mb': samples[-1]['peak_rss'] / 2 ** 20})
+        return pd.DataFrame(rows, columns=[
+            'stage', 'calls', 'p50_s', 'p95_s', 'mean_s', 'max_s', 'last_rows',
+            'rows_per_s', 'max_rss_delta_mb', 'peak_rss_mb'])
+
+    def jsonl(self):
+        """Every retained sample as JSON lines, oldest first."""
+        samples = sorted(self.samples(), key=lambda s: s['ts'])
+        return ''.join(json.dumps(s) + '\n' for s in samples)
+
+    def prometheus(self, prefix='chainforecast_stage'):
+        """Prometheus text exposition: a seconds summary with p50/p95
+        quantiles, a rows counter and the peak RSS gauge."""
+        lines = [f"# HELP {prefix}_seconds Wall time per call of a pipeline stage.",
+                 f"# TYPE {prefix}_seconds summary"]
+        rows = [f"# HELP {prefix}_rows_total Rows processed by a pipeline stage.",
+                f"# TYPE {prefix}_rows_total counter"]
+        with self._lock:
+            items = [(name, list(q)) for name, q in sorted(self._samples.items())]
+        for name, samples in items:
+            secs = np.array([s['seconds'] for s in samples])
+            label = f'stage="{name}"'
+            for q in QUANTILES:
+                lines.append(f'{prefix}_seconds{{{label},quantile="{q}"}} '
+                             f'{np.quantile(secs, q):.6f}')
+            lines.append(f'{prefix}_seconds_sum{{{label}}} {secs.sum():.6f}')
+            lines.append(f'{prefix}_seconds_count{{{label}}} {len(secs)}')
+            rows.append(f'{prefix}_rows_total{{{label}}} '
+                        f'{sum(s["rows"] or 0 for s in samples)}')
+        lines += rows
+        lines += ["# HELP chainforecast_peak_rss_bytes Peak resident memory of the process.",
+                  "# TYPE chainforecast_peak_rss_bytes gauge",
+                  f"chainforecast_peak_rss_bytes {peak_rss_bytes()}"]
+        return '\n'.join(lines) + '\n'
+
+
+METRICS = Metrics()
+
+
+@contextmanager
+def stage(name, rows=None, metrics=None):
+    """Time the with-block as one sample of stage name.
+
+    Yields a dict; set its 'rows' key inside the block when the row count
+    is only known afterwards.
+    """
+    info = {'rows': rows}
+    rss = rss_bytes()
+    t = time.perf_counter()
+    try:
+        yield info
+    finally:
+        (metrics or METRICS).record(name, time.perf_counter() - t, info['rows'],
+                                    rss_bytes() - rss)
+
+
+def instrument(name, rows=None):
+    """Decorator recording every call of the function as stage name.
+
+    rows(result, *args, **kwargs) gives the row count; by default it is the
+    length of the first argument when that is a frame, series or array.
+    """
+    def wrap(fn):
+        @functools.wraps(fn)
+        def timed(*args, **kwargs):
+            with stage(name) as info:
+                result = fn(*args, **kwargs)
+                info['rows'] = (rows(result, *args, **kwargs) if rows is not None
+                                else count_rows(args[0]) if args else None)
+            return result
+        return timed
+    return wrap
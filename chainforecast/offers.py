@@ -0,0 +1,243 @@
+# Persistent CRM offers: a discount and coupon per segment, and the offer
+# assigned to every customer.
+#
+# Offers live in a SQLite file next to the dataset cache (not subject to
+# its LRU eviction). apply_segments() pushes the segment offers to every
+# customer of a segmentation in one transaction: the (customerid, segment)
+# pairs are bulk-inserted into a temporary table in batches, then joined to
+# the offers table by a single INSERT ... SELECT ... ON CONFLICT upsert, so
+# half a million customers cost one statement rather than one per row. The
+# pairs are sorted by customerid first: the upsert then walks the primary
+# key in order instead of seeking at random.
+# Coupons assigned to a single customer by hand are kept through later
+# bulk runs. customerid is the assignments table's primary key, so profile
+# lookups are index seeks; exports stream the table in batches.
+
+import io
+import os
+import sqlite3
+import time
+from contextlib import contextmanager
+
+import pandas as pd
+import pyarrow as pa
+
+from .ingest import DEFAULT_CACHE_DIR
+from .metrics import instrument
+
+BATCH_ROWS = 50_000
+DEFAULT_DISCOUNT = 10
+COLUMNS = ['customerid', 'segment', 'discount_pct', 'coupon', 'manual', 'dataset',
+           'assigned']
+ARROW_SCHEMA = pa.schema([
+    ('customerid', pa.string()), ('segment', pa.string()), ('discount_pct', pa.int64()),
+    ('coupon', pa.string()), ('manual', pa.int64()), ('dataset', pa.string()),
+    ('assigned', pa.float64())])
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS offers (
+    segment TEXT PRIMARY KEY,
+    discount_pct INTEGER NOT NULL,
+    coupon TEXT NOT NULL,
+    updated REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS assignments (
+    customerid TEXT PRIMARY KEY,
+    segment TEXT,
+    discount_pct INTEGER NOT NULL,
+    coupon TEXT NOT NULL,
+    manual INTEGER NOT NULL DEFAULT 0,
+    dataset TEXT,
+    assigned REAL NOT NULL
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS assignments_segment ON assignments (segment);
+"""
+
+
+def default_offer(segment):
+    """The offer a segment gets until one is saved for it."""
+    return {'discount_pct': DEFAULT_DISCOUNT,
+            'coupon': f'{segment}_{DEFAULT_DISCOUNT}OFF'}
+
+
+class OfferStore:
+    """SQLite store of segment offers and per-customer coupon assignments."""
+
+    def __init__(self, root=DEFAULT_CACHE_DIR, name='offers.sqlite'):
+        os.makedirs(root, exist_ok=True)
+        self.path = os.path.join(root, name)
+        with self._connect() as con:
+            # readers (other sessions) are not blocked while a bulk run writes
+            con.execute("PRAGMA journal_mode=WAL")
+            con.executescript(SCHEMA)
+
+    @contextmanager
+    def _connect(self):
+        # one short-lived connection per call: sessions run in their own
+        # threads and sqlite3 connections are not shared across threads
+        con = sqlite3.connect(self.path, timeout=30)
+        try:
+            con.execute("PRAGMA synchronous=NORMAL")
+            with con:
+                yield con
+        finally:
+            con.close()
+
+    # ---- segment offers ----
+
+    def offer(self, segment):
+        """{'discount_pct', 'coupon'} of a segment (the default if unset)."""
+        with self._connect() as con:
+            row = con.execute("SELECT discount_pct, coupon FROM offers WHERE segment = ?",
+                              (str(segment),)).fetchone()
+        if row is None:
+            return default_offer(segment)
+        return {'discount_pct': row[0], 'coupon': row[1]}
+
+    def offers(self):
+        with self._connect() as con:
+            return pd.read_sql_query(
+                "SELECT segment, discount_pct, coupon FROM offers ORDER BY segment", con)
+
+    def set_offer(self, segment, discount_pct, coupon, propagate=True):
+        """Save a segment's offer; with propagate, customers already assigned
+        to the segment (except manual coupons) get it too. Returns how many
+        assignments changed."""
+        now = time.time()
+        with self._connect() as con:
+            con.execute(
+                "INSERT INTO offers VALUES (?, ?, ?, ?) ON CONFLICT(segment) DO UPDATE SET "
+                "discount_pct = excluded.discount_pct, coupon = excluded.coupon, "
+                "updated = excluded.updated",
+                (str(segment), int(discount_pct), str(coupon), now))
+            if not propagate:
+                return 0
+            return con.execute(
+                "UPDATE assignments SET discount_pct = ?, coupon = ?, assigned = ? "
+                "WHERE segment = ? AND manual = 0",
+                (int(discount_pct), str(coupon), now, str(segment))).rowcount
+
+    # ---- customer assignments ----
+
+    @instrument('offers.apply_segments', rows=lambda n, self, segments, *a, **k: len(segments))
+    def apply_segments(self, segments, dataset=None, batch_rows=BATCH_ROWS):
+        """Assign every customer of a segmentation its segment's offer.
+
+        segments is the segmentation_kmeans output (customerid and
+        segment_label columns). Segments without a saved offer get the
+        default one. Manually assigned coupons keep their offer but move to
+        the customer's new segment. Returns the number of customers written.
+        """
+        pairs = pd.DataFrame({
+            'customerid': segments['customerid'].astype(str).to_numpy(),
+            'segment': segments['segment_label'].astype(str).to_numpy()})
+        pairs = pairs.drop_duplicates('customerid', keep='last').sort_values('customerid')
+        ids, labels = pairs['customerid'].tolist(), pairs['segment'].tolist()
+        now = time.time()
+        with self._connect() as con:
+            con.execute("PRAGMA temp_store=MEMORY")
+            con.execute("CREATE TEMP TABLE incoming (customerid TEXT, segment TEXT)")
+            con.executemany(
+                "INSERT OR IGNORE INTO offers VALUES (?, ?, ?, ?)",
+                [(s, o['discount_pct'], o['coupon'], now)
+                 for s, o in ((s, default_offer(s)) for s in sorted(set(labels)))])
+            for i in range(0, len(ids), batch_rows):
+                con.executemany("INSERT INTO incoming VALUES (?, ?)",
+                                zip(ids[i:i + batch_rows], labels[i:i + batch_rows]))
+            written = con.execute(
+                "INSERT INTO assignments "
+                "(customerid, segment, discount_pct, coupon, manual, dataset, assigned) "
+                "SELECT i.customerid, i.segment, o.discount_pct, o.coupon, 0, ?, ? "
+                # CROSS JOIN keeps incoming (in customerid order) the outer loop
+                "FROM incoming i CROSS JOIN offers o ON o.segment = i.segment WHERE true "
+                "ON CONFLICT(customerid) DO UPDATE SET "
+                "segment = excluded.segment, dataset = excluded.dataset, "
+                "assigned = excluded.assigned, "
+                "discount_pct = CASE WHEN assignments.manual THEN assignments.discount_pct "
+                "ELSE excluded.discount_pct END, "
+                "coupon = CASE WHEN assignments.manual THEN assignments.coupon ELSE excluded.coupon END",
+                (dataset, now)).rowcount
+            con.execute("DROP TABLE incoming")
+        return written
+
+    def assign(self, customerid, discount_pct, coupon, segment=None):
+        """Give one customer their own coupon, kept through bulk runs."""
+        with self._connect() as con:
+            con.execute(
+                "INSERT INTO assignments "
+                "(customerid, segment, discount_pct, coupon, manual, assigned) "
+                "VALUES (?, ?, ?, ?, 1, ?) ON CONFLICT(customerid) DO UPDATE SET "
+                "segment = COALESCE(excluded.segment, assignments.segment), "
+                "discount_pct = excluded.discount_pct, coupon = excluded.coupon, "
+                "manual = 1, assigned = excluded.assigned",
+                (str(customerid), segment, int(discount_pct), str(coupon), time.time()))
+
+    def unassign(self, customerid):
+        """Drop a customer's manual coupon; the next bulk run reassigns them."""
+        with self._connect() as con:
+            return con.execute("UPDATE assignments SET manual = 0 WHERE customerid = ?",
+                               (str(customerid),)).rowcount
+
+    def lookup(self, customerid):
+        """The customer's assignment as a dict, or None."""
+        with self._connect() as con:
+            row = con.execute(f"SELECT {', '.join(COLUMNS)} FROM assignments "
+                              "WHERE customerid = ?", (str(customerid),)).fetchone()
+        return None if row is None else dict(zip(COLUMNS, row))
+
+    def lookup_many(self, customerids):
+        """Assignments of several customers (missing ones are left out)."""
+        ids = [str(c) for c in customerids]
+        frames = []
+        with self._connect() as con:
+            # stay under SQLite's bound-parameter limit
+            for i in range(0, len(ids), 900):
+                chunk = ids[i:i + 900]
+                frames.append(pd.read_sql_query(
+                    f"SELECT {', '.join(COLUMNS)} FROM assignments WHERE customerid IN "
+                    f"({', '.join('?' * len(chunk))})", con, params=chunk))
+        return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=COLUMNS)
+
+    def summary(self):
+        """Customers and manual coupons per segment, with the segment offer."""
+        with self._connect() as con:
+            return pd.read_sql_query(
+                "SELECT a.segment, COUNT(*) AS customers, SUM(a.manual) AS manual, "
+                "o.discount_pct, o.coupon FROM assignments a "
+                "LEFT JOIN offers o ON o.segment = a.segment "
+                "GROUP BY a.segment ORDER BY a.segment", con)
+
+    # ---- export ----
+
+    def _batches(self, batch_rows):
+        with self._connect() as con:
+            cur = con.execute(f"SELECT {', '.join(COLUMNS)} FROM assignments "
+                              "ORDER BY customerid")
+            while True:
+                rows = cur.fetchmany(batch_rows)
+                if not rows:
+                    return
+                yield pa.RecordBatch.from_arrays(
+                    [pa.array(col, type=ARROW_SCHEMA.field(i).type)
+                     for i, col in enumerate(zip(*rows))], schema=ARROW_SCHEMA)
+
+    def iter_assignments(self, batch_rows=BATCH_ROWS):
+        """The assignments table in customerid order, batch_rows at a time."""
+        for batch in self._batches(batch_rows):
+            yield batch.to_pandas()
+
+    @instrument('offers.export')
+    def export(self, fmt='csv', batch_rows=BATCH_ROWS):
+        """Every assignment as CSV or Parquet bytes, written batch by batch."""
+        import pyarrow.csv as pcsv
+        import pyarrow.parquet as pq
+
+        if fmt not in ('csv', 'parquet'):
+            raise ValueError(f"fmt must be 'csv' or 'parquet', not {fmt!r}")
+        buf = io.BytesIO()
+        writer = (pcsv.CSVWriter(buf, ARROW_SCHEMA) if fmt == 'csv'
+                  else pq.ParquetWriter(buf, ARROW_SCHEMA))
+        with writer:
+            for batch in self._batches(batch_rows):
+                writer.write_batch(batch)
+        return buf.getvalue()
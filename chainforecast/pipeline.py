@@ -0,0 +1,194 @@
+# Headless batch pipeline: ingest a dataset, forecast every product, score
+# every customer and write the results to Parquet, without Streamlit.
+#
+#   from chainforecast.pipeline import run_pipeline
+#   run_pipeline('online_retail.xlsx', 'out/', horizon=8, jobs=8)
+#
+# The same steps the app runs interactively, reusing the on-disk caches
+# (cleaned Parquet, weekly cube, segmentation artifact), so a nightly run on
+# an unchanged file skips straight to forecasting. Daily files passed as
+# appends are merged into the cached dataset one by one (see
+# ingest.append_delta), so a nightly run only cleans the new day. With
+# sarimax=True every forecastable product also gets a short-term SARIMAX
+# forecast, fitted in parallel and warm-started through the model registry.
+# With offers=True every customer is assigned their segment's offer in the
+# offer store next to the cache (see offers.py) in one bulk write.
+
+import json
+import os
+import time
+
+import pandas as pd
+
+from .batch import run_boom_forecast
+from .forecasting import DEFAULT_SEASON, forecast_sarimax, sarimax_params
+from .ingest import DEFAULT_JOBS, DatasetCache, append_delta, ingest
+from .integrity import compute_hash_file
+from .kpis import compute_kpis
+from .metrics import METRICS
+from .segments import SegmentCache
+
+OUTPUTS = ('forecasts', 'boom', 'rfm', 'segments', 'top_products', 'cohorts')
+
+
+def _forecast_rows(boom, cube):
+    ok = boom[boom['status'] == 'ok']
+    if ok.empty:
+        return pd.DataFrame(columns=['product', 'step', 'ds', 'yhat'])
+    panel, _ = cube.panel(ok['product'])
+    last = panel.groupby('product')['ds'].max()
+    long = ok[['product', 'forecast']].explode('forecast', ignore_index=True)
+    long['step'] = long.groupby('product').cumcount() + 1
+    long['ds'] = long['product'].map(last) + pd.to_timedelta(long['step'] * 7, unit='D')
+    return long.rename(columns={'forecast': 'yhat'}).astype({'yhat': float})[
+        ['product', 'step', 'ds', 'yhat']]
+
+
+def _sarimax_rows(registry, file_hash, cube, products, horizon, season, jobs):
+    if not len(products):
+        return pd.DataFrame(columns=['product', 'step', 'ds', 'yhat', 'backend', 'warm'])
+    panel, _ = cube.panel(products)
+    weeklies = {p: w[['ds', 'y']].reset_index(drop=True)
+                for p, w in panel.groupby('product', sort=False)}
+    fits = registry.sarimax_many(weeklies, file_hash, sarimax_params(season), jobs=jobs)
+    rows = []
+    for product, (model, meta) in fits.items():
+        last = weeklies[product]['ds'].max()
+        for step, yhat in enumerate(forecast_sarimax(model, steps=horizon), 1):
+            rows.append((product, step, last + pd.Timedelta(weeks=step), float(yhat),
+                         meta.get('method', meta['backend']), bool(meta.get('warm'))))
+    return pd.DataFrame(rows, columns=['product', 'step', 'ds', 'yhat', 'backend', 'warm'])
+
+
+def segment_summary(rfm):
+    """One row per segment: size and mean recency/frequency/monetary."""
+    return rfm.groupby('segment_label').agg(
+        customers=('customerid', 'size'), recency=('recency', 'mean'),
+        frequency=('frequency', 'mean'), monetary=('monetary', 'mean'),
+        total_monetary=('monetary', 'sum')).reset_index()
+
+
+def run_pipeline(source, out_dir, horizon=4, mode='global', jobs=DEFAULT_JOBS,
+                 products=None, top_days=60, cache=None, log=None, appends=(),
+                 sarimax=False, season=DEFAULT_SEASON, offers=False):
+    """Run ingest -> forecasts -> RFM/segments -> top products -> KPIs.
+
+    source is a CSV/XLSX path. Writes forecasts.parquet (product, step, ds,
+    yhat), boom.parquet (per-product growth summary with status/reason),
+    rfm.parquet (per-customer RFM and segment), segments.parquet (segment
+    profile), top_products.parquet and cohorts.parquet (monthly cohort
+    retention) to out_dir, plus manifest.json with the dataset hash, the
+    headline KPIs and per-stage seconds, and metrics.jsonl with the
+    instrumented helpers' samples (see metrics.METRICS). products limits forecasting to
+    a list of product keys (default: every product). jobs is used for
+    ingest hashing and, with mode='per_product', for the model fits.
+    appends are CSV/XLSX paths of new transactions appended to source in
+    order; their hash chain is recorded in the manifest. sarimax adds
+    sarimax.parquet (product, step, ds, yhat, backend, warm) for every
+    product the boom forecast could score, with a seasonal period of season
+    weeks; backend is 'sarimax' or the smoothing model it fell back to.
+    offers assigns every customer their segment's saved offer (or the
+    default one) in the offer store and exports the whole assignment table
+    to offers.parquet.
+    Returns the manifest dict.
+    """
+    log = log or (lambda msg: None)
+    cache = cache if cache is not None else DatasetCache()
+    os.makedirs(out_dir, exist_ok=True)
+    timings = {}
+    t = time.perf_counter()
+
+    def stage(name):
+        nonlocal t
+        now = time.perf_counter()
+        timings[name] = round(now - t, 3)
+        log(f"{name}: {timings[name]:.2f}s")
+        t = now
+
+    # hash first, as the app does, so an unchanged file is never re-read
+    meta = ingest(os.path.basename(source), source, cache,
+                  file_hash=compute_hash_file(source), jobs=jobs)
+    file_hash = meta['file_hash']
+    segments = SegmentCache(os.path.dirname(cache.root), cache.max_bytes)
+    for path in appends:
+        meta, delta = append_delta(os.path.basename(path), path, cache, file_hash,
+                                   delta_hash=compute_hash_file(path), jobs=jobs)
+        if delta is not None:
+            # move the parent's segmentation forward instead of refitting
+            segments.refresh(file_hash, meta['file_hash'], delta)
+        file_hash = meta['file_hash']
+    df = cache.get(file_hash)
+    if df is None:
+        raise ValueError(f"cached dataset {file_hash} is unreadable")
+    cube = cache.cube(file_hash)
+    if cube is None:
+        from .cube import WeeklyCube
+        cube = WeeklyCube.from_frame(df)
+        cache.save_cube(file_hash, cube)
+    stage('ingest')
+
+    wanted = cube.keys() if products is None else [str(p) for p in products]
+    boom = run_boom_forecast(None, wanted, horizon=horizon, mode=mode, jobs=jobs,
+                             cube=cube, with_forecast=True)
+    frames = {'forecasts': _forecast_rows(boom, cube),
+              'boom': boom.drop(columns='forecast')}
+    stage('forecast')
+
+    if sarimax:
+        from .registry import ModelRegistry
+        registry = ModelRegistry(os.path.dirname(cache.root), cache.max_bytes)
+        frames['sarimax'] = _sarimax_rows(
+            registry, file_hash, cube, boom.loc[boom['status'] == 'ok', 'product'].tolist(),
+            horizon, season, jobs)
+        stage('sarimax')
+
+    rfm = segments.load_or_fit(file_hash, df).table()
+    rfm['customerid'] = rfm['customerid'].astype(str)
+    frames['rfm'] = rfm
+    frames['segments'] = segment_summary(rfm)
+    stage('segments')
+
+    if offers:
+        from .offers import OfferStore
+        offer_store = OfferStore(os.path.dirname(cache.root))
+        assigned = offer_store.apply_segments(rfm, dataset=file_hash)
+        with open(os.path.join(out_dir, 'offers.parquet'), 'wb') as f:
+            f.write(offer_store.export('parquet'))
+        stage('offers')
+
+    daily = cache.daily(file_hash)
+    if daily is None:
+        from .daily import DailySales
+        daily = DailySales.from_frame(df)
+        cache.save_daily(file_hash, daily)
+    frames['top_products'] = daily.top(0, days=top_days)
+    stage('top_products')
+
+    kpis, cohorts = compute_kpis(df)
+    cohorts = cohorts.rename(columns=str).reset_index()
+    cohorts['cohort'] = cohorts['cohort'].astype(str)
+    frames['cohorts'] = cohorts
+    stage('kpis')
+
+    paths = {}
+    for name in OUTPUTS + (('sarimax',) if sarimax else ()):
+        paths[name] = os.path.join(out_dir, f"{name}.parquet")
+        frames[name].to_parquet(paths[name], index=False)
+    if offers:
+        paths['offers'] = os.path.join(out_dir, 'offers.parquet')
+    stage('write')
+
+    manifest = {'source': source, 'file_hash': file_hash, 'rows': meta['rows'],
+                'merkle_root': meta.get('merkle_root'), 'chain': meta.get('chain', []),
+                'horizon': horizon,
+                'mode': mode, 'jobs': jobs, 'products': len(wanted),
+                'season': season if sarimax else None,
+                'offers_assigned': assigned if offers else None,
+                'forecast_ok': int((boom['status'] == 'ok').sum()),
+                'customers': len(rfm), 'kpis': kpis, 'outputs': paths, 'seconds': timings}
+    with open(os.path.join(out_dir, 'manifest.json'), 'w') as f:
+        json.dump(manifest, f, indent=2)
+    # per-helper samples of this run, for charting p50/p95 across runs
+    with open(os.path.join(out_dir, 'metrics.jsonl'), 'w') as f:
+        f.write(METRICS.jsonl())
+    return manifest
@@ -0,0 +1,119 @@
+# Product index: stockcode -> row positions and description substring search.
+#
+# Built once per dataset (the app caches it by file hash) so the Forecasting
+# and Product Boom tabs never scan the whole frame with astype(str) / regex
+# masks: a query resolves to stockcodes and descriptions, which the weekly
+# cube maps to its products. Row positions are slices of a single stable
+# argsort; description search runs over the unique descriptions through a
+# trigram index.
+
+import bisect
+
+import numpy as np
+import pandas as pd
+
+
+def grouped_positions(s):
+    """(labels, codes, order, bounds): rows of labels[i] are
+    order[bounds[i]:bounds[i+1]] and codes[row] is the label id of a row."""
+    cat = s if isinstance(s.dtype, pd.CategoricalDtype) else s.astype('category')
+    codes = cat.cat.codes.to_numpy()
+    order = np.argsort(codes, kind='stable')
+    # missing values (code -1) sort first and are skipped by the bounds
+    bounds = np.searchsorted(codes[order], np.arange(len(cat.cat.categories) + 1))
+    return [str(c) for c in cat.cat.categories], codes, order, bounds
+
+
+_EMPTY = ([], np.empty(0, dtype=np.int8), np.empty(0, dtype=np.int64),
+          np.zeros(1, dtype=np.int64))
+
+
+def _trigrams(text):
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+class ProductIndex:
+    """Row positions by stockcode and case-insensitive description search."""
+
+    def __init__(self, df):
+        self.n_rows = len(df)
+        self.codes, self._code_codes, self._code_order, self._code_bounds = (
+            grouped_positions(df['stockcode']) if 'stockcode' in df.columns
+            else _EMPTY)
+        self._code_id = {c: i for i, c in enumerate(self.codes)}
+        self.descriptions, self._desc_codes, self._desc_order, self._desc_bounds = (
+            grouped_positions(df['description']) if 'description' in df.columns
+            else _EMPTY)
+        self._desc_id = {d: i for i, d in enumerate(self.descriptions)}
+        self._desc_lower = [d.lower() for d in self.descriptions]
+        postings = {}
+        for i, d in enumerate(self._desc_lower):
+            for g in _trigrams(d):
+                postings.setdefault(g, []).append(i)
+        self._postings = {g: np.array(ids) for g, ids in postings.items()}
+        self._sorted_codes = sorted(self.codes)
+        self._sorted_desc = sorted(zip(self._desc_lower, self.descriptions))
+
+    def _rows(self, order, bounds, i):
+        return order[bounds[i]:bounds[i + 1]]
+
+    def code_rows(self, stockcode):
+        i = self._code_id.get(str(stockcode))
+        if i is None:
+            return np.empty(0, dtype=np.int64)
+        return self._rows(self._code_order, self._code_bounds, i)
+
+    def description_rows(self, description):
+        i = self._desc_id.get(str(description))
+        if i is None:
+            return np.empty(0, dtype=np.int64)
+        return self._rows(self._desc_order, self._desc_bounds, i)
+
+    def search_descriptions(self, text):
+        """Ids of descriptions containing text (case-insensitive, literal)."""
+        text = str(text).lower()
+        if len(text) < 3:
+            return [i for i, d in enumerate(self._desc_lower) if text in d]
+        ids = None
+        for g in _trigrams(text):
+            posting = self._postings.get(g)
+            if posting is None:
+                return []
+            ids = posting if ids is None else np.intersect1d(ids, posting, assume_unique=True)
+        # trigrams can match out of order; confirm the candidates
+        return [i for i in ids.tolist() if text in self._desc_lower[i]]
+
+    def match(self, query):
+        """(stockcodes, descriptions) selected by a Forecasting-tab query:
+        the stockcode equal to it and every description containing it."""
+        query = str(query)
+        codes = [query] if query in self._code_id else []
+        return codes, [self.descriptions[i] for i in self.search_descriptions(query)]
+
+    def rows_for(self, products):
+        """Sorted row positions for a list of stockcodes."""
+        parts = [self.code_rows(p) for p in products]
+        return np.sort(np.concatenate(parts)) if parts else np.empty(0, dtype=np.int64)
+
+    def by_frequency(self):
+        """Stockcodes ordered by transaction count, most frequent first."""
+        counts = np.diff(self._code_bounds)
+        order = np.argsort(-counts, kind='stable')
+        return [self.codes[i] for i in order if counts[i] > 0]
+
+    def autocomplete(self, prefix, limit=10):
+        """Stockcodes and descriptions starting with prefix (case-insensitive
+        for descriptions)."""
+        out = []
+        i = bisect.bisect_left(self._sorted_codes, prefix)
+        while i < len(self._sorted_codes) and len(out) < limit \
+                and self._sorted_codes[i].startswith(prefix):
+            out.append(self._sorted_codes[i])
+            i += 1
+        lower = prefix.lower()
+        i = bisect.bisect_left(self._sorted_desc, (lower,))
+        while i < len(self._sorted_desc) and len(out) < limit \
+                and self._sorted_desc[i][0].startswith(lower):
+            out.append(self._sorted_desc[i][1])
+            i += 1
+        return out
@@ -0,0 +1,205 @@
+# On-disk registry of fitted forecasting models.
+#
+# Models are keyed by (product, dataset hash, model type, hyperparameters),
+# so a product forecast survives reruns, restarts and switching between
+# products: repeat forecasts cost a load + predict instead of a full fit.
+# XGBoost boosters are stored in their native UBJ format and SARIMAX results
+# are pickled with remove_data=True (the weekly series is re-attached on
+# load with res.apply). Files are only read when a model is asked for, a
+# few loaded models are kept in memory, and the directory is size-bounded
+# with the same LRU eviction as the dataset cache. Every SARIMAX fit also
+# leaves its fitted parameters under a (product, params) warm-start key, so
+# refitting after new weeks arrive (a new dataset hash) starts from there.
+# A fit that fell back to seasonal smoothing is stored like a SARIMAX one.
+
+import hashlib
+import json
+import os
+from collections import OrderedDict
+
+import numpy as np
+
+from .forecasting import (
+    SARIMAX_PARAMS, WARM_WEEKS, XGB_PARAMS, fit_sarimax, fit_sarimax_many,
+    train_xgb, xgb_regressor)
+from .ingest import DEFAULT_CACHE_DIR, DEFAULT_CACHE_MAX_BYTES, evict_lru
+from .smoothing import SeasonalSmoothing
+
+MODEL_EXT = {'sarimax': '.pkl', 'xgb': '.ubj'}
+
+
+def model_key(product, file_hash, model_type, params):
+    """Stable file stem for one (product, dataset, model type, params)."""
+    blob = json.dumps([str(product), file_hash, model_type, params],
+                      sort_keys=True, default=list)
+    return f"{model_type}-{hashlib.sha256(blob.encode()).hexdigest()[:40]}"
+
+
+def warm_key(product, params):
+    """File stem of the latest fitted SARIMAX parameters of a product."""
+    blob = json.dumps([str(product), params], sort_keys=True, default=list)
+    return f"warm-{hashlib.sha256(blob.encode()).hexdigest()[:40]}"
+
+
+class ModelRegistry:
+    """Size-bounded store of fitted SARIMAX / XGBoost models."""
+
+    SUFFIXES = ('.pkl', '.ubj', '.json')
+
+    def __init__(self, root=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_CACHE_MAX_BYTES,
+                 max_loaded=8):
+        self.root = os.path.join(root, 'models')
+        self.max_bytes = max_bytes
+        self.max_loaded = max_loaded
+        self._loaded = OrderedDict()
+        os.makedirs(self.root, exist_ok=True)
+
+    def _path(self, key, ext):
+        return os.path.join(self.root, key + ext)
+
+    def __contains__(self, key):
+        return key in self._loaded or os.path.exists(self._path(key, '.json'))
+
+    def has(self, product, file_hash, model_type, params):
+        return model_key(product, file_hash, model_type, params) in self
+
+    def _remember(self, key, entry):
+        self._loaded[key] = entry
+        self._loaded.move_to_end(key)
+        while len(self._loaded) > self.max_loaded:
+            self._loaded.popitem(last=False)
+        return entry
+
+    def _read(self, key):
+        model_type = key.split('-', 1)[0]
+        with open(self._path(key, '.json')) as f:
+            meta = json.load(f)
+        path = self._path(key, MODEL_EXT[model_type])
+        if model_type == 'xgb':
+            model = xgb_regressor()
+            model.load_model(path)
+        elif meta.get('backend') == SeasonalSmoothing.backend:
+            model = SeasonalSmoothing.load(path)
+        else:
+            from statsmodels.tsa.statespace.sarimax import SARIMAXResults
+            model = SARIMAXResults.load(path)
+        for ext in (MODEL_EXT[model_type], '.json'):
+            os.utime(self._path(key, ext))
+        return model, meta
+
+    def get(self, key):
+        """(model, meta) for key, loading it from disk on first use."""
+        if key in self._loaded:
+            self._loaded.move_to_end(key)
+            return self._loaded[key]
+        if key not in self:
+            return None
+        try:
+            entry = self._read(key)
+        except Exception:
+            # partial write or incompatible library version: refit instead
+            self.discard(key)
+            return None
+        return self._remember(key, entry)
+
+    def put(self, key, model, meta=None):
+        model_type = key.split('-', 1)[0]
+        path = self._path(key, MODEL_EXT[model_type])
+        tmp = path + '.tmp'
+        if model_type == 'xgb':
+            model.save_model(tmp + '.ubj')
+            os.replace(tmp + '.ubj', path)
+        else:
+            model.save(tmp, remove_data=True)
+            os.replace(tmp, path)
+        # the sidecar is written last; its presence marks a complete entry
+        with open(self._path(key, '.json'), 'w') as f:
+            json.dump(meta or {}, f)
+        entry = self._remember(key, (model, meta or {}))
+        self.evict()
+        return entry
+
+    def discard(self, key):
+        self._loaded.pop(key, None)
+        for ext in self.SUFFIXES:
+            path = self._path(key, ext)
+            if os.path.exists(path):
+                os.remove(path)
+
+    def evict(self):
+        evicted = evict_lru(self.root, self.max_bytes, self.SUFFIXES)
+        for key in evicted:
+            self._loaded.pop(key, None)
+        return evicted
+
+    def warm_start(self, product, params, n_obs):
+        """Parameters of the product's last SARIMAX fit if its series had
+        between n_obs - WARM_WEEKS and n_obs weeks, else None."""
+        path = self._path(warm_key(product, params), '.json')
+        try:
+            with open(path) as f:
+                warm = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if not 0 <= n_obs - warm['n_obs'] <= WARM_WEEKS:
+            return None
+        return warm['start_params']
+
+    def _put_sarimax(self, product, file_hash, weekly, params, model, info):
+        meta = dict(info, product=str(product), file_hash=file_hash, params=params,
+                    n_obs=len(weekly))
+        if info['backend'] == 'sarimax':
+            with open(self._path(warm_key(product, params), '.json'), 'w') as f:
+                json.dump({'n_obs': len(weekly),
+                           'start_params': np.asarray(model.params).tolist()}, f)
+        # saving with remove_data strips the fitted results in place
+        return self.put(model_key(product, file_hash, 'sarimax', params), model, meta)
+
+    def _attached(self, key, entry, weekly):
+        res, meta = entry
+        if meta.get('backend', 'sarimax') == 'sarimax' and res.model.endog is None:
+            # stored without data: re-attach the series, keeping the params
+            res = res.apply(weekly['y'])
+            self._remember(key, (res, meta))
+        return res
+
+    def sarimax(self, product, file_hash, weekly, params=SARIMAX_PARAMS):
+        """Fitted SARIMAX results for product (or the SeasonalSmoothing it
+        fell back to), trained only on a miss, warm-started when possible."""
+        key = model_key(product, file_hash, 'sarimax', params)
+        entry = self.get(key)
+        if entry is None:
+            model, info = fit_sarimax(
+                weekly, params, self.warm_start(product, params, len(weekly)))
+            entry = self._put_sarimax(product, file_hash, weekly, params, model, info)
+        return self._attached(key, entry, weekly)
+
+    def sarimax_many(self, weeklies, file_hash, params=SARIMAX_PARAMS, jobs=1):
+        """{product: (model, meta)} for a dict of weekly frames; products
+        missing from the registry are fitted together over jobs processes."""
+        missing = {p: w for p, w in weeklies.items()
+                   if not self.has(p, file_hash, 'sarimax', params)}
+        starts = {p: self.warm_start(p, params, len(w)) for p, w in missing.items()}
+        fits = fit_sarimax_many(missing, params, starts, jobs=jobs)
+        out = {}
+        for product, weekly in weeklies.items():
+            key = model_key(product, file_hash, 'sarimax', params)
+            if product in fits:
+                entry = self._put_sarimax(product, file_hash, weekly, params, *fits[product])
+            else:
+                entry = self.get(key) or self._put_sarimax(
+                    product, file_hash, weekly, params, *fit_sarimax(weekly, params))
+            out[product] = (self._attached(key, entry, weekly), entry[1])
+        return out
+
+    def xgb(self, product, file_hash, weekly, params=XGB_PARAMS):
+        """(model, feat_cols) for product, trained only on a miss."""
+        key = model_key(product, file_hash, 'xgb', params)
+        entry = self.get(key)
+        if entry is None:
+            model, feat_cols = train_xgb(weekly, params)
+            self.put(key, model, {'product': str(product), 'file_hash': file_hash,
+                                  'params': params, 'feat_cols': feat_cols})
+            return model, feat_cols
+        model, meta = entry
+        return model, meta['feat_cols']
@@ -0,0 +1,81 @@
+# Compact in-memory schema for the cleaned transaction frame.
+#
+# clean_record() leaves ids and labels as Python object strings; on retail
+# exports these dominate the frame's memory and make every groupby hash
+# strings. compact_frame() turns them into categoricals / nullable ints and
+# narrows the numeric columns.
+
+import pandas as pd
+
+CATEGORY_COLUMNS = ['invoiceno', 'stockcode', 'description', 'country']
+FLOAT32_COLUMNS = ['price', 'sales', 'totalprice']
+
+
+def _as_categorical(s):
+    if isinstance(s.dtype, pd.CategoricalDtype):
+        return s
+    return s.astype('category')
+
+
+def _customerid(s):
+    # integer-like ids ('13085') -> Int64, anything else stays categorical;
+    # parsing only touches the unique values, never every row
+    cat = _as_categorical(s)
+    cats = cat.cat.categories.astype(str)
+    nums = pd.to_numeric(pd.Series(cats), errors='coerce')
+    missing = pd.Series(cats).str.lower().isin(['nan', 'none', ''])
+    if not (nums.notna() | missing).all() or (nums.dropna() % 1 != 0).any():
+        return cat.cat.remove_unused_categories()
+    lookup = pd.array(nums, dtype='Int64')
+    # code -1 (missing) becomes <NA>
+    ids = lookup.take(cat.cat.codes.to_numpy(), allow_fill=True)
+    return pd.Series(ids, index=s.index, name=s.name)
+
+
+def _quantity(s):
+    s = pd.to_numeric(s, errors='coerce')
+    if s.notna().all() and (s % 1 == 0).all():
+        return pd.to_numeric(s.astype('int64'), downcast='integer')
+    return s.astype('float32')
+
+
+def compact_frame(df):
+    """Return df with the compact dtypes; columns it does not know are kept."""
+    df = df.copy()
+    for c in CATEGORY_COLUMNS:
+        if c in df.columns:
+            df[c] = _as_categorical(df[c])
+    if 'customerid' in df.columns:
+        df['customerid'] = _customerid(df['customerid'])
+    if 'quantity' in df.columns:
+        df['quantity'] = _quantity(df['quantity'])
+    for c in FLOAT32_COLUMNS:
+        if c in df.columns:
+            df[c] = df[c].astype('float32')
+    return df
+
+
+def parse_customerid(text, ids):
+    """Convert a typed-in customer id to the dtype of the ids column."""
+    text = str(text).strip()
+    if isinstance(ids.dtype, pd.CategoricalDtype):
+        return text
+    try:
+        value = float(text)
+    except ValueError:
+        return None
+    return int(value) if value.is_integer() else None
+
+
+def memory_usage(df):
+    """Deep per-column memory in bytes."""
+    return df.memory_usage(deep=True, index=False)
+
+
+def memory_report(before, after):
+    """Per-column before/after bytes table from two memory_usage() results."""
+    report = pd.DataFrame({'before_bytes': pd.Series(before),
+                           'after_bytes': pd.Series(after)})
+    report.loc['total'] = report.sum()
+    report['ratio'] = report['before_bytes'] / report['after_bytes']
+    return report
@@ -0,0 +1,193 @@
+# Persisted RFM + KMeans segmentation, one artifact per dataset hash.
+#
+# The RFM table and the fitted scaler/centroids are saved next to the
+# dataset cache, so reruns and restarts reload them instead of refitting,
+# and segment labels stay put between page views. When new transactions
+# arrive only the customers they touch are re-aggregated; everyone is then
+# assigned to the existing centroids (optionally moved by a count-weighted
+# update with the touched customers) instead of reclustering from scratch.
+
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from .analytics import customer_totals, rfm_scores, segment_labels
+from .ingest import DEFAULT_CACHE_DIR, DEFAULT_CACHE_MAX_BYTES, evict_lru
+from .metrics import instrument
+
+ARTIFACT_VERSION = 1
+N_CLUSTERS = 4
+RANDOM_STATE = 42
+
+
+class SegmentModel:
+    """Per-customer RFM totals plus a frozen scaler and KMeans centroids."""
+
+    def __init__(self, totals, snapshot, mean, scale, centroids, labels,
+                 segment):
+        # totals: index customerid, columns last_date, frequency, monetary
+        self.totals = totals
+        self.snapshot = pd.Timestamp(snapshot)
+        self.mean = np.asarray(mean, dtype=float)
+        self.scale = np.asarray(scale, dtype=float)
+        self.centroids = np.asarray(centroids, dtype=float)
+        self.labels = {int(k): v for k, v in labels.items()}
+        self.segment = np.asarray(segment, dtype=np.int64)
+
+    @classmethod
+    @instrument('segments.fit', rows=lambda model, cls, df, *a, **k: len(df))
+    def fit(cls, df, n_clusters=N_CLUSTERS, random_state=RANDOM_STATE):
+        # sklearn is only needed to fit, not to load a stored artifact
+        from sklearn.cluster import KMeans
+        from sklearn.preprocessing import StandardScaler
+
+        totals = customer_totals(df)
+        snapshot = totals['last_date'].max() + pd.Timedelta(days=1)
+        X = cls._features(totals, snapshot)
+        scaler = StandardScaler().fit(X)
+        km = KMeans(n_clusters=n_clusters, n_init=10,
+                    random_state=random_state).fit(scaler.transform(X))
+        return cls(totals, snapshot, scaler.mean_, scaler.scale_,
+                   km.cluster_centers_,
+                   segment_labels(km.labels_, totals['monetary'].to_numpy()),
+                   km.labels_)
+
+    @staticmethod
+    def _features(totals, snapshot):
+        recency = (snapshot - totals['last_date']).dt.days
+        return np.column_stack([recency.to_numpy(dtype=float),
+                                totals['frequency'].to_numpy(dtype=float),
+                                totals['monetary'].to_numpy(dtype=float)])
+
+    def assign(self, X):
+        """Nearest-centroid cluster id for each row of raw RFM features."""
+        Xs = (X - self.mean) / self.scale
+        dist = ((Xs[:, None, :] - self.centroids[None, :, :]) ** 2).sum(axis=2)
+        return dist.argmin(axis=1)
+
+    def table(self):
+        """Same columns as segmentation_kmeans(rfm_analysis(df))."""
+        rfm = pd.DataFrame(
+            {'recency': (self.snapshot - self.totals['last_date']).dt.days})
+        rfm['frequency'] = self.totals['frequency']
+        rfm['monetary'] = self.totals['monetary']
+        rfm = rfm_scores(rfm).reset_index()
+        rfm['segment'] = self.segment
+        rfm['segment_label'] = rfm['segment'].map(self.labels)
+        return rfm
+
+    @instrument('segments.refresh', rows=lambda model, self, delta, *a, **k: len(delta))
+    def refresh(self, delta, partial_fit=False):
+        """Fold new transactions into the model and return a new SegmentModel.
+
+        Only customers present in delta are re-aggregated. Centroids stay
+        fixed unless partial_fit, in which case each moves to the running
+        mean of its current members and the touched customers nearest to
+        it, (n_old * c + sum(x_delta)) / (n_old + n_delta), so a small
+        delta nudges a large cluster only a little; every customer is then
+        assigned to the nearest centroid under the original scaler.
+        """
+        new = customer_totals(delta)
+        totals = self.totals.copy()
+        seen = new.index.intersection(totals.index)
+        old = totals.loc[seen]
+        totals.loc[seen, 'last_date'] = np.maximum(old['last_date'],
+                                                   new.loc[seen, 'last_date'])
+        totals.loc[seen, 'frequency'] = old['frequency'] + new.loc[seen, 'frequency']
+        totals.loc[seen, 'monetary'] = old['monetary'] + new.loc[seen, 'monetary']
+        added = new.index.difference(totals.index)
+        if len(added):
+            totals = pd.concat([totals, new.loc[added]])
+        snapshot = max(self.snapshot,
+                       new['last_date'].max() + pd.Timedelta(days=1))
+        X = self._features(totals, snapshot)
+        centroids = self.centroids
+        if partial_fit:
+            k = len(centroids)
+            touched = X[totals.index.get_indexer(new.index)]
+            nearest = self.assign(touched)
+            n_old = np.bincount(self.segment, minlength=k).astype(float)
+            n_delta = np.bincount(nearest, minlength=k).astype(float)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, nearest, (touched - self.mean) / self.scale)
+            moved = n_delta > 0
+            centroids = centroids.copy()
+            centroids[moved] = ((n_old[moved, None] * centroids[moved] + sums[moved])
+                                / (n_old[moved] + n_delta[moved])[:, None])
+        model = SegmentModel(totals, snapshot, self.mean, self.scale, centroids,
+                             self.labels, np.zeros(len(totals), dtype=np.int64))
+        model.segment = model.assign(X)
+        return model
+
+    def save(self, stem):
+        self.totals.assign(segment=self.segment).to_parquet(stem + '.parquet')
+        with open(stem + '.json', 'w') as f:
+            json.dump({'version': ARTIFACT_VERSION,
+                       'snapshot': self.snapshot.isoformat(),
+                       'mean': self.mean.tolist(), 'scale': self.scale.tolist(),
+                       'centroids': self.centroids.tolist(),
+                       'labels': self.labels}, f)
+
+    @classmethod
+    def load(cls, stem):
+        with open(stem + '.json') as f:
+            meta = json.load(f)
+        if meta.get('version') != ARTIFACT_VERSION:
+            return None
+        totals = pd.read_parquet(stem + '.parquet')
+        return cls(totals.drop(columns='segment'), meta['snapshot'],
+                   meta['mean'], meta['scale'], meta['centroids'],
+                   meta['labels'], totals['segment'].to_numpy())
+
+
+class SegmentCache:
+    """Size-bounded store of SegmentModel artifacts keyed by dataset hash."""
+
+    SUFFIXES = ('.parquet', '.json')
+
+    def __init__(self, root=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_CACHE_MAX_BYTES):
+        self.root = os.path.join(root, 'segments')
+        self.max_bytes = max_bytes
+        os.makedirs(self.root, exist_ok=True)
+
+    def _stem(self, file_hash, n_clusters):
+        return os.path.join(self.root,
+                            f'{file_hash}-v{ARTIFACT_VERSION}-k{n_clusters}')
+
+    def get(self, file_hash, n_clusters=N_CLUSTERS):
+        stem = self._stem(file_hash, n_clusters)
+        if not all(os.path.exists(stem + ext) for ext in self.SUFFIXES):
+            return None
+        try:
+            model = SegmentModel.load(stem)
+        except Exception:
+            model = None
+        for ext in self.SUFFIXES:
+            if model is None:
+                os.remove(stem + ext)
+            else:
+                os.utime(stem + ext)
+        return model
+
+    def put(self, file_hash, model):
+        stem = self._stem(file_hash, len(model.centroids))
+        model.save(stem)
+        evict_lru(self.root, self.max_bytes, self.SUFFIXES)
+
+    def load_or_fit(self, file_hash, df, n_clusters=N_CLUSTERS):
+        model = self.get(file_hash, n_clusters)
+        if model is None:
+            model = SegmentModel.fit(df, n_clusters)
+            self.put(file_hash, model)
+        return model
+
+    def refresh(self, old_hash, new_hash, delta, partial_fit=False):
+        """Extend the artifact of old_hash with delta and store it as new_hash."""
+        model = self.get(old_hash)
+        if model is None:
+            return None
+        model = model.refresh(delta, partial_fit=partial_fit)
+        self.put(new_hash, model)
+        return model
@@ -0,0 +1,230 @@
+# Process-wide cache of dataset-derived artifacts, shared by every session.
+#
+# Streamlit runs each browser session's script in its own thread of one
+# server process, so the cleaned frame, weekly cube, RFM/segments, KPIs and
+# trained forecasts only need computing once per dataset hash and
+# parameters, whoever asks first. SharedCache keeps them in memory under an
+# explicit byte budget (CHAINFORECAST_SHARED_MAX_BYTES) and evicts the least
+# recently used entries past it. Lookups are single-flight: while one
+# session computes a key, every other session asking for it waits on the
+# same future instead of computing it again. Entry sizes are estimated by
+# walking the value (frames, arrays, containers, object attributes),
+# without charging an artifact for the inputs it was computed from.
+
+import functools
+import inspect
+import itertools
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+
+import numpy as np
+import pandas as pd
+
+from .metrics import stage
+
+SHARED_MAX_BYTES = int(os.environ.get(
+    "CHAINFORECAST_SHARED_MAX_BYTES", 1024 ** 3))
+SAMPLE = 64     # containers longer than this are sized from a sample
+
+
+def nbytes(obj, exclude=()):
+    """Estimated memory held by obj, in bytes.
+
+    Objects whose id() is in exclude (and everything only reachable
+    through them) are not counted.
+    """
+    seen = set(exclude)
+
+    def size(o):
+        if id(o) in seen:
+            return 0
+        seen.add(id(o))
+        if isinstance(o, (pd.DataFrame, pd.Series, pd.Index)):
+            usage = o.memory_usage(deep=True)
+            return int(usage.sum() if isinstance(o, pd.DataFrame) else usage)
+        if isinstance(o, np.ndarray):
+            return o.nbytes
+        if isinstance(o, (str, bytes, bytearray, int, float, bool, type(None))):
+            return sys.getsizeof(o)
+        if isinstance(o, dict):
+            items = list(itertools.islice(o.items(), SAMPLE))
+            part = sum(size(k) + size(v) for k, v in items)
+            return sys.getsizeof(o) + (part * len(o) // len(items) if items else 0)
+        if isinstance(o, (list, tuple, set, frozenset)):
+            items = list(itertools.islice(o, SAMPLE))
+            part = sum(size(v) for v in items)
+            return sys.getsizeof(o) + (part * len(o) // len(items) if items else 0)
+        attrs = getattr(o, '__dict__', None)
+        return sys.getsizeof(o) + (size(attrs) if attrs is not None else 0)
+
+    return size(obj)
+
+
+class _Entry:
+    __slots__ = ('value', 'nbytes', 'seconds', 'hits', 'created')
+
+    def __init__(self, value, nbytes, seconds):
+        self.value, self.nbytes, self.seconds = value, nbytes, seconds
+        self.hits, self.created = 0, time.time()
+
+
+class SharedCache:
+    """Thread-safe, byte-bounded LRU cache with single-flight computation.
+
+    Keys are tuples whose first item names the kind of artifact, e.g.
+    ('weekly_cube', file_hash).
+    """
+
+    def __init__(self, max_bytes=SHARED_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._inflight = {}
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.counts = {'hits': 0, 'misses': 0, 'waits': 0, 'evictions': 0,
+                       'oversize': 0}
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def __len__(self):
+        return len(self._entries)
+
+    @property
+    def nbytes(self):
+        return self._bytes
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return default
+            self._entries.move_to_end(key)
+            entry.hits += 1
+            self.counts['hits'] += 1
+            return entry.value
+
+    def get_or_compute(self, key, compute, size=None):
+        """Cached value of key, calling compute() on a miss.
+
+        Concurrent callers of a key being computed wait for that one call
+        and share its result, or its exception (failures are not cached).
+        If the computing thread is interrupted instead (a BaseException such
+        as Streamlit stopping its script), a waiter takes over the call.
+        size(value) gives the entry's bytes, default nbytes(value).
+        """
+        while True:
+            with self._lock:
+                entry = self._entries.get(key)
+                if entry is not None:
+                    self._entries.move_to_end(key)
+                    entry.hits += 1
+                    self.counts['hits'] += 1
+                    return entry.value
+                future = self._inflight.get(key)
+                if future is None:
+                    future = self._inflight[key] = Future()
+                    self.counts['misses'] += 1
+                    break
+                self.counts['waits'] += 1
+            try:
+                return future.result()
+            except BaseException as e:
+                # retry only if the owner was interrupted; its failures, and
+                # anything raised in this thread while waiting, propagate
+                if (future.done() and e is future.exception()
+                        and not isinstance(e, Exception)):
+                    continue
+                raise
+        try:
+            t = time.perf_counter()
+            with stage(f'shared.{key[0]}'):
+                value = compute()
+            seconds = time.perf_counter() - t
+            self._store(key, value, size(value) if size else nbytes(value), seconds)
+        except BaseException as e:
+            with self._lock:
+                del self._inflight[key]
+            future.set_exception(e)
+            raise
+        with self._lock:
+            del self._inflight[key]
+        future.set_result(value)
+        return value
+
+    def put(self, key, value, size=None):
+        """Store value under key (replacing any entry) and return it."""
+        self._store(key, value, size if size is not None else nbytes(value), 0.0)
+        return value
+
+    def _store(self, key, value, size, seconds):
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old.nbytes
+            if size > self.max_bytes:
+                # larger than the whole budget: hand it back uncached
+                self.counts['oversize'] += 1
+                return
+            self._entries[key] = _Entry(value, size, seconds)
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= evicted.nbytes
+                self.counts['evictions'] += 1
+
+    def discard(self, match):
+        """Drop every entry whose key satisfies match(key); returns how many."""
+        with self._lock:
+            keys = [k for k in self._entries if match(k)]
+            for k in keys:
+                self._bytes -= self._entries.pop(k).nbytes
+        return len(keys)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        """One row per entry (most recently used last) plus the counters."""
+        with self._lock:
+            now = time.time()
+            rows = [{'namespace': k[0], 'key': ', '.join(str(p)[:16] for p in k[1:]),
+                     'mb': e.nbytes / 2 ** 20, 'build_s': e.seconds, 'hits': e.hits,
+                     'age_s': now - e.created}
+                    for k, e in self._entries.items()]
+            counts = dict(self.counts, entries=len(self._entries), bytes=self._bytes,
+                          max_bytes=self.max_bytes, inflight=len(self._inflight))
+        return pd.DataFrame(rows, columns=['namespace', 'key', 'mb', 'build_s',
+                                           'hits', 'age_s']), counts
+
+
+SHARED = SharedCache()
+
+
+def shared(namespace, cache=None):
+    """Decorator memoizing a function in the shared cache.
+
+    The key is (namespace, arguments); as with st.cache_resource, arguments
+    whose parameter name starts with '_' are not part of the key, and the
+    objects passed for them are not charged to the entry's size.
+    """
+    def wrap(fn):
+        sig = inspect.signature(fn)
+
+        @functools.wraps(fn)
+        def cached(*args, **kwargs):
+            bound = sig.bind(*args, **kwargs)
+            bound.apply_defaults()
+            key = (namespace,) + tuple(v for name, v in bound.arguments.items()
+                                       if not name.startswith('_'))
+            inputs = [id(v) for name, v in bound.arguments.items() if name.startswith('_')]
+            return (cache if cache is not None else SHARED).get_or_compute(
+                key, lambda: fn(*args, **kwargs), size=lambda v: nbytes(v, inputs))
+        return cached
+    return wrap
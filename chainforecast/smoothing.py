@@ -0,0 +1,90 @@
+# Vectorized seasonal exponential smoothing, the fallback for SARIMAX.
+#
+# Many weekly series are smoothed together: they are right-aligned in one
+# (series x weeks) matrix and the level/seasonal recursions advance every
+# series one week per numpy step, so fitting thousands of products costs
+# about as much as one SARIMAX fit. Series shorter than two seasons get a
+# seasonal-naive forecast (their last season repeated), and series shorter
+# than one season a flat forecast at their mean.
+
+import pickle
+
+import numpy as np
+
+ALPHA = 0.3    # level smoothing
+GAMMA = 0.2    # seasonal smoothing
+
+
+class SeasonalSmoothing:
+    """Fitted additive level + seasonal smoothing of one series."""
+
+    backend = 'smoothing'
+
+    def __init__(self, level, season, phase, method):
+        self.level = float(level)
+        self.season = np.asarray(season, dtype=float)
+        self.phase = int(phase)     # seasonal slot of the first forecast step
+        self.method = method        # 'smoothing', 'seasonal_naive' or 'mean'
+
+    def forecast(self, steps):
+        slots = (self.phase + np.arange(steps)) % len(self.season)
+        return self.level + self.season[slots]
+
+    def save(self, path, remove_data=False):
+        # same call as SARIMAXResults.save, so the registry stores either
+        with open(path, 'wb') as f:
+            pickle.dump(self, f)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, 'rb') as f:
+            model = pickle.load(f)
+        if not isinstance(model, cls):
+            raise ValueError(f"{path} is not a {cls.__name__}")
+        return model
+
+
+def fit_smoothing(histories, season, alpha=ALPHA, gamma=GAMMA):
+    """One SeasonalSmoothing per history (sequences of weekly values)."""
+    season = max(int(season), 1)
+    n = len(histories)
+    lengths = np.array([len(h) for h in histories], dtype=np.int64)
+    width = int(lengths.max()) if n else 0
+    Y = np.full((n, width), np.nan)
+    for i, h in enumerate(histories):
+        if lengths[i]:
+            Y[i, width - lengths[i]:] = np.asarray(h, dtype=float)
+
+    # start from each series' first season: its mean and the deviations
+    level = np.zeros(n)
+    S = np.zeros((n, season))
+    for i, h in enumerate(histories):
+        if lengths[i] >= season:
+            head = np.asarray(h[:season], dtype=float)
+            level[i] = head.mean()
+            S[i] = head - level[i]
+    first = width - lengths
+    rows = np.arange(n)
+    for t in range(width):
+        live = t >= first + season
+        if not live.any():
+            continue
+        y = np.where(live, Y[:, t], 0.0)
+        slot = (t - first) % season
+        s = S[rows, slot]
+        new_level = alpha * (y - s) + (1 - alpha) * level
+        S[rows[live], slot[live]] = (gamma * (y - new_level) + (1 - gamma) * s)[live]
+        level = np.where(live, new_level, level)
+
+    models = []
+    for i, h in enumerate(histories):
+        h = np.asarray(h, dtype=float)
+        k = lengths[i]
+        if k >= 2 * season:
+            # S is indexed by position within the season from the series start
+            models.append(SeasonalSmoothing(level[i], S[i], k % season, 'smoothing'))
+        elif k >= season:
+            models.append(SeasonalSmoothing(0.0, h[-season:], 0, 'seasonal_naive'))
+        else:
+            models.append(SeasonalSmoothing(h.mean() if k else 0.0, [0.0], 0, 'mean'))
+    return models
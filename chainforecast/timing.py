@@ -0,0 +1,48 @@
+# Wall-clock phase timing for app runs.
+#
+# A run of app.py is split into import, hash, ingest, clean and render
+# phases so a cold start can be compared against the last one when an
+# import or ingest change makes it slower. Phases are charged by laps:
+# each lap bills the time since the previous lap to one phase.
+
+import time
+
+import pandas as pd
+
+PHASES = ('import', 'hash', 'ingest', 'clean', 'render')
+
+
+class PhaseTimer:
+    """Seconds per phase, accumulated lap by lap from a start time."""
+
+    def __init__(self, start=None):
+        self.start = start if start is not None else time.perf_counter()
+        self._last = self.start
+        self.seconds = dict.fromkeys(PHASES, 0.0)
+
+    def add(self, phase, seconds):
+        self.seconds[phase] = self.seconds.get(phase, 0.0) + seconds
+
+    def lap(self, phase):
+        """Charge the time since the previous lap to phase."""
+        now = time.perf_counter()
+        self.add(phase, now - self._last)
+        self._last = now
+
+    def split(self, phase, parts):
+        """Re-bill seconds already (or about to be) charged to phase to
+        other phases, e.g. the clean share of an ingest."""
+        for name, seconds in parts.items():
+            self.add(name, seconds)
+            self.add(phase, -seconds)
+
+    @property
+    def total(self):
+        return sum(self.seconds.values())
+
+    def report(self):
+        """Frame of phase, seconds and share of the total."""
+        out = pd.DataFrame({'phase': list(self.seconds),
+                            'seconds': [round(s, 3) for s in self.seconds.values()]})
+        out['share'] = (out['seconds'] / max(self.total, 1e-9)).round(3)
+        return out
@@ -0,0 +1,24 @@
+# Shared fixtures: small seeded synthetic datasets (benchmarks/synthetic.py)
+# in the raw export layout and as the cleaned compact frame the app uses.
+
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'benchmarks'))
+
+from synthetic import cleaned_frame, raw_frame  # noqa: E402
+
+ROWS = 20_000
+
+
+@pytest.fixture(scope='session')
+def raw():
+    return raw_frame(ROWS, seed=7)
+
+
+@pytest.fixture(scope='session')
+def df():
+    """Cleaned compact frame; tests must not modify it."""
+    return cleaned_frame(ROWS, seed=7)
@@ -0,0 +1,72 @@
+# Chart downsampling: LTTB against the reference algorithm (Steinarsson,
+# "Downsampling Time Series for Visual Representation"), min/max buckets
+# and the multi-column merge in downsample().
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from chainforecast.charts import downsample, lttb_indices, minmax_indices
+
+
+def reference_lttb(x, y, n_out):
+    # the published loop, with integer bucket boundaries
+    n = len(x)
+    kept = [0]
+    a = 0
+    for i in range(n_out - 2):
+        lo = i * (n - 2) // (n_out - 2) + 1
+        hi = (i + 1) * (n - 2) // (n_out - 2) + 1
+        nxt = min((i + 2) * (n - 2) // (n_out - 2) + 1, n)
+        cx, cy = sum(x[hi:nxt]) / (nxt - hi), sum(y[hi:nxt]) / (nxt - hi)
+        best, best_area = lo, -1.0
+        for j in range(lo, hi):
+            area = abs((x[a] - cx) * (y[j] - y[a]) - (x[a] - x[j]) * (cy - y[a]))
+            if area > best_area:
+                best, best_area = j, area
+        kept.append(best)
+        a = best
+    kept.append(n - 1)
+    return kept
+
+
+@pytest.mark.parametrize('n,n_out', [(100, 10), (1_000, 37), (5_003, 500), (50, 49)])
+def test_lttb_matches_reference(n, n_out):
+    rng = np.random.default_rng(n)
+    x = np.sort(rng.uniform(0, 1_000, n))
+    y = np.cumsum(rng.normal(0, 1, n))
+    assert lttb_indices(x, y, n_out).tolist() == reference_lttb(x.tolist(), y.tolist(), n_out)
+
+
+def test_lttb_short_series_kept_whole():
+    assert lttb_indices(np.arange(5.0), np.arange(5.0), 10).tolist() == list(range(5))
+
+
+def test_minmax_keeps_every_bucket_extreme():
+    rng = np.random.default_rng(1)
+    y = rng.normal(0, 1, 10_000)
+    y[1234], y[8765] = 50.0, -50.0
+    kept = minmax_indices(y, 200)
+    assert {0, 9_999, 1234, 8765} <= set(kept.tolist())
+    assert len(kept) <= 202 and (np.diff(kept) > 0).all()
+    buckets = np.arange(len(y)) * 100 // len(y)
+    for b in range(100):
+        rows = np.flatnonzero(buckets == b)
+        assert rows[np.argmax(y[rows])] in kept and rows[np.argmin(y[rows])] in kept
+
+
+def test_downsample_keeps_short_columns_whole():
+    n = 20_000
+    frame = pd.DataFrame({'ds': pd.date_range('2000-01-03', periods=n, freq='D'),
+                          'history': np.sin(np.arange(n) / 50.0),
+                          'forecast': np.nan})
+    frame.loc[n - 30:, 'forecast'] = np.arange(30.0)
+    small = downsample(frame, 'ds', ['history', 'forecast'], max_points=500)
+    assert len(small) <= 500 + 3
+    assert small['forecast'].notna().sum() == 30
+    assert small['ds'].is_monotonic_increasing
+    assert small['ds'].iloc[0] == frame['ds'].iloc[0]
+    head = frame.head(100)
+    assert downsample(head, 'ds', 'history', max_points=500) is head
+    with pytest.raises(ValueError):
+        downsample(frame, 'ds', 'history', method='mean')
@@ -0,0 +1,95 @@
+# WeeklyCube against the frame-based paths it replaces:
+# prepare_weekly_series over the Forecasting tab's row mask, and
+# batch.weekly_panel's groupby.
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from chainforecast.batch import weekly_panel
+from chainforecast.cube import WeeklyCube
+from chainforecast.forecasting import prepare_weekly_series
+from chainforecast.products import ProductIndex
+
+
+@pytest.fixture(scope='module')
+def cube(df):
+    return WeeklyCube.from_frame(df)
+
+
+def mask(df, query):
+    # the Forecasting tab's original row selection
+    return ((df['stockcode'].astype(str) == query)
+            | df['description'].astype(str).str.contains(query, case=False, regex=False))
+
+
+def assert_series_equal(got, expected):
+    assert list(got['ds']) == list(pd.to_datetime(expected['ds']))
+    np.testing.assert_allclose(got['y'], expected['y'], rtol=1e-5, atol=1e-3)
+
+
+@pytest.mark.parametrize('query', ['85002', '85009A', 'heart', 'LANTERN HOLDER', 'mug'])
+def test_series_matches_prepare_weekly_series(df, cube, query):
+    ids = cube.match(query, ProductIndex(df))
+    assert len(ids)
+    assert_series_equal(cube.series(ids), prepare_weekly_series(df[mask(df, query)]))
+
+
+def test_match_equals_row_mask(df, cube):
+    index = ProductIndex(df)
+    for query in ['85002', 'heart', 'zz', 'nothing like this', 'ca']:
+        ids = cube.match(query, index)
+        codes = {cube.products[i][0] for i in ids}
+        assert codes == set(df.loc[mask(df, query), 'stockcode'].astype(str))
+
+
+def test_customer_series(df, cube):
+    customer = df['customerid'].dropna().iloc[100]
+    expected = prepare_weekly_series(df[df['customerid'] == customer])
+    assert_series_equal(cube.customer_series(str(customer)), expected)
+
+
+def test_panel_matches_weekly_panel(df, cube):
+    products = df['stockcode'].astype(str).value_counts().index[:20].tolist()
+    got, got_rows = cube.panel(products)
+    expected, expected_rows = weekly_panel(df, products)
+    got = got.sort_values(['product', 'ds']).reset_index(drop=True)
+    expected = expected.sort_values(['product', 'ds']).reset_index(drop=True)
+    assert list(got['product']) == list(expected['product'])
+    assert list(got['ds']) == list(pd.to_datetime(expected['ds']))
+    np.testing.assert_allclose(got['y'], expected['y'], rtol=1e-5, atol=1e-3)
+    assert got_rows.sort_index().to_dict() == expected_rows.sort_index().to_dict()
+
+
+def test_chunked_and_out_of_order_builds_agree(df, cube):
+    chunked = WeeklyCube('stockcode')
+    for part in np.array_split(np.arange(len(df)), 17):
+        chunked.add(df.iloc[part])
+    # a later block that reaches back before the first week
+    late = df['invoicedate'] >= '2011-06-01'
+    reordered = WeeklyCube('stockcode').add(df[late])
+    reordered.product
+    reordered.add(df[~late])
+    for other in (chunked, reordered):
+        assert (other.w0, other.n_weeks) == (cube.w0, cube.n_weeks)
+        for m in ('sales', 'quantity', 'rows'):
+            for axis in ('product', 'customer'):
+                a, b = getattr(cube, axis)[m], getattr(other, axis)[m]
+                order_a = {label: i for i, label in enumerate(getattr(cube, axis + 's'))}
+                rows = [order_a[label] for label in getattr(other, axis + 's')]
+                assert abs(a[rows] - b).max() < 1e-6
+
+
+def test_save_load_round_trip(tmp_path, df, cube):
+    path = str(tmp_path / 'cube.npz')
+    cube.save(path)
+    loaded = WeeklyCube.load(path)
+    assert loaded.products == cube.products and loaded.customers == cube.customers
+    for m in ('sales', 'quantity', 'rows'):
+        assert abs(loaded.product[m] - cube.product[m]).max() == 0
+    # appending to a loaded cube matches building from everything
+    extra = df.tail(500).assign(invoicedate=lambda d: d['invoicedate'] + pd.Timedelta(days=60))
+    loaded.add(extra)
+    whole = WeeklyCube.from_frame(pd.concat([df, extra], ignore_index=True))
+    assert loaded.n_weeks == whole.n_weeks
+    assert abs(loaded.product['sales'] - whole.product['sales']).max() < 1e-3
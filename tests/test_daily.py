@@ -0,0 +1,102 @@
+# DailySales windows against a plain pandas groupby over the rows whose
+# invoice day falls in the window.
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from chainforecast.daily import DailySales
+
+
+@pytest.fixture(scope='module')
+def daily(df):
+    return DailySales.from_frame(df)
+
+
+def expected(df, first=None, last=None, country=None, measure='sales'):
+    # per-product totals over the inclusive day range [first, last]
+    day = df['invoicedate'].dt.normalize()
+    keep = pd.Series(True, index=df.index)
+    if first is not None:
+        keep &= day >= pd.Timestamp(first)
+    if last is not None:
+        keep &= day <= pd.Timestamp(last)
+    if country is not None:
+        keep &= df['country'].astype(str) == country
+    rows = df[keep]
+    by = rows.groupby(rows['stockcode'].astype(str))
+    totals = by.size() if measure == 'rows' else by[measure].sum()
+    return totals.astype(float).sort_index()
+
+
+def as_series(daily, ids, values):
+    labels = np.array(daily._products.labels, dtype=object)
+    return pd.Series(values, index=labels[ids].astype(str)).sort_index()
+
+
+def check(daily, want, **query):
+    got = as_series(daily, *daily.totals(**query))
+    assert list(got.index) == list(want.index)
+    np.testing.assert_allclose(got, want, rtol=1e-5, atol=1e-3)
+    top = daily.top(k=0, **query)
+    measure = query.get('measure', 'sales')
+    assert np.all(np.diff(top[measure].to_numpy()) <= 0)
+    top = top.set_index(top['stockcode'].astype(str))[measure].sort_index()
+    np.testing.assert_allclose(top, want,
+                               rtol=1e-5, atol=1e-3)
+
+
+def last_day(df):
+    return df['invoicedate'].max().normalize()
+
+
+@pytest.mark.parametrize('days', [0, 1, 7, 30, 10_000])
+@pytest.mark.parametrize('measure', ['sales', 'quantity', 'rows'])
+def test_days(df, daily, days, measure):
+    last = last_day(df)
+    check(daily, expected(df, last - pd.Timedelta(days=days), measure=measure),
+          days=days, measure=measure)
+
+
+@pytest.mark.parametrize('country', [None, 'United Kingdom', 'France', 'Nowhere'])
+def test_start_end_and_country(df, daily, country):
+    start, end = '2011-03-01', '2011-05-31'
+    check(daily, expected(df, start, end, country), start=start, end=end, country=country)
+    check(daily, expected(df, last_day(df) - pd.Timedelta(days=14), country=country),
+          days=14, country=country)
+    check(daily, expected(df, country=country), country=country)
+
+
+def test_end_day_is_inclusive(df, daily):
+    # rows late in the afternoon of the end date are in the window
+    late = df.loc[df['invoicedate'].dt.hour >= 12, 'invoicedate'].iloc[len(df) // 3]
+    day = late.normalize()
+    want = expected(df, day, day)
+    assert len(want)
+    check(daily, want, start=day, end=day)
+    check(daily, expected(df, None, day), end=day.date())
+    # the day after the last invoice adds nothing
+    check(daily, expected(df), end=last_day(df) + pd.Timedelta(days=1))
+
+
+@pytest.mark.parametrize('start,end', [('2011-06-10', '2011-06-01'),
+                                       ('2013-01-01', '2013-02-01'),
+                                       ('2001-01-01', '2001-12-31')])
+def test_empty_range(daily, start, end):
+    ids, values = daily.totals(start=start, end=end)
+    assert len(ids) == len(values) == 0
+    assert daily.top(5, start=start, end=end).empty
+
+
+def test_top_k(df, daily):
+    want = expected(df, '2011-09-01', '2011-11-30').sort_values(ascending=False)
+    top = daily.top(10, start='2011-09-01', end='2011-11-30')
+    assert list(top.columns) == ['stockcode', 'sales']
+    np.testing.assert_allclose(top['sales'], want.iloc[:10], rtol=1e-5)
+
+
+def test_empty():
+    daily = DailySales()
+    assert daily.window() == daily.window(days=7) == (0, 0)
+    assert daily.top(5).empty and daily.top(5, days=7).empty
+    assert daily.countries == []
@@ -0,0 +1,89 @@
+# Ingest and append with id columns parsed as numbers, and cache eviction.
+#
+# A file without "C" credit notes has an all-numeric InvoiceNo, so pandas
+# reads it as int64; Excel hands back int invoice numbers, and a delta saved
+# by another tool may carry them as floats (536365.0).
+
+import os
+
+import pandas as pd
+import pytest
+
+from chainforecast.ingest import DatasetCache, append_delta, ingest, load_dataset
+from chainforecast.integrity import compute_hash_file
+from synthetic import raw_frame
+
+
+def ingested(tmp_path, path, chunksize=1_000):
+    cache = DatasetCache(str(tmp_path / 'cache'))
+    meta = ingest(os.path.basename(path), path, cache,
+                  file_hash=compute_hash_file(path), chunksize=chunksize, jobs=1)
+    return cache, meta
+
+
+def appended(cache, base_hash, path):
+    meta, _ = append_delta(os.path.basename(path), path, cache, base_hash,
+                           delta_hash=compute_hash_file(path), jobs=1)
+    return meta['chain'][-1]
+
+
+@pytest.fixture(scope='module')
+def credit_free():
+    return raw_frame(2_000, seed=1, credit_rate=0)
+
+
+def test_credit_free_csv(tmp_path, credit_free):
+    path = str(tmp_path / 'credit_free.csv')
+    credit_free.to_csv(path, index=False)
+    cache, meta = ingested(tmp_path, path)
+    assert meta['rows'] == len(credit_free)
+    stored = cache.get(meta['file_hash'])
+    assert stored['invoiceno'].astype(str).str.fullmatch(r'\d+').all()
+
+
+def test_int_invoice_xlsx(tmp_path, credit_free):
+    path = str(tmp_path / 'int_invoices.xlsx')
+    credit_free.head(500).assign(InvoiceNo=lambda d: d['InvoiceNo'].astype(int)) \
+        .to_excel(path, index=False)
+    _, meta = ingested(tmp_path, path)
+    assert meta['rows'] == 500
+
+
+def test_credit_free_chunks_after_credit_notes(tmp_path):
+    path = str(tmp_path / 'mixed.csv')
+    raw_frame(2_000, seed=2, credit_rate=0.05).to_csv(path, index=False)
+    _, small = ingested(tmp_path / 'small', path, chunksize=100)
+    _, whole = ingested(tmp_path / 'whole', path, chunksize=10_000)
+    assert small['rows'] == whole['rows'] > 0
+    assert small['merkle_root'] == whole['merkle_root']
+
+
+@pytest.mark.parametrize('dtype', [int, float])
+def test_numeric_delta_dedupes_stored_lines(tmp_path, credit_free, dtype):
+    path = str(tmp_path / 'credit_free.csv')
+    credit_free.to_csv(path, index=False)
+    cache, meta = ingested(tmp_path, path)
+    # a one-day delta: 50 lines already stored, 50 new ones
+    new = raw_frame(50, seed=3, credit_rate=0)
+    new['InvoiceNo'] = new['InvoiceNo'].astype(int) + 10 ** 7
+    delta = pd.concat([credit_free.tail(50), new], ignore_index=True)
+    delta['InvoiceNo'] = delta['InvoiceNo'].astype(int).astype(dtype)
+    delta_path = str(tmp_path / 'delta.csv')
+    delta.to_csv(delta_path, index=False)
+    entry = appended(cache, meta['file_hash'], delta_path)
+    assert entry['duplicates'] == 50
+    assert entry['rows'] == 50
+
+
+def test_commit_keeps_dataset_larger_than_the_cache(tmp_path, credit_free):
+    path = str(tmp_path / 'a.csv')
+    credit_free.to_csv(path, index=False)
+    cache = DatasetCache(str(tmp_path / 'cache'), max_bytes=1_000)
+    df, meta = load_dataset('a.csv', path, cache, jobs=1)
+    assert len(df) == len(credit_free) and meta['file_hash'] in cache
+
+    other = str(tmp_path / 'b.csv')
+    raw_frame(300, seed=5).to_csv(other, index=False)
+    _, meta_b = load_dataset('b.csv', other, cache, jobs=1)
+    assert meta_b['file_hash'] in cache
+    assert meta['file_hash'] not in cache
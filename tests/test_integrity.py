@@ -0,0 +1,98 @@
+# MerkleTree against the legacy merkle_root_from_ids, and its incremental,
+# parallel and proof paths against one another.
+
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pytest
+
+from chainforecast.ingest import _storable
+from chainforecast.integrity import (
+    DIGEST, MerkleTree, invoice_proof, merkle_root_from_ids, row_leaf_hashes)
+
+
+def id_leaves(n):
+    return b''.join(hashlib.sha256(str(i).encode()).digest() for i in range(n))
+
+
+@pytest.mark.parametrize('n', [1, 2, 3, 5, 8, 13, 100, 1025])
+def test_root_matches_legacy(n):
+    assert MerkleTree(id_leaves(n)).root() == merkle_root_from_ids(range(n))
+
+
+def test_empty_tree():
+    assert MerkleTree().root() is None and merkle_root_from_ids([]) is None
+
+
+@pytest.mark.parametrize('n', [1, 7, 64, 1000])
+def test_extend_matches_one_shot_build(n):
+    leaves = id_leaves(n)
+    for step in (1, 3, 17, 250):
+        tree = MerkleTree()
+        for i in range(0, n, step):
+            tree.extend(leaves[i * DIGEST:(i + step) * DIGEST])
+        assert tree.root() == MerkleTree(leaves).root()
+        assert tree.levels == MerkleTree(leaves).levels
+
+
+@pytest.mark.parametrize('n', [5, 64, 65, 1000])
+def test_parallel_build_matches_serial(n):
+    leaves = id_leaves(n)
+    with ThreadPoolExecutor(4) as ex:
+        parallel = MerkleTree.build(leaves, ex, block_leaves=16)
+    serial = MerkleTree(leaves)
+    assert parallel.root() == serial.root()
+    assert parallel.levels == serial.levels
+
+
+def test_every_proof_verifies_and_a_wrong_leaf_does_not():
+    tree = MerkleTree(id_leaves(37))
+    root = tree.root()
+    for i in range(37):
+        assert MerkleTree.verify_proof(tree.leaf(i).hex(), tree.proof(i), root)
+    assert not MerkleTree.verify_proof(tree.leaf(1).hex(), tree.proof(2), root)
+    with pytest.raises(IndexError):
+        tree.proof(37)
+
+
+def test_leaves_do_not_depend_on_the_frame_layout(df):
+    # the compact frame and the table written to the store hash alike
+    head = df.head(2_000)
+    raw = head.astype({c: object for c in ['invoiceno', 'stockcode', 'description',
+                                           'country']})
+    stored = pa.Table.from_pandas(_storable(raw), preserve_index=False)
+    assert row_leaf_hashes(head) == row_leaf_hashes(stored)
+    with ThreadPoolExecutor(2) as ex:
+        assert row_leaf_hashes(head, ex, batch_rows=300) == row_leaf_hashes(head)
+
+
+def test_invoice_proof_recomputes_leaves(df):
+    tree = MerkleTree(row_leaf_hashes(df))
+    invoiceno = str(df['invoiceno'].iloc[1_000])
+    proof = invoice_proof(tree, df, invoiceno)
+    expected = np.flatnonzero((df['invoiceno'].astype(str) == invoiceno).to_numpy())
+    assert [r['row'] for r in proof['rows']] == expected.tolist()
+    assert proof['verified'] and all(r['match'] for r in proof['rows'])
+
+    edited = df.copy()
+    edited.loc[expected[0], 'quantity'] += 1
+    proof = invoice_proof(tree, edited, invoiceno)
+    assert not proof['verified']
+    assert [r['match'] for r in proof['rows']] == [False] + [True] * (len(expected) - 1)
+
+    assert invoice_proof(tree, df, 'no such invoice')['rows'] == []
+    # a non-categorical column takes the string path
+    plain = df.assign(invoiceno=df['invoiceno'].astype(str))
+    assert invoice_proof(tree, plain, invoiceno)['verified']
+
+
+def test_changing_a_row_changes_the_root(df):
+    head = df.head(500)
+    edited = head.copy()
+    edited.loc[250, 'price'] = np.float32(edited.loc[250, 'price'] + 0.01)
+    assert (MerkleTree(row_leaf_hashes(head)).root()
+            != MerkleTree(row_leaf_hashes(edited)).root())
+    assert row_leaf_hashes(pd.DataFrame(columns=df.columns)) == b''
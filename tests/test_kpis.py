@@ -0,0 +1,69 @@
+# Single-pass KPIs against the dashboard's original per-row formulas, and
+# cohort retention against a plain pandas cohort table.
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from chainforecast.kpis import cohort_retention, compute_kpis, order_table
+
+
+def baseline_retention(df):
+    # the dashboard's original retention_rate: a merge back onto every row
+    first = df.groupby('customerid')['invoicedate'].min(
+    ).reset_index().rename(columns={'invoicedate': 'first_date'})
+    merged = df.merge(first, on='customerid', how='left')
+    merged['is_repeat'] = pd.to_datetime(
+        merged['invoicedate']) > pd.to_datetime(merged['first_date'])
+    return merged.groupby('customerid')['is_repeat'].any().mean()
+
+
+def baseline_cohorts(df):
+    known = df[df['customerid'].notna()]
+    month = known['invoicedate'].dt.to_period('M')
+    active = pd.DataFrame({'customer': known['customerid'].to_numpy(),
+                           'month': month.to_numpy()}).drop_duplicates()
+    cohort = active.groupby('customer')['month'].transform('min')
+    active['cohort'] = cohort
+    active['since'] = (active['month'] - active['cohort']).apply(lambda d: d.n)
+    last = month.max()
+    span = (last - month.min()).n + 1
+    counts = (active.groupby(['cohort', 'since']).size().unstack(fill_value=0)
+              .reindex(columns=range(span), fill_value=0))
+    share = counts.div(counts[0], axis=0)
+    for c in share.index:
+        share.loc[c, share.columns > (last - c).n] = np.nan
+    return counts[0], share
+
+
+def test_headline_kpis_match_dashboard_formulas(df):
+    kpis, _ = compute_kpis(df)
+    assert kpis['total_sales'] == pytest.approx(float(df['sales'].astype(float).sum()))
+    assert kpis['customers'] == df['customerid'].nunique()
+    assert kpis['orders'] == df['invoiceno'].nunique()
+    assert kpis['repeat_rate'] == pytest.approx(baseline_retention(df))
+
+
+def test_cohort_retention_matches_pandas(df):
+    curves = cohort_retention(order_table(df))
+    sizes, share = baseline_cohorts(df)
+    assert list(curves.index) == list(share.index)
+    assert curves['customers'].tolist() == sizes.tolist()
+    got = curves.drop(columns='customers')
+    assert list(got.columns) == list(share.columns)
+    np.testing.assert_allclose(got.to_numpy(dtype=float), share.to_numpy(dtype=float))
+
+
+def test_every_cohort_starts_at_full_retention(df):
+    curves = cohort_retention(order_table(df))
+    assert (curves[0] == 1.0).all()
+
+
+def test_no_known_customers():
+    frame = pd.DataFrame({'customerid': pd.array([pd.NA, pd.NA], dtype='Int64'),
+                          'invoiceno': ['1', '2'],
+                          'invoicedate': pd.to_datetime(['2011-01-01', '2011-02-01']),
+                          'sales': [1.0, 2.0]})
+    kpis, curves = compute_kpis(frame)
+    assert kpis['total_sales'] == 3.0 and kpis['customers'] == 0 and kpis['orders'] == 2
+    assert curves.empty
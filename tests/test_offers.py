@@ -0,0 +1,75 @@
+# OfferStore: bulk segment upserts, manual coupons kept through them, offer
+# propagation and streamed exports.
+
+import io
+
+import pandas as pd
+import pytest
+
+from chainforecast.offers import COLUMNS, OfferStore, default_offer
+
+
+def segments(n, labels=('Segment_1', 'Segment_2', 'Segment_3')):
+    return pd.DataFrame({'customerid': [str(12346 + i) for i in range(n)],
+                         'segment_label': [labels[i % len(labels)] for i in range(n)]})
+
+
+@pytest.fixture
+def store(tmp_path):
+    return OfferStore(str(tmp_path))
+
+
+def test_apply_segments_gives_every_customer_its_segment_offer(store):
+    store.set_offer('Segment_1', 25, 'VIP25', propagate=False)
+    assert store.apply_segments(segments(1_000), dataset='d1', batch_rows=128) == 1_000
+    assigned = store.lookup_many([str(12346 + i) for i in range(1_000)])
+    assert len(assigned) == 1_000
+    vip = assigned[assigned['segment'] == 'Segment_1']
+    assert (vip['coupon'] == 'VIP25').all() and (vip['discount_pct'] == 25).all()
+    other = store.lookup('12347')
+    assert other['coupon'] == default_offer('Segment_2')['coupon']
+    assert other['dataset'] == 'd1' and other['manual'] == 0
+
+
+def test_manual_coupon_survives_bulk_runs_but_follows_the_segment(store):
+    store.apply_segments(segments(30))
+    store.assign('12346', 40, 'PERSONAL40')
+    # the customer moves to another segment in the next segmentation
+    moved = segments(30, labels=('Segment_2', 'Segment_3', 'Segment_1'))
+    store.apply_segments(moved, dataset='d2')
+    row = store.lookup('12346')
+    assert (row['coupon'], row['discount_pct'], row['manual']) == ('PERSONAL40', 40, 1)
+    assert row['segment'] == 'Segment_2' and row['dataset'] == 'd2'
+
+    store.unassign('12346')
+    store.apply_segments(moved)
+    assert store.lookup('12346')['coupon'] == default_offer('Segment_2')['coupon']
+
+
+def test_set_offer_propagates_except_to_manual_coupons(store):
+    store.apply_segments(segments(9))
+    store.assign('12349', 5, 'MINE5')           # a Segment_1 customer
+    changed = store.set_offer('Segment_1', 30, 'S1_30')
+    assert changed == 2
+    assert store.lookup('12346')['coupon'] == 'S1_30'
+    assert store.lookup('12349')['coupon'] == 'MINE5'
+    assert store.offer('Segment_1') == {'discount_pct': 30, 'coupon': 'S1_30'}
+    assert store.offer('Segment_9') == default_offer('Segment_9')
+
+
+def test_summary_and_exports(store):
+    store.apply_segments(segments(300))
+    store.assign('12346', 40, 'PERSONAL40')
+    summary = store.summary().set_index('segment')
+    assert summary['customers'].to_dict() == {'Segment_1': 100, 'Segment_2': 100,
+                                              'Segment_3': 100}
+    assert summary.loc['Segment_1', 'manual'] == 1
+
+    csv = pd.read_csv(io.BytesIO(store.export('csv', batch_rows=64)), dtype={'customerid': str})
+    parquet = pd.read_parquet(io.BytesIO(store.export('parquet', batch_rows=64)))
+    assert list(csv.columns) == list(parquet.columns) == COLUMNS
+    assert len(csv) == len(parquet) == 300
+    assert list(parquet['customerid']) == sorted(parquet['customerid'])
+    assert csv['customerid'].tolist() == parquet['customerid'].tolist()
+    with pytest.raises(ValueError):
+        store.export('xlsx')
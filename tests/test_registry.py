@@ -0,0 +1,69 @@
+# ModelRegistry: models saved by one registry load in a fresh one (as after
+# a restart) and forecast exactly as the fitted model did.
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from chainforecast.forecasting import (
+    XGB_PARAMS, forecast_sarimax, forecast_xgb, sarimax_params)
+from chainforecast.registry import ModelRegistry, model_key
+from chainforecast.smoothing import SeasonalSmoothing
+
+
+@pytest.fixture(scope='module')
+def weekly():
+    rng = np.random.default_rng(3)
+    weeks = np.arange(60)
+    y = 100 + 2 * weeks + 15 * np.sin(weeks * 2 * np.pi / 5) + rng.normal(0, 3, 60)
+    return pd.DataFrame({'ds': pd.date_range('2011-01-03', periods=60, freq='W-MON'),
+                         'y': y})
+
+
+def test_xgb_round_trip(tmp_path, weekly):
+    model, feat_cols = ModelRegistry(str(tmp_path)).xgb('85002', 'h1', weekly)
+    expected = forecast_xgb(model, weekly, feat_cols, steps=6)
+
+    fresh = ModelRegistry(str(tmp_path))
+    assert fresh.has('85002', 'h1', 'xgb', XGB_PARAMS)
+    loaded, loaded_cols = fresh.xgb('85002', 'h1', weekly)
+    assert loaded_cols == feat_cols
+    np.testing.assert_allclose(forecast_xgb(loaded, weekly, loaded_cols, steps=6), expected,
+                               rtol=1e-6)
+
+
+def test_sarimax_round_trip_and_warm_start(tmp_path, weekly):
+    params = sarimax_params(5)
+    res = ModelRegistry(str(tmp_path)).sarimax('85002', 'h1', weekly, params)
+    expected = forecast_sarimax(res, steps=4)
+
+    fresh = ModelRegistry(str(tmp_path))
+    assert fresh.has('85002', 'h1', 'sarimax', params)
+    loaded = fresh.sarimax('85002', 'h1', weekly, params)
+    np.testing.assert_allclose(forecast_sarimax(loaded, steps=4), expected, rtol=1e-6)
+    # the series grew by two weeks (a new dataset hash): start from the old fit
+    assert fresh.warm_start('85002', params, len(weekly) + 2) is not None
+    assert fresh.warm_start('85002', params, len(weekly) + 100) is None
+
+
+def test_smoothing_fallback_round_trip(tmp_path, weekly):
+    params = sarimax_params(5)
+    model = SeasonalSmoothing(10.0, [1.0, -1.0, 0.5, 0.0, -0.5], 2, 'smoothing')
+    registry = ModelRegistry(str(tmp_path))
+    registry._put_sarimax('85002', 'h1', weekly, params, model,
+                          {'backend': 'smoothing', 'warm': False, 'reason': 'test'})
+    loaded, meta = ModelRegistry(str(tmp_path)).get(model_key('85002', 'h1', 'sarimax', params))
+    assert isinstance(loaded, SeasonalSmoothing) and meta['backend'] == 'smoothing'
+    np.testing.assert_array_equal(loaded.forecast(7), model.forecast(7))
+    # fallbacks leave no warm start behind
+    assert registry.warm_start('85002', params, len(weekly)) is None
+
+
+def test_corrupt_entry_is_refitted(tmp_path, weekly):
+    registry = ModelRegistry(str(tmp_path))
+    registry.xgb('85002', 'h1', weekly)
+    key = model_key('85002', 'h1', 'xgb', XGB_PARAMS)
+    with open(registry._path(key, '.ubj'), 'wb') as f:
+        f.write(b'not a model')
+    fresh = ModelRegistry(str(tmp_path))
+    assert fresh.get(key) is None and key not in fresh
@@ -0,0 +1,107 @@
+# SegmentModel.refresh on appended rows: labels of customers the delta does
+# not touch, and the count-weighted centroid update of partial_fit.
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from chainforecast.analytics import customer_totals
+from chainforecast.segments import SegmentModel
+
+
+@pytest.fixture(scope='module')
+def split(df):
+    # the last month of transactions arrives as a delta
+    cutoff = df['invoicedate'].max() - pd.Timedelta(days=30)
+    early = df['invoicedate'] < cutoff
+    return df[early], df[~early]
+
+
+@pytest.fixture(scope='module')
+def model(split):
+    return SegmentModel.fit(split[0])
+
+
+def touched(model, delta):
+    return customer_totals(delta).index.intersection(model.totals.index)
+
+
+def test_fit_labels_are_nearest_centroids(split, model):
+    X = model._features(model.totals, model.snapshot)
+    np.testing.assert_array_equal(model.assign(X), model.segment)
+
+
+def test_refresh_keeps_untouched_labels(split):
+    # rows from the middle of the data: the snapshot does not move, so
+    # customers outside the delta have the same features and labels
+    base, _ = split
+    order = base.sort_values('invoicedate', kind='stable')['invoiceno']
+    invoices = order.drop_duplicates().iloc[100:160]
+    middle = base['invoiceno'].isin(invoices)
+    old = SegmentModel.fit(base[~middle])
+    new = old.refresh(base[middle])
+    assert new.snapshot == old.snapshot
+    untouched = ~old.totals.index.isin(touched(old, base[middle]))
+    assert untouched.sum() > 0.5 * len(old.totals)
+    np.testing.assert_array_equal(new.segment[:len(old.totals)][untouched],
+                                  old.segment[untouched])
+    np.testing.assert_array_equal(new.centroids, old.centroids)
+    assert new.labels == old.labels
+
+
+@pytest.mark.parametrize('partial_fit', [False, True])
+def test_refresh_appended_rows(split, model, partial_fit):
+    _, delta = split
+    new = model.refresh(delta, partial_fit=partial_fit)
+    n = len(model.totals)
+    # existing customers keep their rows and order; new ones are appended
+    assert list(new.totals.index[:n]) == list(model.totals.index)
+    assert set(new.totals.index) == set(model.totals.index) | set(
+        customer_totals(delta).index)
+    known = delta['customerid'].notna()
+    np.testing.assert_allclose(
+        new.totals['monetary'].astype(float).sum(),
+        model.totals['monetary'].astype(float).sum()
+        + delta.loc[known, 'sales'].astype(float).sum(), rtol=1e-5)
+    assert new.labels == model.labels
+    np.testing.assert_array_equal(new.mean, model.mean)
+    np.testing.assert_array_equal(new.scale, model.scale)
+    X = new._features(new.totals, new.snapshot)
+    np.testing.assert_array_equal(new.segment, new.assign(X))
+    if not partial_fit:
+        np.testing.assert_array_equal(new.centroids, model.centroids)
+
+
+def test_partial_fit_moves_centroids_by_count_weighted_mean(split, model):
+    _, delta = split
+    new = model.refresh(delta, partial_fit=True)
+    ids = customer_totals(delta).index
+    rows = new.totals.index.get_indexer(ids)
+    X = new._features(new.totals.iloc[rows], new.snapshot)
+    nearest = model.assign(X)
+    scaled = (X - model.mean) / model.scale
+    expected = model.centroids.copy()
+    for j in range(len(expected)):
+        n_old = np.sum(model.segment == j)
+        members = scaled[nearest == j]
+        if len(members):
+            expected[j] = (n_old * model.centroids[j] + members.sum(axis=0)) \
+                / (n_old + len(members))
+    np.testing.assert_allclose(new.centroids, expected, rtol=1e-10, atol=1e-12)
+    assert not np.allclose(new.centroids, model.centroids)
+
+
+def test_partial_fit_single_customer_nudges_one_centroid(split, model):
+    # one touched customer moves only its own centroid, by 1/(n + 1) of the gap
+    _, delta = split
+    customer = delta['customerid'].dropna().iloc[0]
+    rows = delta[delta['customerid'] == customer]
+    new = model.refresh(rows, partial_fit=True)
+    i = new.totals.index.get_loc(customer)
+    X = new._features(new.totals.iloc[[i]], new.snapshot)
+    x, j = (X[0] - model.mean) / model.scale, int(model.assign(X)[0])
+    n = np.sum(model.segment == j)
+    others = np.arange(len(model.centroids)) != j
+    np.testing.assert_array_equal(new.centroids[others], model.centroids[others])
+    np.testing.assert_allclose(new.centroids[j] - model.centroids[j],
+                               (x - model.centroids[j]) / (n + 1), rtol=1e-10)
@@ -0,0 +1,158 @@
+# SharedCache: single-flight under concurrent callers, failure and
+# interruption handling, and the byte-bounded LRU.
+
+import threading
+import time
+
+import numpy as np
+import pytest
+
+from chainforecast.shared import SharedCache, nbytes, shared
+
+THREADS = 8
+
+
+class Interrupted(BaseException):
+    """Stands in for Streamlit stopping a session's script."""
+
+
+def run_together(n, fn):
+    """Call fn(i) from n threads released at once; (results, errors)."""
+    barrier = threading.Barrier(n)
+    results, errors = [None] * n, [None] * n
+
+    def worker(i):
+        barrier.wait()
+        try:
+            results[i] = fn(i)
+        except BaseException as e:
+            errors[i] = e
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(n)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join(10)
+    return results, errors
+
+
+def test_one_computation_per_key():
+    cache = SharedCache()
+    calls = []
+
+    def compute(key):
+        calls.append(key)
+        time.sleep(0.1)
+        return np.arange(3) + len(key)
+
+    results, errors = run_together(
+        THREADS, lambda i: cache.get_or_compute(('k', i % 2), lambda: compute(('k', i % 2))))
+    assert errors == [None] * THREADS
+    assert sorted(calls) == [('k', 0), ('k', 1)]
+    # everyone asking for a key gets the one computed object
+    for i in range(THREADS):
+        assert results[i] is results[i % 2]
+    assert cache.counts['misses'] == 2
+    assert cache.counts['waits'] + cache.counts['hits'] == THREADS - 2
+
+
+def test_owner_exception_reaches_waiters_and_is_not_cached():
+    cache = SharedCache()
+    calls = []
+
+    def failing():
+        calls.append(1)
+        time.sleep(0.1)
+        raise ValueError('bad input')
+
+    _, errors = run_together(THREADS, lambda i: cache.get_or_compute(('k',), failing))
+    assert len(calls) == 1
+    assert all(isinstance(e, ValueError) for e in errors)
+    assert ('k',) not in cache
+    assert cache.get_or_compute(('k',), lambda: 42) == 42
+
+
+def test_waiter_takes_over_from_an_interrupted_owner():
+    cache = SharedCache()
+    started = threading.Event()
+    calls = []
+
+    def owner():
+        calls.append('owner')
+        started.set()
+        time.sleep(0.1)
+        raise Interrupted()
+
+    def waiter():
+        calls.append('waiter')
+        return 'done'
+
+    errors = []
+
+    def run_owner():
+        try:
+            cache.get_or_compute(('k',), owner)
+        except BaseException as e:
+            errors.append(e)
+
+    t = threading.Thread(target=run_owner)
+    t.start()
+    started.wait(5)
+    assert cache.get_or_compute(('k',), waiter) == 'done'
+    t.join(5)
+    assert calls == ['owner', 'waiter']
+    assert len(errors) == 1 and isinstance(errors[0], Interrupted)
+    assert cache.get(('k',)) == 'done'
+
+
+def test_eviction_respects_max_bytes():
+    cache = SharedCache(max_bytes=1_000)
+    for i in range(5):
+        cache.put(('k', i), i, size=300)
+        assert cache.nbytes <= cache.max_bytes
+    assert [k for k in [('k', i) for i in range(5)] if k in cache] == [('k', 2), ('k', 3),
+                                                                      ('k', 4)]
+    # a hit makes an entry the most recently used
+    cache.get(('k', 2))
+    cache.put(('k', 5), 5, size=300)
+    assert ('k', 2) in cache and ('k', 3) not in cache
+    assert cache.counts['evictions'] == 3
+
+    # larger than the whole budget: returned, not cached, nothing evicted
+    assert cache.get_or_compute(('big',), lambda: 'x', size=lambda v: 5_000) == 'x'
+    assert ('big',) not in cache and len(cache) == 3 and cache.counts['oversize'] == 1
+
+
+def test_eviction_under_concurrent_computations():
+    cache = SharedCache(max_bytes=10 * 8_000)
+    run_together(THREADS, lambda i: [cache.get_or_compute(('a', i, j), lambda: np.zeros(1_000))
+                                     for j in range(10)])
+    assert cache.nbytes <= cache.max_bytes
+    assert cache.nbytes == sum(nbytes(cache.get(k)) for k in list(cache._entries))
+    table, counts = cache.stats()
+    assert counts['entries'] == len(table) == len(cache) and counts['inflight'] == 0
+
+
+def test_shared_decorator_keys_and_sizes():
+    cache = SharedCache()
+    calls = []
+    big = np.zeros(100_000)
+
+    @shared('stat', cache=cache)
+    def stat(file_hash, _frame, scale=1):
+        calls.append(file_hash)
+        return _frame[:10] * scale
+
+    assert stat('h1', big).sum() == 0
+    assert stat('h1', np.ones(5)) is stat('h1', big)      # _frame is not in the key
+    stat('h1', big, scale=2)
+    stat('h2', big)
+    assert calls == ['h1', 'h1', 'h2']
+    # the input passed as _frame is not charged to the entry
+    assert cache.nbytes < big.nbytes
+
+
+@pytest.mark.parametrize('value,at_least', [(np.zeros(1_000), 8_000), ('x' * 500, 500),
+                                            ({'a': np.zeros(100)}, 800)])
+def test_nbytes(value, at_least):
+    assert nbytes(value) >= at_least
@@ -0,0 +1,78 @@
+# Vectorized seasonal smoothing against a one-series-at-a-time reference,
+# and the SARIMAX fallback that uses it.
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from chainforecast.forecasting import fit_sarimax, fit_sarimax_many, sarimax_params
+from chainforecast.smoothing import ALPHA, GAMMA, SeasonalSmoothing, fit_smoothing
+
+
+def reference(h, season, steps, alpha=ALPHA, gamma=GAMMA):
+    # the textbook additive recursion, one series and one week at a time
+    h = np.asarray(h, dtype=float)
+    if len(h) < season:
+        return np.full(steps, h.mean() if len(h) else 0.0)
+    if len(h) < 2 * season:
+        return np.resize(h[-season:], steps)
+    level = h[:season].mean()
+    S = h[:season] - level
+    for t in range(season, len(h)):
+        slot = t % season
+        new_level = alpha * (h[t] - S[slot]) + (1 - alpha) * level
+        S[slot] = gamma * (h[t] - new_level) + (1 - gamma) * S[slot]
+        level = new_level
+    return level + S[(len(h) + np.arange(steps)) % season]
+
+
+def test_matches_reference_on_ragged_histories():
+    rng = np.random.default_rng(0)
+    histories = [rng.gamma(2.0, 50.0, n) for n in (0, 1, 4, 5, 7, 10, 11, 23, 52, 53)]
+    models = fit_smoothing(histories, season=5)
+    assert [m.method for m in models] == (['mean'] * 3 + ['seasonal_naive'] * 2
+                                          + ['smoothing'] * 5)
+    for h, model in zip(histories, models):
+        np.testing.assert_allclose(model.forecast(12), reference(h, 5, 12))
+
+
+def test_seasonal_naive_repeats_the_last_season():
+    model, = fit_smoothing([[1, 2, 3, 4, 5, 6, 7]], season=5)
+    np.testing.assert_array_equal(model.forecast(7), [3, 4, 5, 6, 7, 3, 4])
+
+
+def weekly(n, seed=1):
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({'ds': pd.date_range('2011-01-03', periods=n, freq='W-MON'),
+                         'y': 50 + rng.normal(0, 5, n)})
+
+
+def test_sarimax_timeout_falls_back_to_smoothing():
+    w = weekly(40)
+    model, info = fit_sarimax(w, sarimax_params(5), time_budget=1e-9)
+    assert isinstance(model, SeasonalSmoothing)
+    assert info['backend'] == 'smoothing' and 'no fit within' in info['reason']
+    np.testing.assert_allclose(model.forecast(4), reference(w['y'], 5, 4))
+
+
+def test_fit_many_smooths_every_fallback():
+    weeklies = {'a': weekly(40, 2), 'b': weekly(45, 3), 'c': weekly(50, 4)}
+    fits = fit_sarimax_many(weeklies, sarimax_params(5), time_budget=1e-9, jobs=1)
+    for k, w in weeklies.items():
+        assert fits[k][1]['backend'] == 'smoothing'
+        np.testing.assert_allclose(fits[k][0].forecast(4), reference(w['y'], 5, 4))
+
+
+def test_fit_many_keeps_sarimax_fits():
+    fits = fit_sarimax_many({'a': weekly(40, 2)}, sarimax_params(5), time_budget=None)
+    model, info = fits['a']
+    assert info['backend'] in ('sarimax', 'smoothing')
+    if info['backend'] == 'sarimax':
+        assert not isinstance(model, SeasonalSmoothing)
+        assert info['reason'] == '' and not info['warm']
+
+
+@pytest.mark.parametrize('season', [0, 1])
+def test_degenerate_season(season):
+    model, = fit_smoothing([[1.0, 2.0, 3.0]], season)
+    assert np.isfinite(model.forecast(3)).all()